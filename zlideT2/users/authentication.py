@@ -1,8 +1,71 @@
+import copy
+import threading
+import time
+from cachetools import TTLCache
 from django.conf import settings
+from django.core.cache import cache
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .revocation import is_revoked
+
+
+_lock = threading.Lock()
+# raw token -> validated token, skips signature verification for hot tokens
+_token_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
+# (user id, token jti) -> (generation, user), skips the UserAccount query
+_user_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
+
+
+def _generation_key(user_id):
+    return f'auth:user:{user_id}:generation'
+
+
+def invalidate_user(user_id):
+    """
+    Bump the generation of `user_id` in the shared cache, called when the
+    account changes (deactivation, password change, ...). Every process
+    drops its cached copy of the user on its next request.
+    """
+    key = _generation_key(user_id)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
 
 
 class CustomJWTAuthentication(JWTAuthentication):
+    def get_validated_token(self, raw_token):
+        with _lock:
+            validated_token = _token_cache.get(raw_token)
+        if validated_token is None or validated_token.get('exp', 0) <= time.time():
+            validated_token = super().get_validated_token(raw_token)
+            with _lock:
+                _token_cache[raw_token] = validated_token
+
+        # Checked on every request, cached tokens can be revoked at any time
+        if is_revoked(validated_token):
+            raise InvalidToken('Token has been revoked')
+        return validated_token
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        key = (user_id, validated_token.get(api_settings.JTI_CLAIM))
+        # Read before the user is loaded, a change made meanwhile bumps it again
+        generation = cache.get(_generation_key(user_id), 0)
+        with _lock:
+            entry = _user_cache.get(key)
+        if entry is not None and entry[0] == generation:
+            user = entry[1]
+        else:
+            user = super().get_user(validated_token)
+            with _lock:
+                _user_cache[key] = (generation, user)
+        # Every request gets its own copy so per-request attributes never leak between requests
+        return copy.copy(user)
+
     def authenticate(self, request):
         try:
             header = self.get_header(request)
@@ -19,4 +82,4 @@ class CustomJWTAuthentication(JWTAuthentication):
 
             return self.get_user(validated_token), validated_token
         except:
-            return None
\ No newline at end of file
+            return None
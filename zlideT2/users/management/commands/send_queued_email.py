@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from users.outbox import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued emails from the outbox in batches over one SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and poll the outbox every INTERVAL seconds (for a worker process)')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_queued_emails(batch_size=options['batch_size'])
+            if sent or failed or not options['interval']:
+                self.stdout.write(f'Sent {sent} emails, {failed} failed')
+            if not options['interval']:
+                return
+            # Drain the backlog without sleeping, then poll
+            if not sent and not failed:
+                time.sleep(options['interval'])
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.11 on 2026-10-19 13:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_outboundemail'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='useraccount',
+            name='otp',
+        ),
+        migrations.DeleteModel(
+            name='OneTimePassword',
+        ),
+    ]
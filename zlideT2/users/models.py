@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import (
     BaseUserManager,
     AbstractBaseUser,
@@ -10,7 +11,19 @@ from django.contrib.auth import get_user_model
 
 
 
-class UserAccountManager(BaseUserManager):
+class UserAccountQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # QuerySet.update() sends no post_save, so drop the cached users here
+        from .authentication import invalidate_user
+
+        user_ids = list(self.values_list('pk', flat=True))
+        updated = super().update(**kwargs)
+        for user_id in user_ids:
+            invalidate_user(user_id)
+        return updated
+
+
+class UserAccountManager(BaseUserManager.from_queryset(UserAccountQuerySet)):
     def create_user(self, email, username, password=None, **kwargs):
         """
         Creates and saves a User with the given email, username and password.
@@ -56,7 +69,6 @@ class UserAccountManager(BaseUserManager):
 class UserAccount(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(max_length=255, unique=True,)
     username = models.CharField(max_length=255, unique=True)
-    otp = models.CharField(max_length=6, null=True, blank=True)
 
     # groups = models.ManyToManyField(User, related_name='useraccount_groups')  # Added related_name argument
     # groups = models.ManyToManyField(get_user_model(), related_name='useraccount_groups')
@@ -76,9 +88,34 @@ class UserAccount(AbstractBaseUser, PermissionsMixin):
         return self.email
 
 
-class OneTimePassword(models.Model):
-    user = models.OneToOneField(UserAccount, on_delete=models.CASCADE)
-    otp = models.CharField(max_length=6)
+class OutboundEmail(models.Model):
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - otp code"
\ No newline at end of file
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
@@ -0,0 +1,144 @@
+import hashlib
+import hmac
+import math
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from .utils import generate_otp
+
+
+LOGIN = 'login'
+ACTIVATE = 'activate'
+
+# Cache backends each process keeps to itself
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+LOCK_TIMEOUT = 5 # Seconds before the lock of a crashed worker expires
+LOCK_WAIT = 1
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Too many requests, retry in {retry_after} seconds.')
+        self.retry_after = retry_after
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Codes and rate limits must be seen by every worker: a code issued by one
+    gunicorn worker has to verify on another. Run by `manage.py check
+    --deploy`, which the web process runs before it starts.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend in PER_PROCESS_CACHES:
+        return [checks.Error(
+            f'One-time passwords need a cache shared by every worker, not {backend}.',
+            hint='Set REDIS_URL (or CACHE_DIR for a file cache on a single host).',
+            id='users.E001',
+        )]
+    return []
+
+
+@contextmanager
+def _locked(key):
+    """
+    Hold the lock of a cache entry while it is read and written back. add() is
+    atomic on the shared backends, so only one worker holds it at a time.
+    Yields False when the lock could not be taken within LOCK_WAIT seconds.
+    """
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            yield False
+            return
+        time.sleep(0.01)
+    try:
+        yield True
+    finally:
+        cache.delete(lock_key)
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def _code_key(email, purpose):
+    return f'otp:code:{purpose}:{_digest(email.lower())}'
+
+
+def _hash_code(email, code):
+    # Only a keyed hash of the code is cached, a cache dump does not leak live codes
+    message = f'{email.lower()}:{code}'.encode('utf-8')
+    return hmac.new(settings.SECRET_KEY.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def take_token(scope, identity):
+    """
+    Take one token from the `scope` bucket of `identity`, raising RateLimited
+    when it is empty. Buckets are configured in OTP_RATE_LIMITS as
+    (burst, seconds per token) and kept in the cache, so they are shared by
+    every worker using it.
+    """
+    burst, refill = settings.OTP_RATE_LIMITS[scope]
+    key = f'otp:bucket:{scope}:{_digest(str(identity))}'
+    with _locked(key) as locked:
+        if not locked:
+            # So many requests for this bucket that they queue on its lock
+            raise RateLimited(math.ceil(refill))
+        now = time.time()
+        tokens, updated_at = cache.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) / refill)
+        if tokens < 1:
+            raise RateLimited(math.ceil((1 - tokens) * refill))
+        # The bucket expires once it would have refilled completely anyway
+        cache.set(key, (tokens - 1, now), math.ceil(burst * refill))
+
+
+def check_rate(action, email, ip):
+    take_token(f'{action}:ip', ip)
+    take_token(f'{action}:email', email.lower())
+
+
+def issue_otp(email, purpose=LOGIN):
+    """
+    Generate a code for `email`, valid for OTP_TTL seconds. Issuing a new code
+    replaces the previous one.
+    """
+    code = generate_otp()
+    entry = {'hash': _hash_code(email, code), 'attempts': 0, 'expires_at': time.time() + settings.OTP_TTL}
+    cache.set(_code_key(email, purpose), entry, settings.OTP_TTL)
+    return code
+
+
+def verify_otp(email, code, purpose=LOGIN):
+    """
+    Check `code` against the live code for `email`. A code can only be used
+    once and is dropped after OTP_MAX_ATTEMPTS wrong guesses.
+    """
+    if not email or not code:
+        return False
+    key = _code_key(email, purpose)
+    # Locked so a code is only accepted once and every wrong guess is counted
+    with _locked(key) as locked:
+        entry = cache.get(key) if locked else None
+        if entry is None:
+            return False
+
+        if hmac.compare_digest(entry['hash'], _hash_code(email, str(code))):
+            cache.delete(key)
+            return True
+
+        entry['attempts'] += 1
+        remaining = math.ceil(entry['expires_at'] - time.time())
+        if entry['attempts'] >= settings.OTP_MAX_ATTEMPTS or remaining <= 0:
+            cache.delete(key)
+        else:
+            cache.set(key, entry, remaining)
+        return False
@@ -0,0 +1,120 @@
+import smtplib
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+from .models import OutboundEmail
+
+
+def queue_email(subject, body, recipient_list, from_email=None):
+    """
+    Store an email in the outbox. It is delivered by `manage.py
+    send_queued_email`, so the request does not wait on SMTP.
+    """
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER or '',
+        to=list(recipient_list),
+    )
+
+
+def _claim(batch_size):
+    """
+    Mark up to `batch_size` due emails as being sent and return them. Emails
+    claimed by a worker that died are claimed again after a while.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+    due = OutboundEmail.objects.filter(
+        Q(status=OutboundEmail.PENDING, next_attempt_at__lte=now) |
+        Q(status=OutboundEmail.SENDING, claimed_at__lt=stale)
+    ).order_by('next_attempt_at')
+    ids = list(due.values_list('pk', flat=True)[:batch_size])
+    # Only rows still due are updated, so two workers never claim the same email
+    OutboundEmail.objects.filter(pk__in=ids).filter(
+        Q(status=OutboundEmail.PENDING) | Q(status=OutboundEmail.SENDING, claimed_at__lt=stale)
+    ).update(status=OutboundEmail.SENDING, claimed_at=now)
+    return list(OutboundEmail.objects.filter(pk__in=ids, status=OutboundEmail.SENDING, claimed_at=now))
+
+
+def _failed(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = OutboundEmail.DEAD
+        # Bodies can hold one time passwords, nothing reads them once delivery stopped
+        email.body = ''
+    else:
+        email.status = OutboundEmail.PENDING
+        # Exponential backoff: 30s, 60s, 120s, ...
+        delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1)
+        email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'body'])
+
+
+def _release(emails):
+    OutboundEmail.objects.filter(pk__in=[email.pk for email in emails], status=OutboundEmail.SENDING).update(
+        status=OutboundEmail.PENDING, claimed_at=None,
+    )
+
+
+def send_queued_emails(batch_size=None, connection=None):
+    """
+    Send one batch of due emails over a single SMTP connection. Returns
+    (sent, failed).
+    """
+    emails = _claim(batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    if not emails:
+        return 0, 0
+
+    connection = connection or get_connection(fail_silently=False)
+    sent = failed = 0
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            _failed(email, e)
+        return 0, len(emails)
+
+    try:
+        for index, email in enumerate(emails):
+            message = EmailMessage(email.subject, email.body, email.from_email, email.to, connection=connection)
+            try:
+                message.send()
+            except smtplib.SMTPServerDisconnected as e:
+                _failed(email, e)
+                failed += 1
+                # Reconnect for the rest of the batch, if that fails too the rest goes
+                # back to the queue for the next run without using up an attempt
+                try:
+                    connection.close()
+                    connection.open()
+                except Exception:
+                    _release(emails[index + 1:])
+                    break
+                continue
+            except Exception as e:
+                _failed(email, e)
+                failed += 1
+                continue
+            email.status = OutboundEmail.SENT
+            email.sent_at = timezone.now()
+            email.body = ''
+            email.save(update_fields=['status', 'sent_at', 'body'])
+            sent += 1
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def prune_emails(max_age):
+    """
+    Delete sent and dead emails created more than `max_age` ago. Returns the
+    number of emails deleted.
+    """
+    cutoff = timezone.now() - max_age
+    return OutboundEmail.objects.filter(
+        status__in=[OutboundEmail.SENT, OutboundEmail.DEAD], created_at__lt=cutoff,
+    ).delete()[0]
@@ -0,0 +1,162 @@
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.settings import api_settings
+
+
+# Revocations are grouped by the hour their token expires. Every group has
+# its own log in the shared cache and its own bloom filter in each process,
+# so whole groups are dropped once their tokens could no longer be used anyway.
+BUCKET_SECONDS = 3600
+HASHES = 7
+
+_lock = threading.Lock()
+_filters = {}  # bucket -> BloomFilter
+_seen = {}  # bucket -> last log position merged into the filter
+_missing = {}  # log key -> bucket, for entries that were not written yet at the last sync
+_synced_at = 0.0
+
+
+class BloomFilter:
+    def __init__(self, bits):
+        self.bits = bits
+        self.array = bytearray(bits // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=4 * HASHES).digest()
+        for i in range(HASHES):
+            yield int.from_bytes(digest[i * 4:i * 4 + 4], 'little') % self.bits
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+def _bucket(exp):
+    return int(exp) // BUCKET_SECONDS
+
+
+def _revoked_key(jti):
+    return f'jwt:revoked:{jti}'
+
+
+def _seq_key(bucket):
+    return f'jwt:revoked:{bucket}:seq'
+
+
+def _log_key(bucket, position):
+    return f'jwt:revoked:{bucket}:{position}'
+
+
+def _bucket_timeout(bucket):
+    # Keep the log a little longer than the last token in it can live
+    return max(1, int((bucket + 1) * BUCKET_SECONDS - time.time()) + 60)
+
+
+def _live_buckets():
+    longest = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME).total_seconds()
+    now = time.time()
+    return range(_bucket(now), _bucket(now + longest) + 1)
+
+
+def _filter(bucket):
+    bloom = _filters.get(bucket)
+    if bloom is None:
+        bloom = _filters[bucket] = BloomFilter(settings.JWT_REVOCATION_BLOOM_BITS)
+    return bloom
+
+
+def _sync():
+    """
+    Merge revocations made by other processes into the local filters. Costs one
+    get_many for the log positions, plus one for new entries if there are any.
+    """
+    buckets = list(_live_buckets())
+    for bucket in [bucket for bucket in _filters if bucket < buckets[0]]:
+        _filters.pop(bucket, None)
+        _seen.pop(bucket, None)
+    # An entry may never be written if its process died, it is retried until its bucket expires
+    for key in [key for key, bucket in _missing.items() if bucket < buckets[0]]:
+        del _missing[key]
+
+    positions = cache.get_many([_seq_key(bucket) for bucket in buckets])
+    wanted = dict(_missing)
+    for bucket in buckets:
+        last = positions.get(_seq_key(bucket), 0)
+        if last < _seen.get(bucket, 0):
+            # The counter was evicted and restarted, its new log starts at 1 again
+            _seen[bucket] = 0
+        wanted.update((_log_key(bucket, position), bucket) for position in range(_seen.get(bucket, 0) + 1, last + 1))
+        _seen[bucket] = max(_seen.get(bucket, 0), last)
+    if not wanted:
+        return
+    entries = cache.get_many(list(wanted))
+    for bucket, jti in entries.values():
+        _filter(bucket).add(jti)
+    _missing.clear()
+    _missing.update((key, bucket) for key, bucket in wanted.items() if key not in entries)
+
+
+def _maybe_sync():
+    global _synced_at
+    now = time.monotonic()
+    if now - _synced_at < settings.JWT_REVOCATION_SYNC_INTERVAL:
+        return
+    # A single thread syncs, the others keep using the current filters
+    if not _lock.acquire(blocking=False):
+        return
+    try:
+        if now - _synced_at >= settings.JWT_REVOCATION_SYNC_INTERVAL:
+            _sync()
+            _synced_at = now
+    finally:
+        _lock.release()
+
+
+def revoke(token):
+    """
+    Revoke a validated token until it expires.
+    """
+    jti, exp = token.get(api_settings.JTI_CLAIM), token.get('exp')
+    if not jti or not exp:
+        return
+    timeout = int(exp - time.time()) + 1
+    if timeout <= 0:
+        return
+
+    bucket = _bucket(exp)
+    cache.set(_revoked_key(jti), 1, timeout)
+    # Publish the jti to the other processes through the bucket's log
+    seq_key = _seq_key(bucket)
+    cache.add(seq_key, 0, _bucket_timeout(bucket))
+    try:
+        position = cache.incr(seq_key)
+    except ValueError:
+        # The counter expired in between, start a new log
+        cache.add(seq_key, 0, _bucket_timeout(bucket))
+        position = cache.incr(seq_key)
+    cache.set(_log_key(bucket, position), (bucket, jti), _bucket_timeout(bucket))
+
+    with _lock:
+        _filter(bucket).add(jti)
+
+
+def is_revoked(token):
+    """
+    Constant time check: tokens missing from the local bloom filter are not
+    revoked, possible hits are confirmed against the shared cache. Revocations
+    made in another process are seen within JWT_REVOCATION_SYNC_INTERVAL.
+    """
+    jti, exp = token.get(api_settings.JTI_CLAIM), token.get('exp')
+    if not jti or not exp:
+        return False
+    _maybe_sync()
+    bloom = _filters.get(_bucket(exp))
+    if bloom is None or jti not in bloom:
+        return False
+    return cache.get(_revoked_key(jti)) is not None
@@ -2,6 +2,12 @@ from djoser.serializers import UserCreateSerializer
 from .models import UserAccount
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer, TokenVerifySerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+from .otp import verify_otp
+from .revocation import is_revoked, revoke
 
 
 class UserCreateSerializer(UserCreateSerializer):
@@ -55,16 +61,37 @@ class UserAccountSerializer(serializers.ModelSerializer):
         email = attrs.get('email')
         otp = attrs.get('otp')
 
-        try:
-            user = UserAccount.objects.get(email=email)
-        except UserAccount.DoesNotExist:
+        # Only requests that carry a code are validated here, sign ups get theirs afterwards
+        if otp is None:
+            return attrs
+
+        if not UserAccount.objects.filter(email=email).exists():
             raise serializers.ValidationError({'error': 'User with this email does not exist.'})
-        
-        if user.otp != otp:
+
+        # The code is single use, verify_otp drops it once it matches
+        if not verify_otp(email, otp):
             raise serializers.ValidationError({'error': 'Invalid OTP.'})
-        
-        # Resetting the OTP field after successful validation
-        user.otp = None
-        user.save()
 
-        return attrs
\ No newline at end of file
+        return attrs
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        if is_revoked(refresh):
+            raise InvalidToken('Token has been revoked')
+
+        data = super().validate(attrs)
+
+        # A rotated refresh token must not be usable a second time
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            revoke(refresh)
+        return data
+
+
+class RevocableTokenVerifySerializer(TokenVerifySerializer):
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        if is_revoked(UntypedToken(attrs['token'])):
+            raise InvalidToken('Token has been revoked')
+        return data
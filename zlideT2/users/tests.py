@@ -1,3 +1,189 @@
-from django.test import TestCase
+import smtplib
+from datetime import timedelta
+from unittest import mock
+from django.core import checks, mail
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from . import authentication, otp, revocation
+from .models import OutboundEmail, UserAccount
+from .outbox import queue_email, send_queued_emails, prune_emails
 
 # Create your tests here.
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTest(TestCase):
+    def test_sent_email_body_is_cleared(self):
+        email = queue_email('Your code', 'Your code is 123456', ['user@example.com'])
+        self.assertEqual(send_queued_emails(connection=get_connection()), (1, 0))
+        self.assertEqual(mail.outbox[0].body, 'Your code is 123456')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.body), (OutboundEmail.SENT, ''))
+
+    def test_failed_reconnect_releases_the_rest(self):
+        emails = [queue_email('Your code', f'Your code is {idx}', ['user@example.com']) for idx in range(3)]
+        connection = mock.Mock()
+        connection.send_messages.side_effect = smtplib.SMTPServerDisconnected('gone')
+        connection.open.side_effect = [None, OSError('refused')]
+        self.assertEqual(send_queued_emails(connection=connection), (0, 1))
+        statuses = [(email.status, email.attempts, email.claimed_at) for email in OutboundEmail.objects.filter(pk__in=[e.pk for e in emails]).order_by('pk')]
+        self.assertEqual(statuses[0][:2], (OutboundEmail.PENDING, 1))
+        self.assertEqual(statuses[1:], [(OutboundEmail.PENDING, 0, None)] * 2)
+
+    def test_old_sent_and_dead_emails_are_pruned(self):
+        for status in (OutboundEmail.SENT, OutboundEmail.DEAD, OutboundEmail.PENDING):
+            email = queue_email('Your code', 'Your code is 123456', ['user@example.com'])
+            OutboundEmail.objects.filter(pk=email.pk).update(status=status, created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(prune_emails(timedelta(days=1)), 2)
+        self.assertEqual(list(OutboundEmail.objects.values_list('status', flat=True)), [OutboundEmail.PENDING])
+
+
+@override_settings(OTP_MAX_ATTEMPTS=3, OTP_RATE_LIMITS={'test': (2, 60)})
+class OTPTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_code_is_single_use(self):
+        code = otp.issue_otp('User@example.com')
+        self.assertFalse(otp.verify_otp('user@example.com', code, otp.ACTIVATE))
+        self.assertTrue(otp.verify_otp('user@example.com', code))
+        self.assertFalse(otp.verify_otp('user@example.com', code))
+
+    def test_code_is_dropped_after_too_many_guesses(self):
+        code = otp.issue_otp('user@example.com')
+        wrong = '000000' if code != '000000' else '111111'
+        for _ in range(3):
+            self.assertFalse(otp.verify_otp('user@example.com', wrong))
+        self.assertFalse(otp.verify_otp('user@example.com', code))
+
+    def test_bucket_runs_out(self):
+        otp.take_token('test', 'user@example.com')
+        otp.take_token('test', 'user@example.com')
+        with self.assertRaises(otp.RateLimited) as raised:
+            otp.take_token('test', 'user@example.com')
+        self.assertEqual(raised.exception.retry_after, 60)
+        otp.take_token('test', 'other@example.com')
+
+    def test_busy_bucket_is_rate_limited(self):
+        cache.add(f"otp:bucket:test:{otp._digest('user@example.com')}:lock", 1)
+        with mock.patch.object(otp, 'LOCK_WAIT', 0), self.assertRaises(otp.RateLimited):
+            otp.take_token('test', 'user@example.com')
+
+    def test_shared_cache_is_a_deploy_check(self):
+        self.assertEqual([error.id for error in otp.check_shared_cache(None)], ['users.E001'])
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            self.assertEqual(otp.check_shared_cache(None), [])
+        self.assertEqual(checks.run_checks(tags=[checks.Tags.caches]), [])
+        self.assertIn('users.E001', [error.id for error in checks.run_checks(tags=[checks.Tags.caches], include_deployment_checks=True)])
+
+
+class RevocationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user(email='user@example.com', username='user', password='password')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client = APIClient()
+
+    def verify(self, token):
+        return self.client.post('/api/jwt/verify/', {'token': str(token)}, format='json').status_code
+
+    def test_revoked_token_is_rejected(self):
+        access = self.refresh.access_token
+        self.assertFalse(revocation.is_revoked(access))
+        revocation.revoke(access)
+        self.assertTrue(revocation.is_revoked(access))
+        self.assertFalse(revocation.is_revoked(AccessToken.for_user(self.user)))
+
+    def test_revocations_reach_other_processes(self):
+        access = self.refresh.access_token
+        revocation.revoke(access)
+        # What another process starts with: empty filters, synced from the shared log
+        with mock.patch.dict(revocation._filters, clear=True), mock.patch.dict(revocation._seen, clear=True), \
+                mock.patch.object(revocation, '_synced_at', 0.0):
+            self.assertTrue(revocation.is_revoked(access))
+
+    def other_process(self):
+        return mock.patch.dict(revocation._filters, clear=True), mock.patch.dict(revocation._seen, clear=True), \
+            mock.patch.dict(revocation._missing, clear=True)
+
+    def test_restarted_log_is_read_from_the_start(self):
+        access = self.refresh.access_token
+        bucket = revocation._bucket(access['exp'])
+        filters, seen, missing = self.other_process()
+        with filters, seen, missing:
+            # This process had read further than the counter, which was evicted since
+            revocation._seen[bucket] = 5
+            revocation.revoke(access)
+            revocation._sync()
+            self.assertIn(access['jti'], revocation._filter(bucket))
+
+    def test_late_entries_are_retried_until_they_arrive(self):
+        access = self.refresh.access_token
+        bucket = revocation._bucket(access['exp'])
+        filters, seen, missing = self.other_process()
+        with filters, seen, missing:
+            # Another process claimed position 1 but has not written the entry yet
+            cache.set(revocation._seq_key(bucket), 1)
+            for _ in range(3):
+                revocation._sync()
+                self.assertNotIn(access['jti'], revocation._filter(bucket))
+            cache.set(revocation._log_key(bucket, 1), (bucket, access['jti']))
+            revocation._sync()
+            self.assertIn(access['jti'], revocation._filter(bucket))
+            self.assertEqual(revocation._missing, {})
+
+    def test_logout_revokes_both_tokens(self):
+        access = self.refresh.access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.post('/api/logout/', {'refresh': str(self.refresh)}, format='json').status_code, 204)
+        self.client.credentials()
+        self.assertEqual(self.verify(access), 401)
+        self.assertEqual(self.verify(self.refresh), 401)
+
+    def test_refresh_rotation_revokes_the_old_token(self):
+        response = self.client.post('/api/jwt/refresh/', {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], str(self.refresh))
+        self.client.cookies.clear()
+        self.assertEqual(self.client.post('/api/jwt/refresh/', {'refresh': str(self.refresh)}, format='json').status_code, 401)
+
+
+class AuthenticationCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication._token_cache.clear()
+        authentication._user_cache.clear()
+        self.user = UserAccount.objects.create_user(email='user@example.com', username='user', password='password')
+        self.token = str(AccessToken.for_user(self.user))
+
+    def authenticate(self):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return authentication.CustomJWTAuthentication().authenticate(request)
+
+    def test_cached_user_needs_no_query(self):
+        self.assertEqual(self.authenticate()[0], self.user)
+        with CaptureQueriesContext(connection) as queries:
+            user, _ = self.authenticate()
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(user, self.user)
+
+    def test_queryset_update_invalidates(self):
+        self.assertIsNotNone(self.authenticate())
+        UserAccount.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(self.authenticate())
+
+    def test_change_in_another_process(self):
+        self.assertIsNotNone(self.authenticate())
+        # Another process saved the user, only the shared generation tells this one
+        with mock.patch('users.signals.invalidate_user'):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNotNone(self.authenticate())
+        authentication.invalidate_user(self.user.pk)
+        self.assertIsNone(self.authenticate())
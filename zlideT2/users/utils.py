@@ -1,11 +1,12 @@
 import random
+import secrets
 import string
-from django.core.mail import send_mail
 from django.conf import settings
+from .outbox import queue_email
 
 def generate_otp(length=6):
     characters = string.digits
-    otp = ''.join(random.choice(characters) for _ in range(length))
+    otp = ''.join(secrets.choice(characters) for _ in range(length))
     return otp
 
 def send_otp_email(email, otp):
@@ -13,12 +14,11 @@ def send_otp_email(email, otp):
     message = f'Your OTP is: {otp}'
     from_email = settings.EMAIL_HOST_USER
     recipient_list = [email]
-    send_mail(subject, message, from_email, recipient_list) 
+    queue_email(subject, message, recipient_list, from_email=from_email)
 
 
 import random
-from django.core.mail import EmailMessage
-from .models import UserAccount, OneTimePassword
+from .models import UserAccount
 from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
 
@@ -29,16 +29,13 @@ def generateOTP():
     return otp
 
 def send_code_to_user(email, request):
+    from .otp import issue_otp, ACTIVATE
+
     Subject = "One time passcode for email verification"
-    otp = generateOTP()
-    print(otp)
     user = UserAccount.objects.get(email=email)
+    otp = issue_otp(user.email, ACTIVATE)
     current_site = get_current_site(request).domain
-    email_body = f"Hi {UserAccount.username} thanks for signing up on {current_site} please verify your email with this \n one time passcode {otp}"
+    email_body = f"Hi {user.username} thanks for signing up on {current_site} please verify your email with this \n one time passcode {otp}"
     from_email = settings.DEFAULT_FROM_EMAIL
-    # otp_obj = OneTimePassword.objects.create(user=user, otp=otp)
-
-    OneTimePassword.objects.create(user=user, code=otp)
 
-    send_email = EmailMessage(subject=Subject, body=email_body, from_email=from_email, to=[email])
-    send_email.send(fail_silently=True)
+    queue_email(Subject, email_body, [email], from_email=from_email)
@@ -5,20 +5,30 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, generics
 from rest_framework.permissions import AllowAny
-from .utils import send_code_to_user, generate_otp, send_otp_email
-from django.core.mail import EmailMultiAlternatives
+from .utils import send_otp_email
+from .outbox import queue_email
+from . import otp as otp_service
+from .revocation import revoke
+from zlideT2.http import client_ip
 from django.contrib.sites.shortcuts import get_current_site
 from .models import UserAccount
 from djoser.social.views import ProviderAuthView
 from .serializers import UserCreateSerializer, UserOTPSerializer, UserAccountSerializer
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
     TokenVerifyView,
 ) 
-import random
+
+
+def rate_limited(exc):
+    response = Response({'error': str(exc)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(exc.retry_after)
+    return response
 
 
 class LoginWithOTP(APIView):
@@ -32,14 +42,15 @@ class LoginWithOTP(APIView):
     def post(self, request):
         email = request.data.get('email', '')
         try:
-            user = UserAccount.objects.get(email=email)
-        except UserAccount.DoesNotExist:
+            # Floods are rejected before they cost a query or an email
+            otp_service.check_rate('issue', email, client_ip(request))
+        except otp_service.RateLimited as e:
+            return rate_limited(e)
+
+        if not UserAccount.objects.filter(email=email).exists():
             return Response({'error': 'User with this email does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-        
-        otp = generate_otp()
-        user.otp = otp
-        user.save()
 
+        otp = otp_service.issue_otp(email, otp_service.LOGIN)
         send_otp_email(email, otp)
 
         return Response({'message': 'OTP has been sent to your email.'}, status=status.HTTP_200_OK)
@@ -57,15 +68,17 @@ class ValidateOTP(APIView):
         email = request.data.get('email', '')
         otp = request.data.get('otp', '')
 
+        try:
+            otp_service.check_rate('verify', email, client_ip(request))
+        except otp_service.RateLimited as e:
+            return rate_limited(e)
+
         try:
             user = UserAccount.objects.get(email=email)
         except UserAccount.DoesNotExist:
             return Response({'error': 'User with this email does not exist.'}, status=status.HTTP_404_NOT_FOUND)
         
-        if user.otp == otp:
-            user.otp = None # Resetting the OTP field after successful validation
-            user.save()
-
+        if otp_service.verify_otp(email, otp, otp_service.LOGIN):
             # Authenticate the user and create or get an authentication token
             token, _ = Token.objects.get_or_create(user=user)
 
@@ -177,6 +190,19 @@ class CustomTokenRefreshView(TokenRefreshView):
                 samesite=settings.AUTH_COOKIE_SAMESITE
             )
 
+            # The old refresh token is revoked on rotation, hand out the new one
+            refresh_token = response.data.get('refresh')
+            if refresh_token:
+                response.set_cookie(
+                    'refresh',
+                    refresh_token,
+                    max_age=settings.AUTH_COOKIE_MAX_AGE,
+                    path=settings.AUTH_COOKIE_PATH,
+                    secure=settings.AUTH_COOKIE_SECURE,
+                    httponly=settings.AUTH_COOKIE_HTTP_ONLY,
+                    samesite=settings.AUTH_COOKIE_SAMESITE
+                )
+
         return response
 
 
@@ -200,12 +226,22 @@ class CustomTokenVerifyView(TokenVerifyView):
 class LogoutView(APIView):
     @extend_schema(
         operation_id='Logout Endpoint',
-        description='This endpoint logs out the user by deleting the cookie from the browser.',
-        summary='This endpoint logs out the user by deleting the cookie from the browser.',
+        description='This endpoint logs out the user by revoking their access and refresh tokens and deleting the cookie from the browser.',
+        summary='This endpoint logs out the user by revoking their tokens and deleting the cookie from the browser.',
         request= OpenApiTypes.OBJECT,
         responses={200: UserCreateSerializer},
     )
     def post(self, request, *args, **kwargs):
+        if request.auth is not None:
+            revoke(request.auth)
+
+        refresh_token = request.COOKIES.get('refresh') or request.data.get('refresh')
+        if refresh_token:
+            try:
+                revoke(RefreshToken(refresh_token))
+            except TokenError:
+                pass # Already invalid or expired
+
         response = Response(status=status.HTTP_204_NO_CONTENT)
         response.delete_cookie('access')
         response.delete_cookie('refresh')
@@ -232,16 +268,13 @@ class CreateUserView(generics.CreateAPIView):
         #     return str(random.randint(100000, 999999))
         if serializer.is_valid():
             user = serializer.save(is_active=False)
-            otp = random.randint(100000, 999999)
-            user.otp = otp
-            user.save()
+            otp = otp_service.issue_otp(user.email, otp_service.ACTIVATE)
 
-            email = user.email
             current_site = get_current_site(request)
             subject = 'Kindly activate your account'
             from_email = settings.DEFAULT_FROM_EMAIL
             to_email = user.email
-            email.send()
+            queue_email(subject, f'Your activation code for {current_site.domain} is: {otp}', [to_email], from_email=from_email)
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -263,27 +296,28 @@ class ActivateUserView(APIView):
 
         if not email or not otp:
             return Response({'error': ('Email and OTP are required.')}, status=status.HTTP_400_BAD_REQUEST)
-        
+
+        try:
+            otp_service.check_rate('verify', email, client_ip(request))
+        except otp_service.RateLimited as e:
+            return rate_limited(e)
+
         try:
             user = UserAccount.objects.get(email=email)
         except UserAccount.DoesNotExist:
             return Response({'error': ('User does not exist.')}, status=status.HTTP_400_BAD_REQUEST)
         
 
-        if user.otp == otp:
+        if otp_service.verify_otp(email, otp, otp_service.ACTIVATE):
             user.is_active = True
-            user.otp = None # Clear OTP after successful activation
-            user.save()
+            user.save(update_fields=['is_active'])
 
-            email = user.email
             current_site = get_current_site(self.request)
             subject = 'Your account has been activated successfully'
-            protocol = 'https' if self.request.is_secure() else 'http'
             from_email = settings.DEFAULT_FROM_EMAIL
             to_email = user.email
 
-            email = EmailMultiAlternatives(subject, from_email, [to_email])
-            email.send()
+            queue_email(subject, f'Your account on {current_site.domain} has been activated successfully.', [to_email], from_email=from_email)
 
             return Response({'message': ('Your account has been activated successfully')}, status=status.HTTP_200_OK)
         else:
@@ -306,21 +340,22 @@ class ResendOTPView(APIView):
         if not email:
             return Response({'error': ('Email is required.')}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            otp_service.check_rate('issue', email, client_ip(request))
+        except otp_service.RateLimited as e:
+            return rate_limited(e)
+
         try:
             user = UserAccount.objects.get(email=email)
         except UserAccount.DoesNotExist:
             return Response({'error': ('User does not exist.')}, status=status.HTTP_400_BAD_REQUEST)
 
-        otp = random.randint(100000, 999999)
-        user.otp = otp  # Save the OTP to the user model 
-        user.save()
-        email = user.email
-        current_site = get_current_site(self.request)
+        # Accounts waiting for activation get a new activation code, active ones a login code
+        otp = otp_service.issue_otp(user.email, otp_service.LOGIN if user.is_active else otp_service.ACTIVATE)
         subject = 'Your new OTP'
-        
+
         from_email = settings.DEFAULT_FROM_EMAIL
         to_email = user.email
-        email = EmailMultiAlternatives(subject, from_email, [to_email])
-        email.send()
+        queue_email(subject, f'Your OTP is: {otp}', [to_email], from_email=from_email)
 
         return Response({'message': ('OTP resent successfully.')}, status=status.HTTP_200_OK)
\ No newline at end of file
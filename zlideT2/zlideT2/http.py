@@ -0,0 +1,12 @@
+from django.conf import settings
+
+
+def client_ip(request):
+    """
+    Address of the client that sent `request`, taken from CLIENT_IP_HEADER
+    when the app runs behind a proxy that sets it.
+    """
+    header = settings.CLIENT_IP_HEADER
+    if header and request.META.get(header):
+        return request.META[header].split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
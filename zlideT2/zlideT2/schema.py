@@ -0,0 +1,79 @@
+import hashlib
+import threading
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from drf_spectacular.renderers import OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.views import SpectacularAPIView
+
+
+def generate_schema():
+    """
+    Build the OpenAPI schema from the code, the way `manage.py spectacular` does.
+    """
+    return spectacular_settings.DEFAULT_GENERATOR_CLASS().get_schema(request=None, public=True)
+
+
+def render_yaml(schema):
+    return OpenApiYamlRenderer().render(schema, renderer_context={})
+
+
+def _load_schema():
+    path = settings.ZLIDE_OPENAPI_SCHEMA_FILE
+    if path:
+        import yaml
+
+        with open(path, 'rb') as f:
+            return yaml.safe_load(f)
+    return generate_schema()
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """
+    Serves the schema without introspecting every view on each request. It is
+    read from ZLIDE_OPENAPI_SCHEMA_FILE when that is set (generated at build
+    time with `manage.py check_openapi_schema --write`), otherwise generated
+    once per process on the first request. Each rendering is kept in memory
+    with an ETag, so repeat visits to the docs get a 304.
+    """
+    _schema = None
+    _rendered = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_schema(cls):
+        if cls._schema is None:
+            with cls._lock:
+                if cls._schema is None:
+                    cls._schema = _load_schema()
+        return cls._schema
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._schema = None
+            cls._rendered = {}
+
+    def _get_schema_response(self, request):
+        version = self.api_version or request.version or self._get_version_parameter(request)
+        if version or self.urlconf or self.patterns or self.custom_settings or request.GET.get('lang'):
+            # Anything but the default schema is rare, build it the regular way
+            return super()._get_schema_response(request)
+
+        renderer = request.accepted_renderer
+        key = renderer.media_type
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            content = renderer.render(self.get_schema(), renderer.media_type, self.get_renderer_context())
+            etag = '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+            rendered = self._rendered[key] = (content, etag)
+        content, etag = rendered
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            content_type = f'{renderer.media_type}; charset={renderer.charset}' if renderer.charset else renderer.media_type
+            response = HttpResponse(content, content_type=content_type)
+            response['Content-Disposition'] = f'inline; filename="{self._get_filename(request, version)}"'
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,302 @@
+import itertools
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from django.conf import settings
+from django.core.cache import cache
+from zlideT2.http import client_ip
+from .timing import Histogram, METRICS
+
+
+# Lower is admitted first
+STAFF = 0
+AUTHENTICATED = 1
+ANONYMOUS = 2
+
+ADMISSION_WAIT = Histogram('zlide_admission_wait_seconds', 'Time requests spent waiting for admission.', ('gate', 'outcome'))
+METRICS.append(ADMISSION_WAIT)
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'The server is busy, retry in {retry_after} seconds.')
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('priority', 'identity', 'weight', 'seq', 'event', 'admitted', 'rejected')
+
+    def __init__(self, priority, identity, weight, seq):
+        self.priority = priority
+        self.identity = identity
+        self.weight = weight
+        self.seq = seq
+        self.event = threading.Event()
+        self.admitted = False
+        self.rejected = False
+
+
+class Slot:
+    def __init__(self, gate, identity, weight, global_keys, started_at):
+        self.gate = gate
+        self.identity = identity
+        self.weight = weight
+        self.global_keys = global_keys
+        self.started_at = started_at
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.gate._release(self)
+
+    def wrap(self, iterable):
+        """
+        Hold the slot until a streamed response body is exhausted or closed.
+        """
+        return _SlotIterator(self, iterable)
+
+
+class _SlotIterator:
+    # Django calls close() on the streaming content when the response is
+    # closed, even if the client went away before the first chunk
+    def __init__(self, slot, iterable):
+        self.slot = slot
+        self.iterator = iter(iterable)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.iterator)
+        except BaseException:
+            self.slot.release()
+            raise
+
+    def close(self):
+        try:
+            close = getattr(self.iterator, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self.slot.release()
+
+
+class Gate:
+    """
+    Admission control for an expensive endpoint. At most `limit` requests run
+    at once in this process and, with `global_limit`, across every process
+    sharing the cache. Requests over the limit wait in a short queue, staff
+    first, then signed in users, then anonymous clients; within a priority the
+    identity with the fewest requests running goes first. When the queue is
+    full, an identity already has `per_user` requests in, or the wait runs past
+    `max_wait`, the request fails fast with Overloaded.
+
+    A request that runs several completions at once is admitted with that many
+    as its `weight` and takes as many of the `limit` (and `global_limit`) slots,
+    so the limits count concurrent completions rather than requests.
+    """
+    def __init__(self, name, limit, queue_size, max_wait, per_user, global_limit=0, lease=120):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.per_user = per_user
+        self.global_limit = global_limit
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._running = 0
+        self._running_by_identity = Counter()
+        self._queued_by_identity = Counter()
+        self._queue = []
+        self._seq = itertools.count()
+        # Slots holding global leases, renewed by one thread per gate while they run
+        self._held = set()
+        self._renewer = None
+        # Moving average of how long an admitted request runs, for Retry-After
+        self._service_time = 1.0
+
+    def retry_after(self, queued=None):
+        queued = len(self._queue) if queued is None else queued
+        seconds = self._service_time * (queued + 1) / max(self.limit, 1)
+        return min(max(math.ceil(seconds), 1), 60)
+
+    def acquire(self, identity, priority=ANONYMOUS, weight=1):
+        start = time.monotonic()
+        # Never more than the whole gate, or the request could not be admitted at all
+        weight = max(min(weight, self.limit), 1)
+        try:
+            self._acquire_local(identity, priority, weight, start)
+            try:
+                global_keys = self._acquire_global(weight, start)
+            except BaseException:
+                # Overloaded or the cache failing, the local slot must not leak either way
+                self._finish(identity, weight)
+                raise
+        except Overloaded:
+            ADMISSION_WAIT.observe(time.monotonic() - start, self.name, 'rejected')
+            raise
+        ADMISSION_WAIT.observe(time.monotonic() - start, self.name, 'admitted')
+        slot = Slot(self, identity, weight, global_keys, time.monotonic())
+        if global_keys:
+            self._hold(slot)
+        return slot
+
+    def _acquire_local(self, identity, priority, weight, start):
+        with self._lock:
+            if self._running_by_identity[identity] + self._queued_by_identity[identity] >= self.per_user:
+                raise Overloaded(self.retry_after())
+            if self._running + weight <= self.limit and not self._queue:
+                self._start(identity, weight)
+                return
+            if len(self._queue) >= self.queue_size:
+                # Shed the newest waiter of the lowest priority if this request outranks it
+                victim = max(self._queue, key=lambda waiter: (waiter.priority, waiter.seq), default=None)
+                if victim is None or victim.priority <= priority:
+                    raise Overloaded(self.retry_after())
+                self._dequeue(victim)
+                victim.rejected = True
+                victim.event.set()
+            waiter = _Waiter(priority, identity, weight, next(self._seq))
+            self._queue.append(waiter)
+            self._queued_by_identity[identity] += 1
+
+        waiter.event.wait(max(self.max_wait - (time.monotonic() - start), 0))
+        with self._lock:
+            if waiter.admitted:
+                return
+            if not waiter.rejected:
+                self._dequeue(waiter)
+            raise Overloaded(self.retry_after())
+
+    def _acquire_global(self, weight, start):
+        if not self.global_limit:
+            return []
+        weight = min(weight, self.global_limit)
+        prefix = f'zlide:admission:{self.name}:slot'
+        keys = [f'{prefix}:{index}' for index in range(self.global_limit)]
+        token = uuid.uuid4().hex
+        while True:
+            taken = cache.get_many(keys)
+            free = [key for key in keys if key not in taken]
+            random.shuffle(free)
+            held = []
+            for key in free:
+                # Slots are leased, one held by a crashed worker frees itself
+                if cache.add(key, token, self.lease):
+                    held.append(key)
+                    if len(held) == weight:
+                        return [(key, token) for key in held]
+            # All or nothing, so two heavy requests never each sit on half of what they need
+            self._release_global([(key, token) for key in held])
+            if time.monotonic() - start >= self.max_wait:
+                raise Overloaded(self.retry_after())
+            time.sleep(0.05)
+
+    def _hold(self, slot):
+        with self._lock:
+            self._held.add(slot)
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_leases, name=f'admission-{self.name}-leases', daemon=True)
+                self._renewer.start()
+
+    def _renew_leases(self):
+        """
+        Extend the lease of every global slot held by this process, so a
+        request that runs longer than `lease` keeps its slots. A crashed
+        process stops renewing and its slots free themselves.
+        """
+        while True:
+            time.sleep(self.lease / 3)
+            with self._lock:
+                slots = list(self._held)
+            for slot in slots:
+                for key, token in slot.global_keys:
+                    try:
+                        if cache.get(key) == token:
+                            cache.touch(key, self.lease)
+                    except Exception:
+                        # Tried again at the next round, the lease has time left
+                        pass
+
+    def _release_global(self, keys):
+        for key, token in keys:
+            # Past its lease the slot may belong to somebody else by now
+            if cache.get(key) == token:
+                cache.delete(key)
+
+    def _start(self, identity, weight):
+        self._running += weight
+        self._running_by_identity[identity] += 1
+
+    def _dequeue(self, waiter):
+        self._queue.remove(waiter)
+        self._queued_by_identity[waiter.identity] -= 1
+        if not self._queued_by_identity[waiter.identity]:
+            del self._queued_by_identity[waiter.identity]
+
+    def _finish(self, identity, weight):
+        with self._lock:
+            self._running -= weight
+            self._running_by_identity[identity] -= 1
+            if not self._running_by_identity[identity]:
+                del self._running_by_identity[identity]
+            while self._queue:
+                waiter = min(self._queue, key=lambda waiter: (waiter.priority, self._running_by_identity[waiter.identity], waiter.seq))
+                # The next in line waits for room rather than being overtaken by lighter requests
+                if self._running + waiter.weight > self.limit:
+                    break
+                self._dequeue(waiter)
+                self._start(waiter.identity, waiter.weight)
+                waiter.admitted = True
+                waiter.event.set()
+
+    def _release(self, slot):
+        if slot.global_keys:
+            with self._lock:
+                self._held.discard(slot)
+        self._release_global(slot.global_keys)
+        self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - slot.started_at)
+        self._finish(slot.identity, slot.weight)
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def generate_gate():
+    gate = _gates.get('generate')
+    if gate is None:
+        with _gates_lock:
+            gate = _gates.get('generate')
+            if gate is None:
+                gate = _gates['generate'] = Gate(
+                    'generate',
+                    limit=settings.ZLIDE_GENERATE_MAX_IN_FLIGHT,
+                    queue_size=settings.ZLIDE_GENERATE_QUEUE_SIZE,
+                    max_wait=settings.ZLIDE_GENERATE_MAX_WAIT,
+                    per_user=settings.ZLIDE_GENERATE_MAX_PER_USER,
+                    global_limit=settings.ZLIDE_GENERATE_GLOBAL_MAX_IN_FLIGHT,
+                    lease=settings.ZLIDE_GENERATE_SLOT_LEASE,
+                )
+    return gate
+
+
+def admit(request, gate=None, weight=1):
+    """
+    Wait for a slot for `request`, `weight` being how many completions it runs
+    at once, raising Overloaded when none frees up in time. Release the
+    returned slot when the request is done.
+    """
+    user = request.user
+    if user.is_authenticated:
+        identity = f'user:{user.pk}'
+        priority = STAFF if user.is_staff else AUTHENTICATED
+    else:
+        identity = f'ip:{client_ip(request)}'
+        priority = ANONYMOUS
+    return (gate or generate_gate()).acquire(identity, priority, weight)
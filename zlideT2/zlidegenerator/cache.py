@@ -0,0 +1,97 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+
+DELETED = 'deleted'
+
+
+def _title_key(title):
+    # Titles are user input, hash them so they are always valid cache keys
+    digest = hashlib.sha1(title.encode('utf-8')).hexdigest()
+    return f'zlide:deck:{digest}'
+
+
+def _data_key(title, pk, version):
+    return f'{_title_key(title)}:{pk}:{version}'
+
+
+def _timeout():
+    return getattr(settings, 'ZLIDE_DECK_CACHE_TIMEOUT', 300)
+
+
+def _lock_timeout():
+    return getattr(settings, 'ZLIDE_DECK_CACHE_LOCK_TIMEOUT', 5)
+
+
+def _store(title, pk, version, data):
+    timeout = _timeout()
+    # The entry lives twice as long as its refresh time, so stale copies can be
+    # served while a single request refreshes it
+    entry = {'pk': pk, 'version': version, 'data': data, 'refresh_at': time.time() + timeout}
+    cache.set(_data_key(title, pk, version), entry, timeout * 2)
+    # add() never replaces a newer pointer written by an invalidation that ran
+    # while this value was being loaded
+    cache.add(_title_key(title), (pk, version), timeout * 2)
+    return entry
+
+
+def _load(title, loader):
+    pk, version, data = loader()
+    return _store(title, pk, version, data)
+
+
+def _cached_entry(title):
+    pointer = cache.get(_title_key(title))
+    if pointer is None or pointer == DELETED:
+        return None
+    return cache.get(_data_key(title, *pointer))
+
+
+def get_deck(title, loader):
+    """
+    Return the serialized deck for `title`, calling `loader` on a miss.
+    `loader` returns a (pk, version, data) tuple and may raise to signal the
+    deck does not exist. Only one caller per deck reloads at a time; the others
+    serve the stale copy or wait briefly for the reload to land.
+    """
+    lock_key = f'{_title_key(title)}:lock'
+    entry = _cached_entry(title)
+
+    if entry is not None:
+        if entry['refresh_at'] > time.time() or not cache.add(lock_key, 1, _lock_timeout()):
+            return entry
+        try:
+            return _load(title, loader)
+        finally:
+            cache.delete(lock_key)
+
+    if cache.add(lock_key, 1, _lock_timeout()):
+        try:
+            return _load(title, loader)
+        finally:
+            cache.delete(lock_key)
+
+    # Somebody else is loading this deck, wait for them rather than piling onto the database
+    deadline = time.monotonic() + _lock_timeout()
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = _cached_entry(title)
+        if entry is not None:
+            return entry
+        if cache.get(lock_key) is None:
+            break
+    return _load(title, loader)
+
+
+def invalidate_deck(title, pk, version):
+    """
+    Point `title` at the new version so every cached copy of older versions is
+    ignored from now on.
+    """
+    cache.set(_title_key(title), (pk, version), _timeout() * 2)
+
+
+def forget_deck(title):
+    cache.set(_title_key(title), DELETED, _timeout() * 2)
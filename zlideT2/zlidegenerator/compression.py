@@ -0,0 +1,182 @@
+import re
+import secrets
+import time
+from gzip import GzipFile
+from django.conf import settings
+from django.http import FileResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import get_random_string
+from django.utils.text import StreamingBuffer, compress_string
+from .timing import Histogram, METRICS, span
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+CPU_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+RESPONSE_BYTES = Histogram('zlide_response_bytes', 'Response body size before compression.', ('encoding',), buckets=SIZE_BUCKETS)
+WIRE_BYTES = Histogram('zlide_response_wire_bytes', 'Response body size as sent.', ('encoding',), buckets=SIZE_BUCKETS)
+COMPRESSION_CPU = Histogram('zlide_compression_cpu_seconds', 'CPU time spent compressing a response.', ('encoding',), buckets=CPU_BUCKETS)
+METRICS.extend([RESPONSE_BYTES, WIRE_BYTES, COMPRESSION_CPU])
+
+# Same mitigation as Django's GZipMiddleware against BREACH: a random length
+# file name in the gzip header
+MAX_RANDOM_BYTES = 100
+
+_coding = re.compile(r'\s*([a-z*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?', re.IGNORECASE)
+
+
+def accepted_encodings(header):
+    """
+    Parse Accept-Encoding into {coding: q}.
+    """
+    accepted = {}
+    for item in header.split(','):
+        match = _coding.match(item)
+        if not match or not match.group(1):
+            continue
+        try:
+            q = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        accepted[match.group(1).lower()] = q
+    return accepted
+
+
+def choose_encoding(header, allow_brotli=True):
+    accepted = accepted_encodings(header)
+    options = (['br'] if brotli is not None and allow_brotli else []) + ['gzip']
+    candidates = [coding for coding in options if accepted.get(coding, accepted.get('*', 0)) > 0]
+    # Highest q wins, brotli on ties since it is smaller for the same CPU
+    return max(candidates, key=lambda coding: accepted.get(coding, accepted.get('*', 0)), default=None)
+
+
+def _gzip_sequence(sequence):
+    # django.utils.text.compress_sequence without its buffering, every chunk is flushed
+    buf = StreamingBuffer()
+    filename = get_random_string(secrets.randbelow(MAX_RANDOM_BYTES) + 1)
+    with GzipFile(filename=filename, mode='wb', compresslevel=6, fileobj=buf, mtime=0) as zfile:
+        yield buf.read()
+        for item in sequence:
+            zfile.write(item)
+            zfile.flush()
+            data = buf.read()
+            if data:
+                yield data
+    yield buf.read()
+
+
+def _brotli_compress(content):
+    return brotli.compress(content, quality=settings.ZLIDE_COMPRESSION_BROTLI_QUALITY)
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=settings.ZLIDE_COMPRESSION_BROTLI_QUALITY)
+    for item in sequence:
+        # Flush every chunk, streamed slides should reach the client as they are produced
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def _measured_sequence(sequence, encoding, compress):
+    original = wire = 0
+    cpu = 0.0
+
+    def counted():
+        nonlocal original
+        for item in sequence:
+            original += len(item)
+            yield item
+
+    compressed = compress(counted())
+    try:
+        while True:
+            start = time.thread_time()
+            try:
+                data = next(compressed)
+            except StopIteration:
+                break
+            finally:
+                cpu += time.thread_time() - start
+            wire += len(data)
+            yield data
+    finally:
+        RESPONSE_BYTES.observe(original, encoding)
+        WIRE_BYTES.observe(wire, encoding)
+        COMPRESSION_CPU.observe(cpu, encoding)
+
+
+def _uncompressed(response):
+    RESPONSE_BYTES.observe(len(response.content), 'identity')
+    WIRE_BYTES.observe(len(response.content), 'identity')
+    return response
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with brotli, when the package is installed and the
+    path is in ZLIDE_COMPRESSION_BROTLI_PATHS, or gzip, whichever the client
+    prefers. Only 200 responses are compressed. Bodies under
+    ZLIDE_COMPRESSION_MIN_SIZE bytes, file responses, already compressed content
+    types and responses with a Content-Encoding go out as they are. Other
+    streaming responses are compressed chunk by chunk. Sizes and CPU time are
+    exported at /metrics.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # Errors, redirects and 304s are small or empty. File responses (downloads,
+        # WhiteNoise static files) are streamed from disk, compressing them would
+        # hold a worker for the whole file
+        if response.status_code != 200 or isinstance(response, FileResponse):
+            return response
+        if response.has_header('Content-Encoding') or getattr(response, 'is_async', False):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type.startswith(settings.ZLIDE_COMPRESSION_SKIP_TYPES):
+            return response
+        if not response.streaming and len(response.content) < settings.ZLIDE_COMPRESSION_MIN_SIZE:
+            return _uncompressed(response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # Brotli output has no room for the BREACH padding, only paths known not
+        # to carry tokens get it
+        allow_brotli = request.path.startswith(settings.ZLIDE_COMPRESSION_BROTLI_PATHS)
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), allow_brotli)
+        if encoding is None:
+            return response if response.streaming else _uncompressed(response)
+
+        if response.streaming:
+            compress = _brotli_sequence if encoding == 'br' else _gzip_sequence
+            response.streaming_content = _measured_sequence(response.streaming_content, encoding, compress)
+            del response.headers['Content-Length']
+        else:
+            content = response.content
+            start = time.thread_time()
+            with span('compress'):
+                if encoding == 'br':
+                    compressed = _brotli_compress(content)
+                else:
+                    compressed = compress_string(content, max_random_bytes=MAX_RANDOM_BYTES)
+            COMPRESSION_CPU.observe(time.thread_time() - start, encoding)
+            if len(compressed) >= len(content):
+                return _uncompressed(response)
+            RESPONSE_BYTES.observe(len(content), encoding)
+            WIRE_BYTES.observe(len(compressed), encoding)
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # A strong ETag names the uncompressed bytes, weaken it as GZipMiddleware does
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,186 @@
+import json
+import re
+import zlib
+from collections import Counter
+from django.apps import apps
+from django.conf import settings
+from django.core import checks
+from django.db import models
+from django.db.models import Field
+
+
+# One header byte tells the reader how the rest of the value is stored
+RAW = b'\x00'
+ZLIB = b'\x01'
+ZLIB_DICT = b'\x02'
+
+ZDICT_MAX_SIZE = 32 * 1024 # zlib only looks back 32KB, anything beyond that is wasted
+
+
+_dictionary_id = re.compile(r'[0-9a-f]{8}')
+
+# Dictionaries never change once stored (the id is their checksum), so every
+# process keeps the ones it has read
+_dictionaries = {}
+
+
+def _dictionary_model():
+    return apps.get_model('zlidegenerator', 'CompressionDictionary')
+
+
+def load_dictionary(dictionary_id):
+    """
+    Return the bytes of a stored dictionary, or None when there is no
+    dictionary with that id.
+    """
+    zdict = _dictionaries.get(dictionary_id)
+    if zdict is None:
+        zdict = _dictionary_model().objects.filter(pk=dictionary_id).values_list('data', flat=True).first()
+        if zdict is None:
+            return None
+        zdict = _dictionaries[dictionary_id] = bytes(zdict)
+    return zdict
+
+
+def store_dictionary(zdict):
+    zdict_id = dictionary_id(zdict)
+    _dictionary_model().objects.get_or_create(pk=zdict_id, defaults={'data': zdict})
+    return zdict_id
+
+
+def dictionary_id(zdict):
+    return f'{zlib.crc32(zdict):08x}'
+
+
+def valid_dictionary_id(value):
+    return isinstance(value, str) and _dictionary_id.fullmatch(value) is not None
+
+
+@checks.register()
+def check_dictionary_setting(app_configs, **kwargs):
+    current = getattr(settings, 'ZLIDE_JSON_COMPRESSION_DICTIONARY', None)
+    if current and not valid_dictionary_id(current):
+        return [checks.Error(
+            f'ZLIDE_JSON_COMPRESSION_DICTIONARY must be the 8 hex digit id of a trained dictionary, not {current!r}',
+            hint='Run `manage.py train_compression_dictionary` and use the id it prints',
+            id='zlidegenerator.E001',
+        )]
+    return []
+
+
+def current_dictionary():
+    """
+    Returns (id, bytes) for the dictionary new values are compressed with, or
+    (None, None) when no dictionary is configured. A misconfigured or missing
+    dictionary falls back to plain zlib, so writes keep working.
+    """
+    current = getattr(settings, 'ZLIDE_JSON_COMPRESSION_DICTIONARY', None)
+    if not valid_dictionary_id(current):
+        return None, None
+    zdict = load_dictionary(current)
+    if zdict is None:
+        return None, None
+    return current, zdict
+
+
+def compress_json(value, encoder=None):
+    data = json.dumps(value, cls=encoder, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if len(data) < getattr(settings, 'ZLIDE_JSON_COMPRESSION_THRESHOLD', 1024):
+        return RAW + data
+
+    level = getattr(settings, 'ZLIDE_JSON_COMPRESSION_LEVEL', 6)
+    zdict_id, zdict = current_dictionary()
+    if zdict:
+        compressor = zlib.compressobj(level, zdict=zdict)
+        compressed = ZLIB_DICT + bytes.fromhex(zdict_id) + compressor.compress(data) + compressor.flush()
+    else:
+        compressed = ZLIB + zlib.compress(data, level)
+
+    # Incompressible payloads are kept as they are
+    if len(compressed) >= len(data) + 1:
+        return RAW + data
+    return compressed
+
+
+def decompress_json(value, decoder=None):
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if isinstance(value, str):
+        # Rows written before the column was compressed hold plain JSON text
+        return json.loads(value, cls=decoder)
+
+    header, body = value[:1], value[1:]
+    if header == RAW:
+        data = body
+    elif header == ZLIB:
+        data = zlib.decompress(body)
+    elif header == ZLIB_DICT:
+        zdict = load_dictionary(body[:4].hex())
+        if zdict is None:
+            raise ValueError(f'Compression dictionary {body[:4].hex()} is not stored')
+        decompressor = zlib.decompressobj(zdict=zdict)
+        data = decompressor.decompress(body[4:]) + decompressor.flush()
+    else:
+        # Guessing would hand corrupt bytes to the caller as a deck
+        raise ValueError(f'Unknown compressed JSON header {header!r}')
+    return json.loads(data.decode('utf-8'), cls=decoder)
+
+
+def train_dictionary(samples, size=ZDICT_MAX_SIZE):
+    """
+    Build a zlib preset dictionary from sample decks. The most frequent JSON
+    fragments and word runs are kept, ordered so the most valuable ones sit at
+    the end of the dictionary where zlib references them most cheaply.
+    """
+    counts = Counter()
+    for sample in samples:
+        text = json.dumps(sample, separators=(',', ':'), ensure_ascii=False)
+        counts.update(re.findall(r'"\w+":"?|\},\{"|\]\}|(?:\w+[ ,.]){1,4}', text))
+
+    scored = sorted(
+        ((count * len(fragment), fragment) for fragment, count in counts.items() if count > 1),
+        reverse=True,
+    )
+    chosen, total = [], 0
+    for _, fragment in scored:
+        encoded = fragment.encode('utf-8')
+        if total + len(encoded) > size:
+            break
+        chosen.append(encoded)
+        total += len(encoded)
+    return b''.join(reversed(chosen))
+
+
+class CompressedJSONField(models.JSONField):
+    """
+    A JSONField stored as a binary column. Values above
+    ZLIDE_JSON_COMPRESSION_THRESHOLD bytes are zlib compressed, optionally with
+    a preset dictionary trained on existing decks. Reads and writes go through
+    Python, so serializers see the same values as with a plain JSONField, but
+    database-side JSON key lookups are not available.
+    """
+    description = 'A compressed JSON object'
+
+    def _check_supported(self, databases):
+        return []
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def get_placeholder(self, value, compiler, connection):
+        return connection.ops.binary_placeholder_sql(value)
+
+    def get_transform(self, name):
+        return Field.get_transform(self, name)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return decompress_json(value, decoder=self.decoder)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if hasattr(value, 'as_sql'):
+            return value
+        return connection.Database.Binary(compress_json(value, encoder=self.encoder))
@@ -0,0 +1,316 @@
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.core.cache import cache
+from .llm import get_client
+from . import repair
+
+
+MODEL = "gpt-3.5-turbo"
+
+DECK_PROMPT = "Generate a {count} slide content for a Powerpoint presentation with slides, titles and content and convert them into a JSON array with each item having a slide, title, content about: {topic}"
+OUTLINE_PROMPT = "Write an outline for a {count} slide Powerpoint presentation about: {topic}. Reply with only a JSON array of {count} slide titles."
+SLIDE_PROMPT = (
+    'Write the content of slide {index} of {count}, titled "{title}", for a Powerpoint presentation about: {topic}. '
+    "The slide titles of the whole presentation are: {outline}. Only cover this slide's part. "
+    "Reply with only a JSON object with a title and a content."
+)
+
+REGENERATE_PROMPT = (
+    'Write new content of slide {index} of {count}, titled "{title}", for a Powerpoint presentation titled "{deck}". '
+    "{neighbours}{instructions}Reply with only a JSON object with a title and a content."
+)
+
+SUMMARY_PROMPT = (
+    "Summarize the following part of a longer document in at most {words} words. "
+    "Keep the facts, figures and names a presentation about the document would need.\n\n{chunk}"
+)
+DOCUMENT_PROMPT = (
+    "Generate a {count} slide content for a Powerpoint presentation with slides, titles and content from these notes on a document "
+    "and convert them into a JSON array with each item having a slide, title, content. Notes:\n\n{notes}"
+)
+
+CONTINUE_PROMPT = "Your reply was cut off. Continue exactly where it stopped, without repeating anything, and finish the JSON."
+
+
+class DocumentTooLong(Exception):
+    pass
+
+
+def _create(messages):
+    return get_client().chat.completions.create(model=MODEL, messages=messages)
+
+
+def complete(prompt):
+    return _create([{"role": "user", "content": prompt}]).choices[0].message.content
+
+
+def complete_json(prompt, validate, kind):
+    """
+    Ask for JSON and return the reply parsed, repaired and checked by
+    `validate`. Only when that fails is the model asked, once, to continue its
+    reply, which costs the missing tokens rather than a whole new completion.
+    """
+    messages = [{"role": "user", "content": prompt}]
+    text = _create(messages).choices[0].message.content or ''
+    try:
+        result, repaired = repair.parse_json(text, validate)
+    except repair.RepairFailed:
+        pass
+    else:
+        repair.record(kind, 'repaired' if repaired else 'clean')
+        return result
+
+    messages += [{"role": "assistant", "content": text}, {"role": "user", "content": CONTINUE_PROMPT}]
+    more = _create(messages).choices[0].message.content or ''
+    try:
+        # Prose before the JSON is in `text` too, parse_json() skips it the same way
+        result, _ = repair.parse_json(text + repair.strip_fences(more), validate)
+    except repair.RepairFailed:
+        repair.record(kind, 'failed')
+        raise
+    repair.record(kind, 'continued')
+    return result
+
+
+def _parse_slide(response, kind):
+    try:
+        slide, repaired = repair.parse_json(response, repair.validate_slide)
+    except repair.RepairFailed:
+        repair.record(kind, 'failed')
+        return None
+    repair.record(kind, 'repaired' if repaired else 'clean')
+    return slide
+
+
+def generate_deck(topic, count=5):
+    """
+    The whole deck from a single completion.
+    """
+    return complete_json(DECK_PROMPT.format(count=count, topic=topic), lambda value: repair.validate_slides(value, count), 'deck')
+
+
+def generate_outline(topic, count):
+    return complete_json(OUTLINE_PROMPT.format(count=count, topic=topic), lambda value: repair.validate_titles(value, count), 'outline')
+
+
+def expand_slide(topic, titles, index):
+    """
+    Write slide `index` (0 based) of an outline. Returns the slide as
+    {slide, title, content}.
+    """
+    title = titles[index]
+    response = complete(SLIDE_PROMPT.format(index=index + 1, count=len(titles), title=title, topic=topic, outline=json.dumps(titles)))
+    slide = _parse_slide(response, 'slide')
+    if slide is not None:
+        content = slide['content']
+    else:
+        # Not the JSON asked for, the text itself is still the slide
+        content = response.strip()
+    return {'slide': index + 1, 'title': title, 'content': content}
+
+
+def outline_concurrency(count):
+    """
+    Completions expand_outline() runs at once for a deck of `count` slides.
+    """
+    return min(settings.ZLIDE_GENERATE_EXPAND_CONCURRENCY, count)
+
+
+def expand_outline(topic, titles, concurrency=None):
+    """
+    Expand every slide of an outline with concurrent completions, at most
+    `concurrency` at a time. Yields slides as they finish, so not in order.
+    """
+    concurrency = concurrency or settings.ZLIDE_GENERATE_EXPAND_CONCURRENCY
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(titles))) as executor:
+        futures = [executor.submit(expand_slide, topic, titles, index) for index in range(len(titles))]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # A failed slide or a client gone mid stream, skip what has not started
+            for future in futures:
+                future.cancel()
+
+
+def generate_outlined_deck(topic, count):
+    """
+    Outline first, then every slide at once: the wall clock time is about the
+    outline plus the slowest slide rather than the whole deck in one go.
+    """
+    titles = generate_outline(topic, count)
+    return sorted(expand_outline(topic, titles), key=lambda slide: slide['slide'])
+
+
+def regenerate_slide(deck_title, slides, index, instructions=None):
+    """
+    Rewrite slide `index` (0 based) of a saved deck. Only the titles of the
+    neighbouring slides go into the prompt, so this costs about one slide's
+    worth of tokens whatever the size of the deck. Returns the slide with a
+    new title and content, its other keys kept.
+    """
+    def title_of(slide):
+        # Saved decks name the title either way, the download view reads header
+        return str(slide.get('title') or slide.get('header') or '') if isinstance(slide, dict) else ''
+
+    current = slides[index] if isinstance(slides[index], dict) else {'content': slides[index]}
+    neighbours = []
+    if index > 0:
+        neighbours.append(f'The previous slide is titled "{title_of(slides[index - 1])}". ')
+    if index < len(slides) - 1:
+        neighbours.append(f'The next slide is titled "{title_of(slides[index + 1])}". ')
+    prompt = REGENERATE_PROMPT.format(
+        index=index + 1,
+        count=len(slides),
+        title=title_of(current),
+        deck=deck_title,
+        neighbours=''.join(neighbours),
+        instructions=f'{instructions.strip()} ' if instructions else '',
+    )
+    response = complete(prompt)
+    generated = _parse_slide(response, 'slide')
+    slide = dict(current)
+    if generated is not None:
+        slide['content'] = generated['content']
+        if generated.get('title'):
+            slide['header' if 'header' in current and 'title' not in current else 'title'] = generated['title']
+    else:
+        slide['content'] = response.strip()
+    return slide
+
+
+def estimate_tokens(text):
+    # About four characters per token for English text
+    return (len(text) + 3) // 4
+
+
+def _pieces(paragraph, max_tokens):
+    """
+    Split a paragraph longer than `max_tokens` at sentence ends, and at word
+    boundaries when a single sentence is still too long.
+    """
+    if estimate_tokens(paragraph) <= max_tokens:
+        yield paragraph
+        return
+    piece = ''
+    for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+        words = sentence.split()
+        while estimate_tokens(' '.join(words)) > max_tokens:
+            # A sentence that does not fit on its own, cut it by words
+            size = 0
+            for count, word in enumerate(words):
+                size += len(word) + 1
+                if size > max_tokens * 4:
+                    break
+            head, words = words[:max(count, 1)], words[max(count, 1):]
+            if piece:
+                yield piece
+                piece = ''
+            yield ' '.join(head)
+        sentence = ' '.join(words)
+        if not sentence:
+            continue
+        if piece and estimate_tokens(piece + ' ' + sentence) > max_tokens:
+            yield piece
+            piece = sentence
+        else:
+            piece = f'{piece} {sentence}' if piece else sentence
+    if piece:
+        yield piece
+
+
+def _is_boundary(paragraph):
+    # Content defined: whether a paragraph may end a chunk depends on the
+    # paragraph alone, so an edit only moves the boundaries next to it
+    return int(hashlib.sha1(paragraph.encode('utf-8')).hexdigest()[:8], 16) % 4 == 0
+
+
+def split_document(text, max_tokens=None):
+    """
+    Cut a document into chunks of at most `max_tokens` estimated tokens along
+    paragraph boundaries. Unchanged stretches of an edited document give the
+    same chunks again, which keeps their cached summaries usable.
+    """
+    max_tokens = max_tokens or settings.ZLIDE_DOCUMENT_CHUNK_TOKENS
+    paragraphs = [piece for paragraph in re.split(r'\n\s*\n', text) if paragraph.strip()
+                  for piece in _pieces(' '.join(paragraph.split()), max_tokens)]
+    chunks, current, size = [], [], 0
+    for paragraph in paragraphs:
+        tokens = estimate_tokens(paragraph)
+        if current and size + tokens > max_tokens:
+            chunks.append('\n\n'.join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += tokens
+        if size >= max_tokens // 2 and _is_boundary(paragraph):
+            chunks.append('\n\n'.join(current))
+            current, size = [], 0
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+def _summary_key(chunk):
+    words = settings.ZLIDE_DOCUMENT_SUMMARY_WORDS
+    digest = hashlib.sha256(f'{MODEL}:{words}:{SUMMARY_PROMPT}:{chunk}'.encode('utf-8')).hexdigest()
+    return f'zlide:summary:{digest}'
+
+
+def summarize_chunks(chunks, max_calls=None):
+    """
+    Summarize every chunk, at most ZLIDE_DOCUMENT_MAP_CONCURRENCY at a time.
+    Summaries are cached by the hash of their chunk, so running an edited
+    document again only summarizes the chunks that changed. Raises
+    DocumentTooLong, before any completion, when more than `max_calls` chunks
+    are not cached. Returns the summaries in order and how many came from the
+    cache.
+    """
+    keys = [_summary_key(chunk) for chunk in chunks]
+    cached = cache.get_many(keys)
+    missing = [index for index, key in enumerate(keys) if key not in cached]
+    if max_calls is not None and len(missing) > max_calls:
+        raise DocumentTooLong('The document is too long to summarize, send a shorter text')
+
+    summaries = {key: cached[key] for key in keys if key in cached}
+    if missing:
+        words = settings.ZLIDE_DOCUMENT_SUMMARY_WORDS
+        with ThreadPoolExecutor(max_workers=min(settings.ZLIDE_DOCUMENT_MAP_CONCURRENCY, len(missing))) as executor:
+            results = executor.map(lambda index: complete(SUMMARY_PROMPT.format(words=words, chunk=chunks[index])).strip(), missing)
+            fresh = {keys[index]: summary for index, summary in zip(missing, results)}
+        cache.set_many(fresh, settings.ZLIDE_DOCUMENT_SUMMARY_CACHE_TIMEOUT)
+        summaries.update(fresh)
+    return [summaries[key] for key in keys], len(chunks) - len(missing)
+
+
+def document_concurrency(text):
+    """
+    Completions generate_document_deck() runs at once for `text`.
+    """
+    if estimate_tokens(text) <= settings.ZLIDE_DOCUMENT_REDUCE_TOKENS:
+        return 1
+    return min(settings.ZLIDE_DOCUMENT_MAP_CONCURRENCY, len(split_document(text)))
+
+
+def generate_document_deck(text, count, max_calls=None):
+    """
+    Map-reduce a long document into a deck: summarize its chunks in parallel,
+    summarize the summaries again while they are too long for one prompt,
+    then write the deck from them in a single completion. At most
+    `max_calls` completions are made, a document that needs more raises
+    DocumentTooLong.
+    """
+    # The deck and its continuation are kept out of the summaries' share
+    budget = (max_calls or settings.ZLIDE_DOCUMENT_MAX_CALLS) - 2
+    notes = text
+    # Each round shrinks the notes several times over, three are plenty
+    for _ in range(3):
+        if estimate_tokens(notes) <= settings.ZLIDE_DOCUMENT_REDUCE_TOKENS:
+            break
+        chunks = split_document(notes)
+        summaries, cached = summarize_chunks(chunks, max_calls=max(budget, 0))
+        budget -= len(chunks) - cached
+        notes = '\n\n'.join(summaries)
+    return complete_json(DOCUMENT_PROMPT.format(count=count, notes=notes), lambda value: repair.validate_slides(value, count), 'deck')
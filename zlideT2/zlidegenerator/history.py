@@ -0,0 +1,117 @@
+import difflib
+import hashlib
+import json
+from datetime import timedelta
+from django.utils import timezone
+from .models import SlideBlob, PresentationVersion
+
+
+# A reused blob's last_referenced is only rewritten once it is this old, so
+# saving a deck over and over does not write every slide each time.
+# collect_slide_blobs() must only delete blobs unreferenced for longer
+REFERENCE_INTERVAL = timedelta(minutes=10)
+
+
+def slide_digest(slide):
+    canonical = json.dumps(slide, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _split(json_data):
+    """
+    Returns (slides, is_list, wrapper). A {"slides": [...]} deck is split into
+    its slides plus the object around them, with slides set to None, so the
+    other keys are stored once per version rather than in every slide.
+    """
+    if isinstance(json_data, str):
+        try:
+            json_data = json.loads(json_data)
+        except ValueError:
+            pass
+    if isinstance(json_data, list):
+        return json_data, True, None
+    if isinstance(json_data, dict) and isinstance(json_data.get('slides'), list):
+        return json_data['slides'], False, dict(json_data, slides=None)
+    return [json_data], False, None
+
+
+def record_versions(items, blob_model=SlideBlob, version_model=PresentationVersion, using='default'):
+    """
+    Record a version for each (presentation_id, version, title, json_data)
+    item. Only slides that are not stored yet get a new blob, so an edit costs
+    one blob per changed slide plus the list of digests.
+    """
+    blobs, versions = {}, []
+    for presentation_id, version, title, json_data in items:
+        slides, is_list, wrapper = _split(json_data)
+        digests = []
+        for slide in slides:
+            digest = slide_digest(slide)
+            blobs.setdefault(digest, slide)
+            digests.append(digest)
+        versions.append(version_model(presentation_id=presentation_id, version=version, title=title, slides=digests, is_list=is_list, wrapper=wrapper))
+    if not versions:
+        return
+
+    # Mark the blobs this version reuses first, so collect_slide_blobs() cannot delete
+    # them between this check and the version insert below
+    now = timezone.now()
+    blob_model.objects.using(using).filter(digest__in=list(blobs), last_referenced__lt=now - REFERENCE_INTERVAL).update(last_referenced=now)
+    existing = set(blob_model.objects.using(using).filter(digest__in=list(blobs)).values_list('digest', flat=True))
+    # Blobs are content addressed, one inserted by a concurrent save is the same blob
+    blob_model.objects.using(using).bulk_create(
+        [blob_model(digest=digest, data=slide) for digest, slide in blobs.items() if digest not in existing],
+        ignore_conflicts=True,
+    )
+    version_model.objects.using(using).bulk_create(versions)
+
+
+def record_version(presentation, json_data=None, version=None):
+    record_versions([(
+        presentation.pk,
+        presentation.version if version is None else version,
+        presentation.title,
+        presentation.json_data if json_data is None else json_data,
+    )])
+
+
+def load_slides(digests):
+    blobs = dict(SlideBlob.objects.filter(digest__in=set(digests)).values_list('digest', 'data'))
+    return [blobs[digest] for digest in digests]
+
+
+def materialize(presentation_version):
+    slides = load_slides(presentation_version.slides)
+    if presentation_version.is_list:
+        return slides
+    if presentation_version.wrapper is not None:
+        return dict(presentation_version.wrapper, slides=slides)
+    return slides[0]
+
+
+def diff_versions(old, new):
+    """
+    Slide level diff between two versions. Unchanged runs are summarised,
+    changed slides are returned with their content.
+    """
+    matcher = difflib.SequenceMatcher(a=old.slides, b=new.slides, autojunk=False)
+    changed = set()
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            changed.update(old.slides[i1:i2])
+            changed.update(new.slides[j1:j2])
+    blobs = dict(SlideBlob.objects.filter(digest__in=changed).values_list('digest', 'data'))
+
+    changes = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        change = {'op': tag, 'from_slides': [i1, i2], 'to_slides': [j1, j2]}
+        if tag != 'equal':
+            change['removed'] = [blobs[digest] for digest in old.slides[i1:i2]]
+            change['added'] = [blobs[digest] for digest in new.slides[j1:j2]]
+        changes.append(change)
+    return {
+        'from_version': old.version,
+        'to_version': new.version,
+        'title_changed': old.title != new.title,
+        'changes': changes,
+    }
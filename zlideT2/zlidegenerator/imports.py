@@ -0,0 +1,214 @@
+import posixpath
+import time
+import zipfile
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import PowerPointPresentation, PresentationData
+
+
+P = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+R = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_RELS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+TITLE_PLACEHOLDERS = ('title', 'ctrTitle')
+
+
+class ImportFailed(Exception):
+    pass
+
+
+def queue_import(upload, title):
+    """
+    Store an uploaded .pptx and queue it for `manage.py import_presentations`,
+    which runs as its own worker process so parsing never holds a web thread.
+    The storage backend copies the upload in chunks, so large files are never
+    held in memory.
+    """
+    return PowerPointPresentation.objects.create(text='', file=upload, title=title[:255], size=upload.size)
+
+
+def time_budget(size, slide_count):
+    """
+    Seconds an import may take, growing with the file size and slide count.
+    """
+    return (settings.ZLIDE_IMPORT_TIME_BASE
+            + size / (1024 * 1024) * settings.ZLIDE_IMPORT_TIME_PER_MB
+            + slide_count * settings.ZLIDE_IMPORT_TIME_PER_SLIDE)
+
+
+def _parse(archive, name):
+    from defusedxml import ElementTree
+
+    try:
+        info = archive.getinfo(name)
+    except KeyError:
+        raise ImportFailed(f'{name} is missing, this is not a PowerPoint file')
+    # Checked before decompressing, a tiny zip can expand to gigabytes
+    if info.file_size > settings.ZLIDE_IMPORT_MAX_PART_SIZE:
+        raise ImportFailed(f'{name} is too large')
+    with archive.open(info) as f:
+        return ElementTree.parse(f).getroot()
+
+
+def slide_parts(archive):
+    """
+    Names of the slide parts of an open .pptx archive, in presentation order.
+    """
+    presentation = _parse(archive, 'ppt/presentation.xml')
+    relationships = _parse(archive, 'ppt/_rels/presentation.xml.rels')
+    targets = {rel.get('Id'): rel.get('Target') for rel in relationships.iter(f'{PACKAGE_RELS}Relationship')}
+    parts = []
+    for slide_id in presentation.iter(f'{P}sldId'):
+        target = targets.get(slide_id.get(f'{R}id'))
+        if not target:
+            continue
+        if target.startswith('/'):
+            parts.append(target.lstrip('/'))
+        else:
+            parts.append(posixpath.normpath(posixpath.join('ppt', target)))
+    return parts
+
+
+def _paragraphs(element):
+    for paragraph in element.iter(f'{A}p'):
+        text = ''.join(run.text or '' for run in paragraph.iter(f'{A}t')).strip()
+        if text:
+            yield paragraph, text
+
+
+def slide_text(root):
+    """
+    Return (title, content) of a slide part: the text of its title
+    placeholder, and every other paragraph including tables, one per line.
+    """
+    title_shape = None
+    for shape in root.iter(f'{P}sp'):
+        placeholder = shape.find(f'{P}nvSpPr/{P}nvPr/{P}ph')
+        if placeholder is not None and placeholder.get('type') in TITLE_PLACEHOLDERS:
+            title_shape = shape
+            break
+
+    title_paragraphs = set()
+    title = ''
+    if title_shape is not None:
+        texts = []
+        for paragraph, text in _paragraphs(title_shape):
+            title_paragraphs.add(paragraph)
+            texts.append(text)
+        title = ' '.join(texts)
+    content = [text for paragraph, text in _paragraphs(root) if paragraph not in title_paragraphs]
+    return title, '\n'.join(content)
+
+
+def extract_slides(fileobj, size, progress=None):
+    """
+    Read the slide titles and text of a .pptx file. Only the XML parts are
+    decompressed, images and other media are never read. `progress` is
+    called with (slides done, slide count). Raises ImportFailed when the file
+    is not a presentation, has too many slides or runs out of time.
+    """
+    start = time.monotonic()
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ImportFailed('The file is not a .pptx presentation')
+
+    with archive:
+        parts = slide_parts(archive)
+        if len(parts) > settings.ZLIDE_IMPORT_MAX_SLIDES:
+            raise ImportFailed(f'The presentation has {len(parts)} slides, at most {settings.ZLIDE_IMPORT_MAX_SLIDES} can be imported')
+        deadline = start + time_budget(size, len(parts))
+        if progress:
+            progress(0, len(parts))
+
+        slides = []
+        for index, name in enumerate(parts, start=1):
+            if time.monotonic() > deadline:
+                raise ImportFailed(f'The import took longer than {time_budget(size, len(parts)):.0f} seconds')
+            title, content = slide_text(_parse(archive, name))
+            slides.append({'slide': index, 'title': title or f'Slide {index}', 'content': content})
+            if progress:
+                progress(index, len(parts))
+        return slides
+
+
+def _claim():
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.ZLIDE_IMPORT_CLAIM_TIMEOUT)
+    due = PowerPointPresentation.objects.filter(
+        Q(status=PowerPointPresentation.PENDING) |
+        Q(status=PowerPointPresentation.PROCESSING, claimed_at__lt=stale)
+    ).order_by('created_at')
+    for pk in due.values_list('pk', flat=True)[:10]:
+        # Only one worker wins the update for a given import
+        claimed = PowerPointPresentation.objects.filter(pk=pk).filter(
+            Q(status=PowerPointPresentation.PENDING) |
+            Q(status=PowerPointPresentation.PROCESSING, claimed_at__lt=stale)
+        ).update(status=PowerPointPresentation.PROCESSING, claimed_at=now, attempts=F('attempts') + 1)
+        if claimed:
+            return PowerPointPresentation.objects.get(pk=pk)
+    return None
+
+
+def _finish(job, **fields):
+    fields['finished_at'] = timezone.now()
+    # The slides are in the deck now, or the file could not be read, either way it is not needed again
+    PowerPointPresentation.objects.filter(pk=job.pk).update(file='', **fields)
+    if job.file:
+        try:
+            job.file.storage.delete(job.file.name)
+        except (OSError, NotImplementedError):
+            pass
+
+
+def process_import(job):
+    """
+    Parse one claimed import into a new PresentationData deck.
+    """
+    if job.attempts > settings.ZLIDE_IMPORT_MAX_ATTEMPTS:
+        # A file that keeps killing the worker is given up on
+        _finish(job, status=PowerPointPresentation.FAILED, error='The import was interrupted too many times')
+        return False
+
+    last_update = 0.0
+
+    def progress(done, count):
+        nonlocal last_update
+        now = time.monotonic()
+        if done in (0, count) or now - last_update >= settings.ZLIDE_IMPORT_PROGRESS_INTERVAL:
+            last_update = now
+            PowerPointPresentation.objects.filter(pk=job.pk).update(slides_done=done, slide_count=count, claimed_at=timezone.now())
+
+    try:
+        with job.file.open('rb') as f:
+            slides = extract_slides(f, job.size or job.file.size, progress)
+    except ImportFailed as e:
+        _finish(job, status=PowerPointPresentation.FAILED, error=str(e))
+        return False
+    except Exception as e:
+        _finish(job, status=PowerPointPresentation.FAILED, error=f'The presentation could not be read: {e}')
+        return False
+
+    presentation = PresentationData.objects.create(title=job.title or 'title', json_data=slides)
+    _finish(job, status=PowerPointPresentation.DONE, presentation=presentation, error='')
+    return True
+
+
+def run_imports(limit=None):
+    """
+    Process pending imports one at a time, at most `limit` of them. Returns
+    (imported, failed).
+    """
+    imported = failed = 0
+    while limit is None or imported + failed < limit:
+        job = _claim()
+        if job is None:
+            break
+        if process_import(job):
+            imported += 1
+        else:
+            failed += 1
+    return imported, failed
@@ -0,0 +1,75 @@
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the chat completion client, created on first use. ZLIDE_LLM_CLIENT
+    can name another client class with the same interface, e.g. StubClient for
+    load tests.
+    """
+    path = getattr(settings, 'ZLIDE_LLM_CLIENT', None) or 'openai.OpenAI'
+    client = _clients.get(path)
+    if client is None:
+        with _lock:
+            client = _clients.get(path)
+            if client is None:
+                client = _clients[path] = import_string(path)()
+    return client
+
+
+class _StubCompletions:
+    def create(self, model=None, messages=(), **kwargs):
+        # A continuation request repeats the prompt and the reply so far
+        prompt = messages[0]['content'] if messages else ''
+        outline = re.search(r'outline for a (\d+) slide', prompt)
+        single = re.search(r'content of slide (\d+) of \d+, titled "(.*?)"', prompt)
+        if prompt.startswith('Summarize'):
+            chunk = prompt.split('\n\n', 1)[-1]
+            content = 'Summary: ' + ' '.join(chunk.split()[:100])
+        elif outline:
+            content = json.dumps([f'Slide {idx}' for idx in range(1, int(outline.group(1)) + 1)])
+        elif single:
+            idx = int(single.group(1))
+            content = json.dumps({'title': single.group(2), 'content': f'Generated content for slide {idx}. ' * 8})
+        else:
+            match = re.search(r'(\d+) slide', prompt)
+            count = int(match.group(1)) if match else 5
+            slides = [
+                {'slide': idx, 'title': f'Slide {idx}', 'content': f'Generated content for slide {idx}. ' * 8}
+                for idx in range(1, count + 1)
+            ]
+            content = json.dumps(slides)
+
+        finish_reason = 'stop'
+        if len(messages) > 2 and messages[1]['role'] == 'assistant':
+            content = content[len(messages[1]['content']):]
+        max_tokens = getattr(settings, 'ZLIDE_STUB_LLM_MAX_TOKENS', 0)
+        if max_tokens and len(content) > max_tokens * 4:
+            content = content[:max_tokens * 4]
+            finish_reason = 'length'
+        # Roughly what a hosted model costs: a fixed round trip plus time per output token
+        tokens = len(content) // 4
+        time.sleep(settings.ZLIDE_STUB_LLM_LATENCY + tokens * settings.ZLIDE_STUB_LLM_TOKEN_LATENCY)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish_reason)],
+            usage=SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=tokens, total_tokens=len(prompt) // 4 + tokens),
+        )
+
+
+class StubClient:
+    """
+    Offline stand-in for openai.OpenAI that answers slide prompts with canned
+    decks after a configurable delay.
+    """
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=_StubCompletions())
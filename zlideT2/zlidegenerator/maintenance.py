@@ -0,0 +1,237 @@
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import NotSupportedError, connections, transaction
+from django.db.models import Exists, F, Lookup, OuterRef, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+from users.outbox import prune_emails
+from .history import REFERENCE_INTERVAL
+from .models import PresentationData, PresentationVersion, SlideBlob, PowerPointPresentation
+
+
+def purge_deleted_presentations(batch_size=500, grace=timedelta(0), pause=0.0):
+    """
+    Physically delete soft deleted presentations older than `grace`, a small
+    batch per transaction so the table is never locked for long. The
+    post_delete receivers drop the search index rows and cache entries.
+    Returns (presentations purged, bytes of json_data reclaimed).
+    """
+    cutoff = timezone.now() - grace
+    purged = reclaimed = 0
+    while True:
+        batch = PresentationData.all_objects.filter(deleted_at__isnull=False, deleted_at__lte=cutoff)
+        ids = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return purged, reclaimed
+        queryset = PresentationData.all_objects.filter(pk__in=ids)
+        reclaimed += queryset.aggregate(size=Sum(Length('json_data')))['size'] or 0
+        queryset.only('id', 'title').delete()
+        purged += len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def expire_presentations(max_age):
+    """
+    Soft delete presentations that were neither created nor edited within
+    `max_age`. They are physically removed by the next purge.
+    """
+    cutoff = timezone.now() - max_age
+    stale = (
+        PresentationData.objects
+        .filter(created_at__lt=cutoff)
+        .exclude(versions__created_at__gte=cutoff)
+    )
+    return PresentationData.objects.filter(pk__in=stale.values('pk')).soft_delete()
+
+
+def prune_versions(max_age, batch_size=1000, pause=0.0):
+    """
+    Delete versions older than `max_age`, always keeping each presentation's
+    current version.
+    """
+    cutoff = timezone.now() - max_age
+    pruned = 0
+    while True:
+        old = (
+            PresentationVersion.objects
+            .filter(created_at__lt=cutoff)
+            .exclude(version=F('presentation__version'))
+        )
+        ids = list(old.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return pruned
+        PresentationVersion.objects.filter(pk__in=ids).delete()
+        pruned += len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+class _ContainsDigest(Lookup):
+    """
+    Holds when a JSON array of digests contains the right hand side, worked
+    out by the database so the digests never have to be loaded. Only
+    implemented for SQLite and PostgreSQL.
+    """
+    lookup_name = 'contains_digest'
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        raise NotSupportedError(f'contains_digest is not supported on {connection.vendor}')
+
+    def as_sqlite(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'EXISTS (SELECT 1 FROM json_each({lhs}) WHERE value = {rhs})', (*lhs_params, *rhs_params)
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} ? {rhs}', (*lhs_params, *rhs_params)
+
+
+def collect_slide_blobs(min_age=timedelta(hours=1), batch_size=1000, pause=0.0):
+    """
+    Delete slide blobs no version refers to any more. Blobs created or reused
+    by a version within `min_age` are left alone, so a version being written
+    right now cannot lose its slides. `min_age` is never shorter than
+    history.REFERENCE_INTERVAL, the granularity record_versions() marks reuse
+    at. Returns (blobs deleted, bytes reclaimed).
+    """
+    if connections[SlideBlob.objects.db].vendor not in ('sqlite', 'postgresql'):
+        return 0, 0
+    referenced = PresentationVersion.objects.filter(_ContainsDigest(F('slides'), OuterRef('digest')))
+    cutoff = timezone.now() - max(min_age, REFERENCE_INTERVAL)
+    deleted = reclaimed = 0
+    while True:
+        orphans = SlideBlob.objects.filter(~Exists(referenced), last_referenced__lt=cutoff)
+        with transaction.atomic():
+            digests = list(orphans.values_list('digest', flat=True)[:batch_size])
+            if not digests:
+                return deleted, reclaimed
+            # The DELETE checks the age and the references again, a blob reused since the
+            # SELECT has had its last_referenced touched by record_versions() and is kept
+            queryset = orphans.filter(digest__in=digests)
+            reclaimed += queryset.aggregate(size=Sum(Length('data')))['size'] or 0
+            deleted += queryset.delete()[0]
+        if pause:
+            time.sleep(pause)
+
+
+def _delete_file(storage, name):
+    try:
+        size = storage.size(name)
+        storage.delete(name)
+        return size
+    except (OSError, NotImplementedError):
+        return 0
+
+
+def expire_uploads(max_age, batch_size=100):
+    """
+    Delete finished PowerPointPresentation rows older than `max_age` along
+    with their files. Imports still pending or being processed are kept, those
+    no worker has touched for ZLIDE_IMPORT_CLAIM_TIMEOUT are marked failed so a
+    later run can delete them. Returns (rows deleted, bytes reclaimed).
+    """
+    now = timezone.now()
+    cutoff = now - max_age
+    stale = now - timedelta(seconds=settings.ZLIDE_IMPORT_CLAIM_TIMEOUT)
+    unfinished = (PowerPointPresentation.PENDING, PowerPointPresentation.PROCESSING)
+    PowerPointPresentation.objects.filter(created_at__lt=cutoff, status__in=unfinished).exclude(claimed_at__gte=stale).update(
+        status=PowerPointPresentation.FAILED, error='The import was abandoned', finished_at=now)
+    deleted = reclaimed = 0
+    while True:
+        expired = PowerPointPresentation.objects.filter(created_at__lt=cutoff).exclude(status__in=unfinished).exclude(finished_at=now)
+        batch = list(expired.only('id', 'file')[:batch_size])
+        if not batch:
+            return deleted, reclaimed
+        for upload in batch:
+            if upload.file:
+                reclaimed += _delete_file(upload.file.storage, upload.file.name)
+        PowerPointPresentation.objects.filter(pk__in=[upload.pk for upload in batch]).delete()
+        deleted += len(batch)
+
+
+def sweep_orphaned_media(min_age=timedelta(hours=1), directory='presentations'):
+    """
+    Delete files under MEDIA_ROOT/<directory> that no PowerPointPresentation
+    refers to. Returns (files deleted, bytes reclaimed).
+    """
+    try:
+        _, files = default_storage.listdir(directory)
+    except (FileNotFoundError, NotImplementedError):
+        return 0, 0
+    referenced = set(PowerPointPresentation.objects.values_list('file', flat=True))
+    cutoff = timezone.now() - max(min_age, REFERENCE_INTERVAL)
+    deleted = reclaimed = 0
+    for filename in files:
+        name = f'{directory}/{filename}'
+        if name in referenced:
+            continue
+        try:
+            if default_storage.get_modified_time(name) > cutoff:
+                continue
+        except (OSError, NotImplementedError):
+            continue
+        reclaimed += _delete_file(default_storage, name)
+        deleted += 1
+    return deleted, reclaimed
+
+
+def sweep_temp_files(max_age, directory, pattern='*.pptx'):
+    """
+    Delete exported files in `directory` older than `max_age`, left behind by
+    downloads that never finished. Returns (files deleted, bytes reclaimed).
+    """
+    cutoff = time.time() - max_age.total_seconds()
+    deleted = reclaimed = 0
+    for path in Path(directory).glob(pattern):
+        try:
+            stat = path.stat()
+            if not path.is_file() or stat.st_mtime > cutoff:
+                continue
+            os.remove(path)
+        except OSError:
+            continue
+        deleted += 1
+        reclaimed += stat.st_size
+    return deleted, reclaimed
+
+
+def enforce_retention(batch_size=500, pause=0.0):
+    """
+    Apply the ZLIDE_RETENTION_* settings. A setting of 0 disables that policy.
+    Returns a dict of what was removed and how many bytes were reclaimed.
+    """
+    report = {}
+    if settings.ZLIDE_RETENTION_PRESENTATION_DAYS:
+        report['presentations_expired'] = expire_presentations(timedelta(days=settings.ZLIDE_RETENTION_PRESENTATION_DAYS))
+
+    purged, purged_bytes = purge_deleted_presentations(
+        batch_size=batch_size, grace=timedelta(seconds=settings.ZLIDE_PURGE_GRACE_SECONDS), pause=pause,
+    )
+    report['presentations_purged'] = purged
+    report['presentation_bytes'] = purged_bytes
+
+    if settings.ZLIDE_RETENTION_VERSION_DAYS:
+        report['versions_pruned'] = prune_versions(timedelta(days=settings.ZLIDE_RETENTION_VERSION_DAYS), pause=pause)
+
+    report['slide_blobs_deleted'], report['slide_blob_bytes'] = collect_slide_blobs(pause=pause)
+
+    if settings.ZLIDE_RETENTION_UPLOAD_DAYS:
+        report['uploads_deleted'], report['upload_bytes'] = expire_uploads(timedelta(days=settings.ZLIDE_RETENTION_UPLOAD_DAYS))
+    report['orphaned_media_deleted'], report['orphaned_media_bytes'] = sweep_orphaned_media()
+
+    if settings.EMAIL_OUTBOX_RETENTION_HOURS:
+        report['emails_deleted'] = prune_emails(timedelta(hours=settings.EMAIL_OUTBOX_RETENTION_HOURS))
+
+    report['temp_files_deleted'], report['temp_file_bytes'] = sweep_temp_files(
+        timedelta(hours=settings.ZLIDE_RETENTION_TEMP_FILE_HOURS), settings.ZLIDE_EXPORT_DIR,
+    )
+    report['bytes_reclaimed'] = sum(value for key, value in report.items() if key.endswith('_bytes'))
+    return report
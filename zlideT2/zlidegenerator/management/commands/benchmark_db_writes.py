@@ -0,0 +1,73 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from zlidegenerator.signals import apply_sqlite_pragmas
+
+
+DECK = json.dumps([{'slide': idx, 'title': f'Slide {idx}', 'content': 'lorem ipsum ' * 40} for idx in range(5)])
+
+
+def _worker(path, pragmas, timeout, writes, reads_per_write):
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    cursor = connection.cursor()
+    if pragmas:
+        apply_sqlite_pragmas(cursor, pragmas)
+    ok = locked = 0
+    for _ in range(writes):
+        try:
+            for _ in range(reads_per_write):
+                cursor.execute('SELECT id, title FROM deck ORDER BY id DESC LIMIT 20').fetchall()
+            cursor.execute('BEGIN')
+            cursor.execute('INSERT INTO deck (title, json_data) VALUES (?, ?)', ('title', DECK))
+            cursor.execute('COMMIT')
+            ok += 1
+        except sqlite3.OperationalError:
+            if connection.in_transaction:
+                cursor.execute('ROLLBACK')
+            locked += 1
+    connection.close()
+    return ok, locked
+
+
+class Command(BaseCommand):
+    help = 'Measures concurrent SQLite write throughput with the default settings and with SQLITE_PRAGMAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent processes, like gunicorn workers')
+        parser.add_argument('--writes', type=int, default=500, help='Inserts per worker')
+        parser.add_argument('--reads-per-write', type=int, default=3)
+
+    def _run(self, pragmas, timeout, options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.sqlite3')
+            connection = sqlite3.connect(path)
+            if pragmas:
+                apply_sqlite_pragmas(connection.cursor(), pragmas)
+            connection.execute('CREATE TABLE deck (id INTEGER PRIMARY KEY, title TEXT, json_data TEXT)')
+            connection.commit()
+            connection.close()
+
+            args = [(path, pragmas, timeout, options['writes'], options['reads_per_write'])] * options['workers']
+            start = time.perf_counter()
+            with multiprocessing.get_context('fork').Pool(options['workers']) as pool:
+                results = pool.starmap(_worker, args)
+            elapsed = time.perf_counter() - start
+        ok = sum(result[0] for result in results)
+        locked = sum(result[1] for result in results)
+        return ok, locked, elapsed
+
+    def handle(self, *args, **options):
+        runs = [
+            # Django's defaults: rollback journal, synchronous=FULL and a 5 second timeout
+            ('default', {}, 5),
+            ('tuned', settings.SQLITE_PRAGMAS, settings.DATABASES['default'].get('OPTIONS', {}).get('timeout', 20)),
+        ]
+        self.stdout.write(f"{options['workers']} workers x {options['writes']} writes, {options['reads_per_write']} reads per write")
+        for name, pragmas, timeout in runs:
+            ok, locked, elapsed = self._run(pragmas, timeout, options)
+            self.stdout.write(f'{name:>8}: {ok / elapsed:8.0f} writes/s, {locked} "database is locked" errors, {elapsed:.2f}s')
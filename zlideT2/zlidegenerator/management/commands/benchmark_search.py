@@ -0,0 +1,71 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import setup_databases, teardown_databases
+from zlidegenerator.models import PresentationData
+from zlidegenerator import search
+
+
+WORDS = (
+    'energy solar wind market growth revenue strategy customer product design cloud data '
+    'security network learning model training research history science biology chemistry '
+    'physics economy policy health education finance budget roadmap launch team culture '
+    'quarter forecast analysis risk innovation ocean climate city transport software'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Seeds a throwaway test database with synthetic decks and measures full-text search latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--decks', type=int, default=100000)
+        parser.add_argument('--slides', type=int, default=5)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def _deck(self, rng, slides):
+        return [
+            {
+                'slide': idx + 1,
+                'title': ' '.join(rng.choices(WORDS, k=3)).capitalize(),
+                'content': ' '.join(rng.choices(WORDS, k=40)),
+            }
+            for idx in range(slides)
+        ]
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            start = time.perf_counter()
+            remaining = options['decks']
+            while remaining > 0:
+                size = min(options['batch_size'], remaining)
+                with transaction.atomic():
+                    decks = PresentationData.objects.bulk_create(
+                        PresentationData(title=' '.join(rng.choices(WORDS, k=2)), json_data=self._deck(rng, options['slides']))
+                        for _ in range(size)
+                    )
+                    search.index_presentations(decks)
+                remaining -= size
+            build_time = time.perf_counter() - start
+
+            queries = [' '.join(rng.choices(WORDS, k=rng.randint(1, 2))) for _ in range(options['queries'])]
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                search.search(query, limit=20, offset=rng.choice([0, 0, 20, 100]))
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+
+            self.stdout.write(f"backend: {connection.vendor}")
+            self.stdout.write(f"decks indexed: {options['decks']} in {build_time:.1f}s ({options['decks'] / build_time:.0f} decks/s)")
+            self.stdout.write(f"queries: {len(timings)}")
+            self.stdout.write(f"p50: {statistics.median(timings):.2f} ms")
+            self.stdout.write(f"p95: {timings[int(len(timings) * 0.95) - 1]:.2f} ms")
+            self.stdout.write(f"p99: {timings[int(len(timings) * 0.99) - 1]:.2f} ms")
+        finally:
+            teardown_databases(old_config, verbosity=0)
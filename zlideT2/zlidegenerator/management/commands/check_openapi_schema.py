@@ -0,0 +1,37 @@
+import difflib
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from zlideT2.schema import generate_schema, render_yaml
+
+
+class Command(BaseCommand):
+    help = 'Regenerates the OpenAPI schema and fails when the checked-in schema.yml no longer matches the code'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=str(settings.BASE_DIR / 'schema.yml'))
+        parser.add_argument('--write', action='store_true', help='Update the file instead of failing on drift')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        generated = render_yaml(generate_schema())
+        try:
+            with open(path, 'rb') as f:
+                current = f.read()
+        except FileNotFoundError:
+            current = b''
+
+        if current == generated:
+            self.stdout.write(self.style.SUCCESS(f'{path} is up to date'))
+            return
+        if options['write']:
+            with open(path, 'wb') as f:
+                f.write(generated)
+            self.stdout.write(self.style.SUCCESS(f'{path} updated'))
+            return
+
+        diff = difflib.unified_diff(
+            current.decode('utf-8').splitlines(), generated.decode('utf-8').splitlines(),
+            fromfile=path, tofile='generated', lineterm='',
+        )
+        self.stdout.write('\n'.join(list(diff)[:200]))
+        raise CommandError(f'{path} is out of date, run `manage.py check_openapi_schema --write`')
@@ -0,0 +1,58 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from zlidegenerator.fields import compress_json, decompress_json
+from zlidegenerator.models import PresentationData
+
+
+class Command(BaseCommand):
+    help = 'Reports the json_data storage ratio and encode/decode latency, optionally rewriting rows with the current settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recompress', action='store_true', help='Rewrite every row with the current threshold and dictionary')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        table = PresentationData._meta.db_table
+        raw_bytes = stored_bytes = rows = 0
+        encode_time = decode_time = 0.0
+        batch = []
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id, json_data FROM {table}')
+            for pk, stored in cursor:
+                start = time.perf_counter()
+                value = decompress_json(stored)
+                decode_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                encoded = compress_json(value)
+                encode_time += time.perf_counter() - start
+
+                raw_bytes += len(json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+                stored_bytes += len(encoded if options['recompress'] else stored)
+                rows += 1
+
+                if options['recompress']:
+                    batch.append(PresentationData(pk=pk, json_data=value))
+                    if len(batch) >= options['batch_size']:
+                        self._write(batch)
+                        batch = []
+        if batch:
+            self._write(batch)
+
+        if not rows:
+            self.stdout.write('No presentations stored')
+            return
+        self.stdout.write(f'rows: {rows}')
+        self.stdout.write(f'json bytes: {raw_bytes}')
+        self.stdout.write(f'stored bytes: {stored_bytes}')
+        self.stdout.write(f'ratio: {raw_bytes / max(stored_bytes, 1):.2f}x')
+        self.stdout.write(f'decode: {decode_time / rows * 1e6:.1f} us/row')
+        self.stdout.write(f'encode: {encode_time / rows * 1e6:.1f} us/row')
+
+    def _write(self, batch):
+        with transaction.atomic():
+            # The default manager hides soft deleted rows, which were read above too
+            PresentationData._base_manager.bulk_update(batch, ['json_data'])
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from zlidegenerator.maintenance import enforce_retention
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired presentations, old versions, unused slide blobs, uploads, sent emails and temporary files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between batches')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and enforce the policies every INTERVAL seconds (for a worker process)')
+
+    def handle(self, *args, **options):
+        while True:
+            report = enforce_retention(batch_size=options['batch_size'], pause=options['pause'])
+            for key, value in report.items():
+                self.stdout.write(f'{key}: {value}')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from zlidegenerator.imports import run_imports
+
+
+class Command(BaseCommand):
+    help = 'Imports uploaded .pptx files into editable decks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many imports')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and poll for uploads every INTERVAL seconds (for a worker process)')
+
+    def handle(self, *args, **options):
+        while True:
+            imported, failed = run_imports(limit=options['limit'])
+            if imported or failed or not options['interval']:
+                self.stdout.write(f'Imported {imported} presentations, {failed} failed')
+            if not options['interval']:
+                return
+            if not imported and not failed:
+                time.sleep(options['interval'])
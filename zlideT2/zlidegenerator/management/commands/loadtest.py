@@ -0,0 +1,392 @@
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import quote
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+DEFAULT_MIX = 'open=40,list=10,search=5,save=10,edit=10,generate=10,download=5,login=5,otp=5'
+PASSWORD = 'Load-test-1'
+WORDS = ('market', 'growth', 'strategy', 'product', 'customer', 'revenue', 'launch', 'team', 'design', 'roadmap')
+
+
+def _deck(rng, slides):
+    return {'slides': [
+        {'header': f'{rng.choice(WORDS).title()} {idx}', 'content': ' '.join(rng.choice(WORDS) for _ in range(60))}
+        for idx in range(slides)
+    ]}
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    # Nearest-rank percentile
+    index = min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))
+    return values[index]
+
+
+def _summary(samples, elapsed):
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, code in samples if code is None or (code >= 400 and code not in (412, 429)))
+    throttled = sum(1 for _, code in samples if code == 429)
+    # Edits that lost an optimistic concurrency race, the version check doing its job
+    conflicts = sum(1 for _, code in samples if code == 412)
+    return {
+        'requests': len(samples),
+        'throughput': round(len(samples) / elapsed, 2) if elapsed else 0,
+        'error_rate': round(errors / len(samples), 4) if samples else 0,
+        'throttled': throttled,
+        'conflicts': conflicts,
+        'status': {str(code): count for code, count in sorted(Counter(code or 'exception' for _, code in samples).items(), key=str)},
+        'latency_ms': {
+            name: round(value * 1000, 2) if value is not None else None
+            for name, value in (
+                ('p50', _percentile(latencies, 0.50)),
+                ('p95', _percentile(latencies, 0.95)),
+                ('p99', _percentile(latencies, 0.99)),
+                ('max', latencies[-1] if latencies else None),
+            )
+        },
+    }
+
+
+class QuietHandler(WSGIRequestHandler):
+    # Like gunicorn, send responses right away instead of waiting on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LoadTestServer(ThreadedWSGIServer):
+    request_queue_size = 256
+
+
+class Client:
+    """
+    One simulated user: a keep-alive HTTP connection plus the state it needs
+    to build realistic requests.
+    """
+    def __init__(self, command, worker, port):
+        self.command = command
+        self.worker = worker
+        self.port = port
+        self.rng = random.Random(command.seed * 1000 + worker)
+        self.user = self.rng.choice(command.users)
+        self.saved = 0
+        self.versions = {}
+        self.body = b''
+        self.connection = None
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Accept': 'application/json'}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                self.body = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.connection.close()
+                    self.connection = None
+                return response.status
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed the keep-alive connection, retry once on a new one
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    def generate(self):
+        # Signed in, every worker connects from 127.0.0.1 and would share one anonymous per-client cap
+        return self.request('POST', '/zlide/generatezlide/', {'text': f'{self.rng.choice(WORDS)} {self.rng.choice(WORDS)}'}, token=self.user['token'])
+
+    def save(self):
+        self.saved += 1
+        deck = _deck(self.rng, self.rng.randint(5, 20))
+        return self.request('POST', '/zlide/savezlide/', {'title': f'load-{self.worker}-{self.saved}-{time.time_ns()}', 'presentation_data': json.dumps(deck)})
+
+    def open(self):
+        return self.request('GET', f'/zlide/openzlide/{quote(self.rng.choice(self.command.titles))}/')
+
+    def edit(self):
+        title = self.rng.choice(self.command.titles)
+        body = {'json_data': _deck(self.rng, self.rng.randint(5, 20)), 'version': self.versions.get(title, 1)}
+        code = self.request('PATCH', f'/zlide/editzlide/{quote(title)}/', body)
+        if code in (200, 412):
+            # Both carry the current version, which the next edit of this deck sends
+            self.versions[title] = json.loads(self.body).get('version', body['version'])
+        return code
+
+    def download(self):
+        return self.request('GET', '/zlide/downloadzlide/', token=self.user['token'])
+
+    def list(self):
+        return self.request('GET', '/zlide/listzlide/?limit=20')
+
+    def search(self):
+        return self.request('GET', f'/zlide/searchzlide/?q={self.rng.choice(WORDS)}')
+
+    def login(self):
+        return self.request('POST', '/api/jwt/create/', {'email': self.user['email'], 'password': PASSWORD})
+
+    def otp(self):
+        return self.request('POST', '/api/login-with-otp/', {'email': self.user['email']}, token=self.user['token'])
+
+
+class Command(BaseCommand):
+    help = (
+        'Boots the app on a throwaway database with a stub LLM and an in-memory mail sink, '
+        'drives a mix of zlide and auth traffic at increasing concurrency and writes '
+        'p50/p95/p99 latency, throughput and error rates to a JSON report'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,4,16', help='Comma separated concurrency levels, one stage each')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per stage')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='Comma separated endpoint=weight pairs')
+        parser.add_argument('--decks', type=int, default=200, help='Decks created before the run')
+        parser.add_argument('--users', type=int, default=20, help='Users created before the run')
+        parser.add_argument('--llm-latency', type=float, default=None, help='Stub LLM round trip in seconds (default ZLIDE_STUB_LLM_LATENCY)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', default='loadtest-report.json')
+        parser.add_argument('--compare', help='Earlier report to compare against, fails on regressions')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative p95 / throughput change when comparing')
+        parser.add_argument('--min-samples', type=int, default=50, help='Endpoints with fewer requests are not compared')
+        parser.add_argument('--min-change-ms', type=float, default=5, help='p95 changes below this are treated as noise')
+
+    def _parse_mix(self, mix):
+        weights = {}
+        for pair in mix.split(','):
+            name, _, weight = pair.partition('=')
+            name = name.strip()
+            if not hasattr(Client, name) or name.startswith('_') or name in ('request', 'close'):
+                raise CommandError(f'Unknown endpoint in --mix: {name}')
+            weights[name] = float(weight or 1)
+        return weights
+
+    def _seed(self, options):
+        from users.models import UserAccount
+        from zlidegenerator.models import PresentationData
+
+        rng = random.Random(self.seed)
+        self.users = []
+        for idx in range(options['users']):
+            user = UserAccount.objects.create_user(email=f'load{idx}@example.com', username=f'load{idx}', password=PASSWORD)
+            self.users.append({'email': user.email, 'token': str(RefreshToken.for_user(user).access_token)})
+        self.titles = [f'deck-{idx}' for idx in range(options['decks'])]
+        for title in self.titles:
+            PresentationData.objects.create(title=title, json_data=_deck(rng, rng.randint(5, 20)))
+
+    def _mailer(self, stop):
+        # Drains the outbox like the mailer process, into an in-memory sink
+        from users.outbox import send_queued_emails
+
+        sink = EmailBackend()
+        while not stop.is_set():
+            try:
+                send_queued_emails(connection=sink)
+            finally:
+                connections.close_all()
+            stop.wait(0.5)
+
+    def _stage(self, port, concurrency, duration, weights):
+        names, cumulative = list(weights), []
+        total = 0
+        for name in names:
+            total += weights[name]
+            cumulative.append(total)
+
+        samples = {name: [] for name in names}
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def run(worker):
+            client = Client(self, worker, port)
+            local = {name: [] for name in names}
+            try:
+                while time.monotonic() < deadline:
+                    name = self._pick(client.rng, names, cumulative, total)
+                    start = time.perf_counter()
+                    try:
+                        code = getattr(client, name)()
+                    except Exception:
+                        code = None
+                    local[name].append((time.perf_counter() - start, code))
+            finally:
+                client.close()
+                with lock:
+                    for name, values in local.items():
+                        samples[name].extend(values)
+
+        start = time.monotonic()
+        threads = [threading.Thread(target=run, args=(worker,)) for worker in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        every = [sample for values in samples.values() for sample in values]
+        stage = {'concurrency': concurrency, 'duration': round(elapsed, 2), **_summary(every, elapsed)}
+        stage['endpoints'] = {name: _summary(values, elapsed) for name, values in samples.items() if values}
+        return stage
+
+    def _pick(self, rng, names, cumulative, total):
+        point = rng.random() * total
+        for name, bound in zip(names, cumulative):
+            if point < bound:
+                return name
+        return names[-1]
+
+    def _meta(self, options, weights):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connections['default'].vendor,
+            'cpus': os.cpu_count(),
+            'mix': weights,
+            'duration': options['duration'],
+            'decks': options['decks'],
+            'users': options['users'],
+            'llm_latency': settings.ZLIDE_STUB_LLM_LATENCY,
+            'seed': self.seed,
+        }
+
+    def _print(self, report):
+        for stage in report['stages']:
+            self.stdout.write(
+                f"concurrency {stage['concurrency']:>3}: {stage['throughput']:8.1f} req/s, "
+                f"p50 {stage['latency_ms']['p50']} ms, p95 {stage['latency_ms']['p95']} ms, "
+                f"p99 {stage['latency_ms']['p99']} ms, errors {stage['error_rate']:.2%}, throttled {stage['throttled']}, conflicts {stage['conflicts']}"
+            )
+            for name, summary in sorted(stage['endpoints'].items()):
+                self.stdout.write(
+                    f"    {name:>9}: {summary['requests']:6} req, p50 {summary['latency_ms']['p50']} ms, "
+                    f"p95 {summary['latency_ms']['p95']} ms, p99 {summary['latency_ms']['p99']} ms, errors {summary['error_rate']:.2%}"
+                )
+
+    def _compare(self, report, path, tolerance, min_samples, min_change_ms):
+        with open(path) as f:
+            baseline = json.load(f)
+        stages = {stage['concurrency']: stage for stage in baseline['stages']}
+        regressions = []
+        for stage in report['stages']:
+            before = stages.get(stage['concurrency'])
+            if before is None:
+                continue
+            pairs = [('all', before, stage)] + [
+                (name, before['endpoints'][name], summary)
+                for name, summary in stage['endpoints'].items() if name in before['endpoints']
+            ]
+            for name, old, new in pairs:
+                if min(old['requests'], new['requests']) < min_samples:
+                    continue
+                old_p95, new_p95 = old['latency_ms']['p95'], new['latency_ms']['p95']
+                change = (new_p95 - old_p95) / old_p95 if old_p95 else 0
+                self.stdout.write(f"c={stage['concurrency']:<3} {name:>9}: p95 {old_p95} -> {new_p95} ms ({change:+.0%})")
+                if change > tolerance and new_p95 - old_p95 > min_change_ms:
+                    regressions.append(f"c={stage['concurrency']} {name}: p95 {old_p95} -> {new_p95} ms")
+                if new['error_rate'] > old['error_rate'] + 0.01:
+                    regressions.append(f"c={stage['concurrency']} {name}: error rate {old['error_rate']:.2%} -> {new['error_rate']:.2%}")
+            if before['throughput'] and stage['throughput'] < before['throughput'] * (1 - tolerance):
+                regressions.append(f"c={stage['concurrency']}: throughput {before['throughput']} -> {stage['throughput']} req/s")
+        if regressions:
+            raise CommandError('Regressions against %s:\n  %s' % (path, '\n  '.join(regressions)))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path}'))
+
+    def handle(self, *args, **options):
+        self.seed = options['seed']
+        weights = self._parse_mix(options['mix'])
+        try:
+            concurrency = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency must be a comma separated list of integers')
+
+        overrides = {
+            'DEBUG': False,
+            'ZLIDE_LLM_CLIENT': 'zlidegenerator.llm.StubClient',
+            'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+        }
+        if options['llm_latency'] is not None:
+            overrides['ZLIDE_STUB_LLM_LATENCY'] = options['llm_latency']
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(**overrides):
+            # An on-disk test database, so worker threads share it the way gunicorn workers would
+            for alias in connections:
+                connection = connections[alias]
+                if connection.vendor == 'sqlite':
+                    connection.settings_dict['TEST']['NAME'] = os.path.join(directory, f'{alias}.sqlite3')
+            old_config = setup_databases(verbosity=0, interactive=False)
+            cache.clear()
+            stop = threading.Event()
+            server = None
+            try:
+                self._seed(options)
+                connections.close_all()
+
+                server = LoadTestServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+                server.set_app(get_wsgi_application())
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                threading.Thread(target=self._mailer, args=(stop,), daemon=True).start()
+                port = server.server_address[1]
+
+                # One request per endpoint first so lazy imports and cold caches stay out of the numbers
+                warmup = Client(self, 0, port)
+                for name in weights:
+                    getattr(warmup, name)()
+                warmup.close()
+
+                report = {'meta': self._meta(options, weights), 'stages': []}
+                for level in concurrency:
+                    self.stdout.write(f'Running {level} concurrent clients for {options["duration"]}s...')
+                    report['stages'].append(self._stage(port, level, options['duration'], weights))
+            finally:
+                stop.set()
+                if server is not None:
+                    server.shutdown()
+                    server.server_close()
+                connections.close_all()
+                teardown_databases(old_config, verbosity=0)
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self._print(report)
+        self.stdout.write(f"Report written to {options['output']}")
+
+        if options['compare']:
+            self._compare(report, options['compare'], options['tolerance'], options['min_samples'], options['min_change_ms'])
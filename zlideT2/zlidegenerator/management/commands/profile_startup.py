@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# What a gunicorn worker or a management command pays before it can do any work
+STARTUP = '''
+import json, os, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from importlib import import_module
+from django.conf import settings
+import_module(settings.ROOT_URLCONF)
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+'''
+
+HEAVY_MODULES = ('pptx', 'nltk', 'openai', 'lxml', 'decouple', 'environ')
+
+
+def measure_startup(importtime=False):
+    """
+    Run django.setup() plus the URLconf import in a fresh interpreter. Returns
+    the elapsed seconds, the imported module names and, with `importtime`, the
+    `-X importtime` report.
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'zlideT2.settings'))
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', STARTUP]
+    result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+    if result.returncode:
+        raise CommandError(f'Startup failed:\n{result.stderr}')
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report['elapsed'], report['modules'], result.stderr
+
+
+def parse_importtime(output):
+    """
+    Sum `-X importtime` self times per top-level package, in seconds.
+    """
+    packages = defaultdict(float)
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        packages[name.strip().split('.')[0]] += int(self_us) / 1e6
+    return packages
+
+
+class Command(BaseCommand):
+    help = 'Profiles the imports of django.setup() plus the URLconf, what every worker and management command pays at startup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Timed runs, the fastest one is reported')
+        parser.add_argument('--top', type=int, default=15, help='Number of packages to list')
+        parser.add_argument('--budget', type=float, default=None, help='Fail when startup takes longer than this many seconds')
+
+    def handle(self, *args, **options):
+        timings = []
+        for _ in range(max(options['runs'], 1)):
+            elapsed, modules, _ = measure_startup()
+            timings.append(elapsed)
+        best = min(timings)
+
+        _, _, importtime = measure_startup(importtime=True)
+        packages = parse_importtime(importtime)
+
+        self.stdout.write(f'Startup: {best * 1000:.0f} ms (best of {len(timings)}), {len(modules)} modules')
+        self.stdout.write(f'Slowest packages (self time under -X importtime, total {sum(packages.values()) * 1000:.0f} ms):')
+        for name, seconds in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options['top']]:
+            self.stdout.write(f'  {name:<30} {seconds * 1000:8.1f} ms')
+
+        loaded = [name for name in HEAVY_MODULES if name in modules]
+        if loaded:
+            self.stdout.write(self.style.WARNING(f'Loaded at startup although only needed lazily: {", ".join(loaded)}'))
+
+        if options['budget'] is not None and best > options['budget']:
+            raise CommandError(f'Startup took {best:.3f}s, over the {options["budget"]:.3f}s budget')
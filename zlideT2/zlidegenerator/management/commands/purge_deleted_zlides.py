@@ -0,0 +1,30 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from zlidegenerator.maintenance import purge_deleted_presentations
+
+
+class Command(BaseCommand):
+    help = 'Physically removes soft deleted presentations in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--grace-seconds', type=int, default=settings.ZLIDE_PURGE_GRACE_SECONDS,
+                            help='Only purge presentations deleted at least this long ago')
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between batches')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and purge every INTERVAL seconds (for a worker process)')
+
+    def handle(self, *args, **options):
+        while True:
+            purged, reclaimed = purge_deleted_presentations(
+                batch_size=options['batch_size'],
+                grace=timedelta(seconds=options['grace_seconds']),
+                pause=options['pause'],
+            )
+            self.stdout.write(f'Purged {purged} presentations, reclaimed {filesizeformat(reclaimed)} of slide data')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from zlidegenerator.fields import train_dictionary, store_dictionary, ZDICT_MAX_SIZE
+from zlidegenerator.models import PresentationData
+
+
+class Command(BaseCommand):
+    help = 'Trains a zlib preset dictionary on saved decks for compressing json_data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=5000, help='Number of most recent decks to sample')
+        parser.add_argument('--size', type=int, default=ZDICT_MAX_SIZE, help='Dictionary size in bytes')
+
+    def handle(self, *args, **options):
+        samples = PresentationData.objects.order_by('-created_at').values_list('json_data', flat=True)[:options['samples']]
+        zdict = train_dictionary(samples.iterator(), size=options['size'])
+        if not zdict:
+            raise CommandError('Not enough decks to train a dictionary')
+
+        # Stored in the database, every process and every deploy can read rows compressed with it
+        zdict_id = store_dictionary(zdict)
+
+        self.stdout.write(f'Stored {len(zdict)} byte dictionary {zdict_id}')
+        self.stdout.write(f'Set ZLIDE_JSON_COMPRESSION_DICTIONARY={zdict_id} to compress new writes with it, '
+                          'then run `manage.py compression_report --recompress` to rewrite existing rows')
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-19 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zlidegenerator', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='presentationdata',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
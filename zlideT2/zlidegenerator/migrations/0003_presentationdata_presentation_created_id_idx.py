@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-19 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zlidegenerator', '0002_presentationdata_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='presentationdata',
+            index=models.Index(fields=['-created_at', '-id'], name='presentation_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 4.2.11 on 2026-10-19 13:20
+
+import json
+from django.db import migrations
+
+# The SQL is inlined rather than imported from zlidegenerator.search, so later
+# changes to that module cannot change what this migration does
+
+SQLITE_TABLE = 'zlidegenerator_presentation_fts'
+POSTGRES_TABLE = 'zlidegenerator_presentation_search'
+
+
+def extract_text(json_data):
+    if isinstance(json_data, str):
+        try:
+            json_data = json.loads(json_data)
+        except ValueError:
+            return '', json_data
+    if isinstance(json_data, dict):
+        json_data = json_data.get('slides', [json_data])
+    if not isinstance(json_data, list):
+        return '', str(json_data)
+
+    titles, content = [], []
+    for slide in json_data:
+        if not isinstance(slide, dict):
+            content.append(str(slide))
+            continue
+        for key in ('title', 'header'):
+            if isinstance(slide.get(key), str):
+                titles.append(slide[key])
+        body = slide.get('content')
+        if isinstance(body, list):
+            content.extend(str(item) for item in body)
+        elif body is not None:
+            content.append(str(body))
+    return '\n'.join(titles), '\n'.join(content)
+
+
+def create_index(apps, schema_editor):
+    PresentationData = apps.get_model('zlidegenerator', 'PresentationData')
+    connection = schema_editor.connection
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    rows = PresentationData.objects.using(connection.alias).values_list('id', 'title', 'json_data')
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} "
+                "USING fts5(title, slide_titles, content, tokenize='porter unicode61')"
+            )
+            insert = f"INSERT INTO {SQLITE_TABLE} (rowid, title, slide_titles, content) VALUES (%s, %s, %s, %s)"
+        else:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ("
+                "presentation_id bigint PRIMARY KEY REFERENCES zlidegenerator_presentationdata (id) ON DELETE CASCADE, "
+                "title text NOT NULL, slide_titles text NOT NULL, content text NOT NULL, "
+                "document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_idx "
+                f"ON {POSTGRES_TABLE} USING GIN (document)"
+            )
+            insert = (
+                f"INSERT INTO {POSTGRES_TABLE} (presentation_id, title, slide_titles, content, document) "
+                "VALUES (%s, %s, %s, %s, "
+                "setweight(to_tsvector('english', %s), 'A') || "
+                "setweight(to_tsvector('english', %s), 'B') || "
+                "setweight(to_tsvector('english', %s), 'C'))"
+            )
+        batch = []
+        for pk, title, json_data in rows.iterator(chunk_size=2000):
+            slide_titles, content = extract_text(json_data)
+            row = (pk, title or '', slide_titles, content)
+            batch.append(row if connection.vendor == 'sqlite' else row + row[1:])
+            if len(batch) >= 2000:
+                cursor.executemany(insert, batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert, batch)
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"DROP TABLE IF EXISTS {SQLITE_TABLE}")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"DROP TABLE IF EXISTS {POSTGRES_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zlidegenerator', '0003_presentationdata_presentation_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
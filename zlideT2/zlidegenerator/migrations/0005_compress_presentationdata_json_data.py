@@ -0,0 +1,101 @@
+# Generated by Django 4.2.11 on 2026-10-19 13:40
+
+import json
+import zlib
+from django.conf import settings
+from django.db import migrations, models
+import zlidegenerator.fields
+
+# The values are encoded here rather than through the field, whose dictionary
+# lookup needs the CompressionDictionary table that only 0009 creates. The
+# bytes are the header plus plain JSON or zlib that fields.decompress_json() reads
+RAW = b'\x00'
+ZLIB = b'\x01'
+
+
+def encode(value):
+    data = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if len(data) >= getattr(settings, 'ZLIDE_JSON_COMPRESSION_THRESHOLD', 1024):
+        compressed = ZLIB + zlib.compress(data, getattr(settings, 'ZLIDE_JSON_COMPRESSION_LEVEL', 6))
+        if len(compressed) < len(data) + 1:
+            return compressed
+    return RAW + data
+
+
+def decode(value):
+    value = bytes(value)
+    header, body = value[:1], value[1:]
+    if header == ZLIB:
+        body = zlib.decompress(body)
+    elif header != RAW:
+        raise ValueError(f'Unknown json_data header {header!r}')
+    return json.loads(body.decode('utf-8'))
+
+
+def copy_json_data(apps, schema_editor):
+    PresentationData = apps.get_model('zlidegenerator', 'PresentationData')
+    connection = schema_editor.connection
+    queryset = PresentationData.objects.using(connection.alias).values_list('id', 'json_data')
+    sql = f'UPDATE {PresentationData._meta.db_table} SET json_blob = %s WHERE id = %s'
+    batch = []
+    with connection.cursor() as cursor:
+        for pk, json_data in queryset.iterator(chunk_size=500):
+            batch.append((connection.Database.Binary(encode(json_data)), pk))
+            if len(batch) == 500:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+def copy_json_blob(apps, schema_editor):
+    PresentationData = apps.get_model('zlidegenerator', 'PresentationData')
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT id, json_blob FROM {PresentationData._meta.db_table}')
+        rows = cursor.fetchall()
+    batch = []
+    for pk, blob in rows:
+        batch.append(PresentationData(pk=pk, json_data=decode(blob)))
+        if len(batch) == 500:
+            PresentationData.objects.using(connection.alias).bulk_update(batch, ['json_data'])
+            batch = []
+    PresentationData.objects.using(connection.alias).bulk_update(batch, ['json_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zlidegenerator', '0004_presentation_search'),
+    ]
+
+    # The column changes from JSON to binary, which Postgres cannot cast in
+    # place, so the data is copied through a new column instead. json_data is
+    # made nullable first so the migration can be reversed on a table with rows
+    operations = [
+        migrations.AddField(
+            model_name='presentationdata',
+            name='json_blob',
+            field=zlidegenerator.fields.CompressedJSONField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='presentationdata',
+            name='json_data',
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(copy_json_data, copy_json_blob),
+        migrations.RemoveField(
+            model_name='presentationdata',
+            name='json_data',
+        ),
+        migrations.RenameField(
+            model_name='presentationdata',
+            old_name='json_blob',
+            new_name='json_data',
+        ),
+        migrations.AlterField(
+            model_name='presentationdata',
+            name='json_data',
+            field=zlidegenerator.fields.CompressedJSONField(),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-19 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zlidegenerator', '0005_compress_presentationdata_json_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='presentationdata',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
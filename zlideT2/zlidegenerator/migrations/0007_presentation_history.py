@@ -0,0 +1,104 @@
+# Generated by Django 4.2.11 on 2026-10-19 13:17
+
+import hashlib
+import json
+import zlib
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+import zlidegenerator.fields
+
+# The backfill is inlined rather than calling zlidegenerator.history, so later
+# changes to that module cannot change what this migration does. Blobs are
+# written as plain JSON or zlib, the field's dictionary lookup needs a table
+# that only 0009 creates
+RAW = b'\x00'
+ZLIB = b'\x01'
+
+
+def encode(value):
+    data = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if len(data) >= getattr(settings, 'ZLIDE_JSON_COMPRESSION_THRESHOLD', 1024):
+        compressed = ZLIB + zlib.compress(data, getattr(settings, 'ZLIDE_JSON_COMPRESSION_LEVEL', 6))
+        if len(compressed) < len(data) + 1:
+            return compressed
+    return RAW + data
+
+
+def digest(slide):
+    canonical = json.dumps(slide, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def record_batch(batch, connection, PresentationVersion, stored):
+    blobs, versions = {}, []
+    for presentation_id, version, title, json_data in batch:
+        if isinstance(json_data, list):
+            slides, is_list = json_data, True
+        else:
+            slides, is_list = [json_data], False
+        digests = [digest(slide) for slide in slides]
+        blobs.update((key, slide) for key, slide in zip(digests, slides) if key not in stored)
+        versions.append(PresentationVersion(presentation_id=presentation_id, version=version, title=title, slides=digests, is_list=is_list))
+    if blobs:
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO zlidegenerator_slideblob (digest, data, created_at) VALUES (%s, %s, %s)',
+                [(key, connection.Database.Binary(encode(slide)), now) for key, slide in blobs.items()],
+            )
+        stored.update(blobs)
+    PresentationVersion.objects.using(connection.alias).bulk_create(versions)
+
+
+def record_current_versions(apps, schema_editor):
+    PresentationData = apps.get_model('zlidegenerator', 'PresentationData')
+    PresentationVersion = apps.get_model('zlidegenerator', 'PresentationVersion')
+    connection = schema_editor.connection
+    rows = PresentationData.objects.using(connection.alias).values_list('id', 'version', 'title', 'json_data')
+    stored, batch = set(), []
+    for row in rows.iterator(chunk_size=500):
+        batch.append(row)
+        if len(batch) == 500:
+            record_batch(batch, connection, PresentationVersion, stored)
+            batch = []
+    record_batch(batch, connection, PresentationVersion, stored)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zlidegenerator', '0006_presentationdata_deleted_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlideBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', zlidegenerator.fields.CompressedJSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PresentationVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('slides', models.JSONField()),
+                ('is_list', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('presentation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='zlidegenerator.presentationdata')),
+            ],
+            options={
+                'ordering': ['-version'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='presentationversion',
+            constraint=models.UniqueConstraint(fields=('presentation', 'version'), name='unique_presentation_version'),
+        ),
+        migrations.RunPython(record_current_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.11 on 2026-10-19 13:55
+
+import zlib
+from django.conf import settings
+from django.db import migrations, models
+
+
+def import_dictionary_files(apps, schema_editor):
+    # Dictionaries used to be written to this directory, which does not survive a redeploy
+    CompressionDictionary = apps.get_model('zlidegenerator', 'CompressionDictionary')
+    directory = settings.BASE_DIR / 'zlidegenerator' / 'dictionaries'
+    if not directory.is_dir():
+        return
+    for path in directory.glob('*.zdict'):
+        data = path.read_bytes()
+        if path.stem == f'{zlib.crc32(data):08x}':
+            CompressionDictionary.objects.using(schema_editor.connection.alias).get_or_create(pk=path.stem, defaults={'data': data})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zlidegenerator', '0008_powerpointpresentation_import'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompressionDictionary',
+            fields=[
+                ('id', models.CharField(max_length=8, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(import_dictionary_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.11 on 2026-10-19 14:16
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zlidegenerator', '0009_compression_dictionary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='presentationversion',
+            name='wrapper',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='slideblob',
+            name='last_referenced',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
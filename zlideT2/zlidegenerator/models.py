@@ -1,21 +1,129 @@
 from django.db import models
+from django.utils import timezone
+from .fields import CompressedJSONField
 
 # Create your models here.
 
 class PowerPointPresentation(models.Model):
+    # Uploaded .pptx files, imported into a PresentationData deck by `manage.py import_presentations`
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
     text = models.TextField()
     file = models.FileField(upload_to='presentations/')
+    title = models.CharField(max_length=255, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    slide_count = models.PositiveIntegerField(default=0)
+    slides_done = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    presentation = models.ForeignKey('PresentationData', null=True, blank=True, on_delete=models.SET_NULL, related_name='imports')
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='pptx_import_status_idx'),
+        ]
+
     def __str__(self):
         return f"Presentation created at {self.created_at}"
 
+class PresentationDataQuerySet(models.QuerySet):
+    def soft_delete(self):
+        return self.update(deleted_at=timezone.now())
+
+
+class PresentationDataManager(models.Manager.from_queryset(PresentationDataQuerySet)):
+    def get_queryset(self):
+        # Soft deleted presentations are hidden from every read
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class PresentationData(models.Model):
     title = models.CharField(max_length=255, default="title")
-    json_data = models.JSONField()
+    json_data = CompressedJSONField()
+    version = models.PositiveIntegerField(default=1) # Bumped on every edit, used for optimistic concurrency
     # presentation = models.ForeignKey(PowerPointPresentation, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = PresentationDataManager()
+    all_objects = PresentationDataQuerySet.as_manager() # Includes soft deleted presentations
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='presentation_created_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the title the row was loaded with so a rename can invalidate the old cache entry
+        instance._loaded_title = instance.__dict__.get('title')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Every saved change is a new version, the history keeps one row per version
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.title
     
+
+
+class CompressionDictionary(models.Model):
+    # zlib preset dictionaries for CompressedJSONField, the id is the CRC32 of the data in hex
+    id = models.CharField(max_length=8, primary_key=True)
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.id
+
+
+class SlideBlob(models.Model):
+    # Content addressed: the key is the SHA-256 of the slide's canonical JSON,
+    # so a slide shared by many versions or decks is stored once
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = CompressedJSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last time a new version used the blob (to within history.REFERENCE_INTERVAL), blobs
+    # referenced recently are never collected even if the version is not committed yet
+    last_referenced = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.digest
+
+
+class PresentationVersion(models.Model):
+    presentation = models.ForeignKey(PresentationData, on_delete=models.CASCADE, related_name='versions')
+    version = models.PositiveIntegerField()
+    title = models.CharField(max_length=255)
+    slides = models.JSONField() # Ordered SlideBlob digests
+    is_list = models.BooleanField(default=True) # False for {"slides": [...]} decks and for json_data stored as one blob
+    wrapper = models.JSONField(null=True, blank=True) # The object around the slides of a {"slides": [...]} deck
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-version']
+        constraints = [
+            models.UniqueConstraint(fields=['presentation', 'version'], name='unique_presentation_version'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} v{self.version}"
@@ -0,0 +1,19 @@
+from django.core.exceptions import ValidationError
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class PresentationCursorPagination(CursorPagination):
+    # Keyset pagination: every page is a "WHERE created_at < cursor" range scan
+    # on the (created_at, id) index, so deep pages cost the same as the first one
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            return super().paginate_queryset(queryset, request, view)
+        except ValidationError:
+            # A well formed cursor whose position is not a timestamp, it was tampered with
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,5 @@
+from rest_framework.parsers import JSONParser
+
+
+class JSONPatchParser(JSONParser):
+    media_type = 'application/json-patch+json'
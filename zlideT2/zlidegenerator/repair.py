@@ -0,0 +1,189 @@
+import itertools
+import json
+import re
+from .timing import Counter, METRICS
+
+
+PARSES = Counter('zlide_llm_json_total', 'LLM replies parsed as JSON, by outcome (clean, repaired, continued, failed).', ('kind', 'outcome'))
+CALLS_SAVED = Counter('zlide_llm_calls_saved_total', 'Completions not requested again because a broken reply was repaired.', ('kind',))
+METRICS.extend([PARSES, CALLS_SAVED])
+
+_fence = re.compile(r'```[\w-]*[ \t]*\n?')
+_bracket = re.compile(r'[\[{]')
+
+# Brackets tried as the start of the JSON before giving up, prose can hold a few
+MAX_STARTS = 20
+
+
+class RepairFailed(ValueError):
+    pass
+
+
+def record(kind, outcome):
+    PARSES.inc(kind, outcome)
+    if outcome == 'repaired':
+        # Without the repair the user would have had to generate again
+        CALLS_SAVED.inc(kind)
+
+
+def strip_fences(text):
+    """
+    Drop markdown code fences, keeping what was inside them.
+    """
+    return _fence.sub('', text)
+
+
+def _starts(text):
+    starts = [match.start() for match in itertools.islice(_bracket.finditer(text), MAX_STARTS)]
+    if not starts:
+        raise RepairFailed('The reply contains no JSON')
+    return starts
+
+
+def _balance(text, start):
+    """
+    Copy the JSON value starting at `start`, dropping trailing commas. Returns
+    (json text, truncated). A value cut off before its end is closed after the
+    last complete element of its outermost array, so {"slides": [...]} loses
+    only the slide it stopped in, or after its last complete top level member.
+    With neither it is closed where it stopped.
+    """
+    out = []
+    stack = []
+    in_string = escape = False
+    # Depth of the outermost open array, its elements are what a cut off reply loses
+    elements = None
+    safe = None  # (length of out, closing brackets) at the last point the value could end
+    index = start
+    length = len(text)
+    while index < length:
+        char = text[index]
+        index += 1
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+                if len(stack) == elements:
+                    safe = len(out), ''.join(reversed(stack))
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '[{':
+            stack.append(']' if char == '[' else '}')
+            if char == '[' and elements is None:
+                elements = len(stack)
+        elif char in ']}':
+            if not stack or stack[-1] != char:
+                raise RepairFailed('The reply has mismatched brackets')
+            if len(stack) == elements:
+                elements = None
+            stack.pop()
+            out.append(char)
+            if not stack:
+                return ''.join(out), False
+            if len(stack) == elements or len(stack) == 1:
+                safe = len(out), ''.join(reversed(stack))
+            continue
+        elif char == ',':
+            if len(stack) == elements:
+                # A number, true, false or null just ended
+                safe = len(out), ''.join(reversed(stack))
+            following = index
+            while following < length and text[following] in ' \t\r\n':
+                following += 1
+            if following == length or text[following] in ']}':
+                # Trailing comma, or the reply stops right after it
+                continue
+        out.append(char)
+
+    # The reply stopped in the middle of the value
+    if safe is not None:
+        end, closing = safe
+        return ''.join(out[:end]).rstrip() + closing, True
+    partial = ''.join(out)
+    if in_string:
+        partial += '"'
+    partial = partial.rstrip().rstrip(',:').rstrip()
+    return partial + ''.join(reversed(stack)), True
+
+
+def parse_json(text, validate=None):
+    """
+    Parse an LLM reply as JSON, repairing what models commonly get wrong:
+    markdown fences, prose around the JSON, trailing commas and a reply cut off
+    part way. Every bracket is tried as the start of the JSON in turn, so
+    "Here are [5] slides: [...]" gets to the deck, and with `validate` the
+    first value it accepts wins and is returned as validate() returned it.
+    Returns (value, repaired). Raises RepairFailed.
+    """
+    text = text or ''
+    try:
+        value = json.loads(text)
+    except ValueError:
+        pass
+    else:
+        try:
+            return (validate(value) if validate else value), False
+        except RepairFailed:
+            pass
+    cleaned = strip_fences(text)
+    errors = []
+    for start in _starts(cleaned):
+        candidate = ''
+        try:
+            candidate, _ = _balance(cleaned, start)
+            # strict=False accepts raw newlines inside strings
+            value = json.loads(candidate, strict=False)
+            return (validate(value) if validate else value), True
+        except RepairFailed as e:
+            errors.append((len(candidate), e))
+        except ValueError as e:
+            errors.append((len(candidate), RepairFailed(f'The reply could not be repaired: {e}')))
+    # The longest candidate is most likely the JSON that was meant, its error says the most
+    raise max(errors, key=lambda error: error[0])[1]
+
+
+def validate_slides(value, expected=None):
+    """
+    Check a deck against the slide schema: a non empty list of objects with a
+    title and a content, numbered in order when the numbers are missing. Also
+    accepts the list wrapped in {"slides": [...]}.
+    """
+    if isinstance(value, dict) and isinstance(value.get('slides'), list):
+        value = value['slides']
+    if not isinstance(value, list) or not value:
+        raise RepairFailed('Expected a JSON array of slides')
+    slides = []
+    for position, item in enumerate(value, start=1):
+        if not isinstance(item, dict) or 'content' not in item:
+            raise RepairFailed(f'Slide {position} has no content')
+        content = item['content']
+        if not isinstance(content, (str, list)):
+            raise RepairFailed(f'Slide {position} has an invalid content')
+        slide = dict(item)
+        slide['title'] = str(item.get('title') or f'Slide {position}')
+        if not isinstance(item.get('slide'), int):
+            slide['slide'] = position
+        slides.append(slide)
+    if expected and len(slides) < expected:
+        raise RepairFailed(f'Expected {expected} slides, got {len(slides)}')
+    return slides
+
+
+def validate_titles(value, expected=None):
+    if not isinstance(value, list) or not value:
+        raise RepairFailed('Expected a JSON array of slide titles')
+    titles = [str(item.get('title', '')) if isinstance(item, dict) else str(item) for item in value]
+    if expected and len(titles) < expected:
+        raise RepairFailed(f'Expected {expected} slide titles, got {len(titles)}')
+    return titles[:expected] if expected else titles
+
+
+def validate_slide(value):
+    if not isinstance(value, dict) or not isinstance(value.get('content'), (str, list)):
+        raise RepairFailed('Expected a JSON object with a content')
+    return value
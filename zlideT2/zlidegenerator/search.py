@@ -0,0 +1,153 @@
+import json
+import re
+from django.db import connections, router
+from .models import PresentationData
+
+
+SQLITE_TABLE = 'zlidegenerator_presentation_fts'
+POSTGRES_TABLE = 'zlidegenerator_presentation_search'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _connection():
+    return connections[router.db_for_write(PresentationData)]
+
+
+def extract_text(json_data):
+    """
+    Pull the slide titles and the slide content out of a deck so they can be
+    indexed separately (titles are ranked higher than content).
+    """
+    if isinstance(json_data, str):
+        try:
+            json_data = json.loads(json_data)
+        except ValueError:
+            return '', json_data
+    if isinstance(json_data, dict):
+        json_data = json_data.get('slides', [json_data])
+    if not isinstance(json_data, list):
+        return '', str(json_data)
+
+    titles, content = [], []
+    for slide in json_data:
+        if not isinstance(slide, dict):
+            content.append(str(slide))
+            continue
+        for key in ('title', 'header'):
+            if isinstance(slide.get(key), str):
+                titles.append(slide[key])
+        body = slide.get('content')
+        if isinstance(body, list):
+            content.extend(str(item) for item in body)
+        elif body is not None:
+            content.append(str(body))
+    return '\n'.join(titles), '\n'.join(content)
+
+
+def index_rows(rows, connection=None):
+    """
+    (Re)index an iterable of (id, title, json_data) tuples.
+    """
+    connection = connection or _connection()
+    params = []
+    for pk, title, json_data in rows:
+        slide_titles, content = extract_text(json_data)
+        params.append((pk, title or '', slide_titles, content))
+    if not params:
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(f"DELETE FROM {SQLITE_TABLE} WHERE rowid = %s", [(row[0],) for row in params])
+            cursor.executemany(
+                f"INSERT INTO {SQLITE_TABLE} (rowid, title, slide_titles, content) VALUES (%s, %s, %s, %s)",
+                params,
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.executemany(
+                f"INSERT INTO {POSTGRES_TABLE} (presentation_id, title, slide_titles, content, document) "
+                "VALUES (%s, %s, %s, %s, "
+                "setweight(to_tsvector('english', %s), 'A') || "
+                "setweight(to_tsvector('english', %s), 'B') || "
+                "setweight(to_tsvector('english', %s), 'C')) "
+                "ON CONFLICT (presentation_id) DO UPDATE SET title = EXCLUDED.title, "
+                "slide_titles = EXCLUDED.slide_titles, content = EXCLUDED.content, document = EXCLUDED.document",
+                [row + row[1:] for row in params],
+            )
+
+
+def index_presentations(presentations):
+    index_rows((p.pk, p.title, p.json_data) for p in presentations)
+
+
+def remove_presentations(ids):
+    ids = list(ids)
+    if not ids:
+        return
+    connection = _connection()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(f"DELETE FROM {SQLITE_TABLE} WHERE rowid = %s", [(pk,) for pk in ids])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"DELETE FROM {POSTGRES_TABLE} WHERE presentation_id = ANY(%s)", [ids])
+
+
+def _fts5_query(query):
+    # Quote every term so user input can never be parsed as FTS5 syntax, and
+    # let the last one match as a prefix for search-as-you-type
+    terms = TOKEN_RE.findall(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search(query, limit=20, offset=0):
+    """
+    Return up to `limit` ranked matches as dicts with id, title, rank and a
+    highlighted snippet, plus whether more results exist after this page.
+    """
+    connection = _connection()
+    table = PresentationData._meta.db_table
+
+    if connection.vendor == 'sqlite':
+        match = _fts5_query(query)
+        if match is None:
+            return [], False
+        sql = (
+            f"SELECT p.id, p.title, bm25({SQLITE_TABLE}, 10.0, 5.0, 1.0) AS rank, "
+            f"snippet({SQLITE_TABLE}, -1, '<b>', '</b>', '...', 12) "
+            f"FROM {SQLITE_TABLE} JOIN {table} p ON p.id = {SQLITE_TABLE}.rowid "
+            f"WHERE {SQLITE_TABLE} MATCH %s AND p.deleted_at IS NULL ORDER BY rank LIMIT %s OFFSET %s"
+        )
+        params = [match, limit + 1, offset]
+    elif connection.vendor == 'postgresql':
+        sql = (
+            f"SELECT p.id, p.title, ts_rank_cd(s.document, q) AS rank, "
+            "ts_headline('english', s.slide_titles || ' ' || s.content, q, "
+            "'StartSel=<b>, StopSel=</b>, MaxFragments=1, MaxWords=24, MinWords=8') "
+            f"FROM {POSTGRES_TABLE} s JOIN {table} p ON p.id = s.presentation_id, "
+            "websearch_to_tsquery('english', %s) q "
+            "WHERE s.document @@ q AND p.deleted_at IS NULL ORDER BY rank DESC, p.id DESC LIMIT %s OFFSET %s"
+        )
+        params = [query, limit + 1, offset]
+    else:
+        # No inverted index on this backend, fall back to a title scan
+        matches = PresentationData.objects.filter(title__icontains=query).order_by('-created_at', '-id')
+        rows = [(p.id, p.title, 0.0, '') for p in matches.only('id', 'title')[offset:offset + limit + 1]]
+        return _format(rows, limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return _format(rows, limit)
+
+
+def _format(rows, limit):
+    results = [
+        {'id': pk, 'title': title, 'rank': float(rank), 'snippet': snippet}
+        for pk, title, rank, snippet in rows[:limit]
+    ]
+    return results, len(rows) > limit
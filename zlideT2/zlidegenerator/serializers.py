@@ -7,4 +7,26 @@ class TextSerializer(serializers.Serializer):
 class PresentationDataSerializer(serializers.ModelSerializer):
     class Meta:
         model = PresentationData
-        fields = '__all__'
\ No newline at end of file
+        exclude = ['deleted_at']
+        read_only_fields = ['version']
+
+
+class PresentationDataListSerializer(PresentationDataSerializer):
+    """
+    Takes an optional `fields` argument restricting which fields are rendered,
+    used for the sparse fieldsets of the listing endpoint.
+    """
+    default_fields = ('id', 'title', 'version', 'created_at')
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None) or self.default_fields
+        super().__init__(*args, **kwargs)
+        for field_name in set(self.fields) - set(fields):
+            self.fields.pop(field_name)
+
+
+class BulkDeleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    titles = serializers.ListField(child=serializers.CharField(max_length=255), required=False)
+    created_before = serializers.DateTimeField(required=False)
+    created_after = serializers.DateTimeField(required=False)
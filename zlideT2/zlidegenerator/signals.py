@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import PresentationData
+from . import search
+from . import cache
+from . import history
+
+
+@receiver(post_save, sender=PresentationData)
+def index_presentation(sender, instance, **kwargs):
+    search.index_presentations([instance])
+
+
+@receiver(post_save, sender=PresentationData)
+def invalidate_cached_presentation(sender, instance, **kwargs):
+    cache.invalidate_deck(instance.title, instance.pk, instance.version)
+    loaded_title = getattr(instance, '_loaded_title', None)
+    if loaded_title is not None and loaded_title != instance.title:
+        cache.forget_deck(loaded_title)
+
+
+@receiver(post_save, sender=PresentationData)
+def record_presentation_version(sender, instance, **kwargs):
+    history.record_version(instance)
+
+
+@receiver(post_delete, sender=PresentationData)
+def unindex_presentation(sender, instance, **kwargs):
+    search.remove_presentations([instance.pk])
+
+
+@receiver(post_delete, sender=PresentationData)
+def forget_cached_presentation(sender, instance, **kwargs):
+    cache.forget_deck(instance.title)
+
+
+def apply_sqlite_pragmas(cursor, pragmas=None):
+    pragmas = settings.SQLITE_PRAGMAS if pragmas is None else pragmas
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            apply_sqlite_pragmas(cursor)
@@ -1,3 +1,887 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import FileResponse
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from zlideT2 import schema
+from zlideT2.schema import CachedSpectacularAPIView
+from .management.commands.profile_startup import HEAVY_MODULES, measure_startup
+from . import admission, compression, fields, generation, history, imports, repair, search, views
+from . import cache as deck_cache
+from . import maintenance
+from .maintenance import collect_slide_blobs, expire_uploads
+from .models import PowerPointPresentation, PresentationData, PresentationVersion, SlideBlob
+from .utils import apply_json_patch, JSONPatchError, JSONPatchTestFailed, iter_json_array
 
 # Create your tests here.
+
+# Seconds allowed for django.setup() plus the URLconf import in a fresh
+# interpreter, raise it with ZLIDE_STARTUP_BUDGET on slow machines
+STARTUP_BUDGET = float(os.environ.get('ZLIDE_STARTUP_BUDGET', 0.5))
+
+
+class StartupImportTimeTest(SimpleTestCase):
+    def test_startup_within_budget(self):
+        elapsed = min(measure_startup()[0] for _ in range(3))
+        self.assertLess(elapsed, STARTUP_BUDGET, f'Startup took {elapsed:.3f}s, run `manage.py profile_startup` to see why')
+
+    def test_heavy_modules_are_lazy(self):
+        _, modules, _ = measure_startup()
+        self.assertEqual([name for name in HEAVY_MODULES if name in modules], [])
+
+
+class JSONPatchTest(SimpleTestCase):
+    document = {'slides': [{'header': 'One', 'content': 'a'}, {'header': 'Two', 'content': 'b'}]}
+
+    def test_operations(self):
+        patched = apply_json_patch(self.document, [
+            {'op': 'replace', 'path': '/slides/0/content', 'value': 'x'},
+            {'op': 'add', 'path': '/slides/-', 'value': {'header': 'Three', 'content': 'c'}},
+            {'op': 'move', 'from': '/slides/2', 'path': '/slides/0'},
+            {'op': 'copy', 'from': '/slides/1/header', 'path': '/slides/1/title'},
+            {'op': 'remove', 'path': '/slides/2'},
+            {'op': 'test', 'path': '/slides/1/title', 'value': 'One'},
+        ])
+        self.assertEqual(patched, {'slides': [
+            {'header': 'Three', 'content': 'c'},
+            {'header': 'One', 'content': 'x', 'title': 'One'},
+        ]})
+
+    def test_escaped_pointer(self):
+        patched = apply_json_patch({'a/b': {'c~d': 1}}, [{'op': 'replace', 'path': '/a~1b/c~0d', 'value': 2}])
+        self.assertEqual(patched, {'a/b': {'c~d': 2}})
+
+    def test_failure_leaves_document_untouched(self):
+        with self.assertRaises(JSONPatchError):
+            apply_json_patch(self.document, [
+                {'op': 'remove', 'path': '/slides/0'},
+                {'op': 'remove', 'path': '/slides/5'},
+            ])
+        self.assertEqual(len(self.document['slides']), 2)
+
+    def test_failed_test_operation(self):
+        with self.assertRaises(JSONPatchTestFailed):
+            apply_json_patch(self.document, [{'op': 'test', 'path': '/slides/0/header', 'value': 'Two'}])
+
+    def test_test_compares_json_types(self):
+        document = {'n': 1, 'flag': True, 'list': [1, {'a': False}]}
+        for path, value in (('/n', True), ('/flag', 1), ('/list', [True, {'a': 0}]), ('/n', '1')):
+            with self.subTest(path=path, value=value), self.assertRaises(JSONPatchTestFailed):
+                apply_json_patch(document, [{'op': 'test', 'path': path, 'value': value}])
+        # Numbers compare by value
+        apply_json_patch(document, [{'op': 'test', 'path': '/n', 'value': 1.0}, {'op': 'test', 'path': '/list', 'value': [1, {'a': False}]}])
+
+    def test_invalid_operations(self):
+        for operations in (
+            {'op': 'add'},
+            [{'op': 'add', 'path': '/slides/0'}],
+            [{'op': 'remove', 'path': ''}],
+            [{'op': 'add', 'path': '/slides/01', 'value': 1}],
+            [{'op': 'remove', 'path': '/slides/\u00b2'}],
+            [{'op': 'move', 'from': '/slides', 'path': '/slides/0'}],
+            [{'op': 'frobnicate', 'path': '/slides'}],
+        ):
+            with self.subTest(operations=operations), self.assertRaises(JSONPatchError):
+                apply_json_patch(self.document, operations)
+
+
+class EditZlideTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.deck = PresentationData.objects.create(title='deck', json_data={'slides': []})
+
+    def edit(self, body, **headers):
+        return self.client.patch('/zlide/editzlide/deck/', body, format='json', headers=headers)
+
+    def test_without_precondition_last_edit_wins(self):
+        self.assertEqual(self.edit({'json_data': {'slides': [1]}}).status_code, 200)
+        response = self.edit({'json_data': {'slides': [2]}})
+        self.assertEqual((response.status_code, response.data['version']), (200, 3))
+        self.assertEqual(list(PresentationVersion.objects.filter(presentation=self.deck).values_list('version', flat=True).order_by('version')), [1, 2, 3])
+
+    def test_patch_without_precondition(self):
+        response = self.client.patch('/zlide/patchzlide/deck/', [{'op': 'add', 'path': '/slides/-', 'value': 1}], format='json')
+        self.assertEqual((response.status_code, response['ETag']), (200, '"2"'))
+        response = self.client.patch('/zlide/patchzlide/deck/', {'patch': [{'op': 'add', 'path': '/slides/-', 'value': 2}], 'version': 1}, format='json')
+        self.assertEqual(response.status_code, 412)
+        self.deck.refresh_from_db()
+        self.assertEqual((self.deck.version, self.deck.json_data), (2, {'slides': [1]}))
+
+    def test_edit_bumps_version(self):
+        response = self.edit({'json_data': {'slides': [1]}}, **{'If-Match': '"1"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"2"')
+        self.deck.refresh_from_db()
+        self.assertEqual((self.deck.version, self.deck.json_data), (2, {'slides': [1]}))
+
+    def test_stale_version_is_rejected(self):
+        self.assertEqual(self.edit({'json_data': {'slides': [1]}, 'version': 1}).status_code, 200)
+        response = self.edit({'json_data': {'slides': [2]}, 'version': 1})
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response.data['version'], 2)
+        self.deck.refresh_from_db()
+        self.assertEqual(self.deck.json_data, {'slides': [1]})
+
+
+class ListZlideTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for idx in range(5):
+            PresentationData.objects.create(title=f'deck {idx}', json_data=[idx])
+        # Two decks share a created_at, the id breaks the tie
+        PresentationData.objects.filter(title__in=['deck 1', 'deck 2']).update(created_at=now)
+        PresentationData.objects.filter(title='deck 4').update(created_at=now - timedelta(days=1))
+
+    def test_pages_in_order(self):
+        ids, url = [], '/zlide/listzlide/?limit=2'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            self.assertNotIn('json_data', page['results'][0])
+            ids += [row['id'] for row in page['results']]
+            url = page['next']
+        expected = list(PresentationData.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_tampered_cursor(self):
+        for cursor in ('garbage', 'cD0yMDI0'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f'/zlide/listzlide/?cursor={cursor}').status_code, 404)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.cats = PresentationData.objects.create(title='Cats', json_data={'slides': [{'header': 'Whiskers', 'content': 'Cats purr when content'}]})
+        self.dogs = PresentationData.objects.create(title='Dogs', json_data=[{'title': 'Loyal friends', 'content': ['Dogs bark', 'Cats hide']}])
+
+    def ids(self, query):
+        return [row['id'] for row in search.search(query)[0]]
+
+    def test_index_and_query(self):
+        self.assertEqual(self.ids('whiskers'), [self.cats.pk])
+        # Title matches rank above content matches, the last term matches as a prefix
+        self.assertEqual(self.ids('cats'), [self.cats.pk, self.dogs.pk])
+        self.assertEqual(self.ids('fri'), [self.dogs.pk])
+        self.assertIn('<b>', search.search('bark')[0][0]['snippet'])
+        # User input is never parsed as FTS5 syntax
+        self.assertEqual(self.ids('"cats" OR (NEAR'), [])
+        self.assertEqual(search.search('!!!'), ([], False))
+
+    def test_reindex_on_save(self):
+        self.dogs.json_data = [{'title': 'Puppies', 'content': 'Small'}]
+        self.dogs.save()
+        self.assertEqual(self.ids('loyal'), [])
+        self.assertEqual(self.ids('puppies'), [self.dogs.pk])
+
+    def test_deleted_decks_are_excluded(self):
+        PresentationData.objects.filter(pk=self.cats.pk).soft_delete()
+        self.assertEqual(self.ids('cats'), [self.dogs.pk])
+        self.dogs.delete()
+        self.assertEqual(self.ids('cats'), [])
+
+    def test_pagination(self):
+        results, has_more = search.search('cats', limit=1)
+        self.assertEqual(([row['id'] for row in results], has_more), ([self.cats.pk], True))
+        self.assertEqual(search.search('cats', limit=1, offset=1)[1], False)
+        response = self.client.get('/zlide/searchzlide/?q=cats&limit=1')
+        self.assertEqual(response.json()['next_offset'], 1)
+        self.assertEqual(self.client.get('/zlide/searchzlide/').status_code, 400)
+
+
+@override_settings(ZLIDE_JSON_COMPRESSION_THRESHOLD=100)
+class CompressedJSONTest(TestCase):
+    deck = {'slides': [{'header': f'Slide {idx}', 'content': 'The quick brown fox jumps over the lazy dog. ' * 5} for idx in range(10)]}
+
+    def setUp(self):
+        fields._dictionaries.clear()
+
+    def test_small_values_stay_raw(self):
+        self.assertEqual(fields.compress_json({'a': 1})[:1], fields.RAW)
+
+    def test_round_trip(self):
+        stored = fields.compress_json(self.deck)
+        self.assertEqual(stored[:1], fields.ZLIB)
+        self.assertEqual(fields.decompress_json(stored), self.deck)
+
+    def test_dictionary_is_read_from_the_database(self):
+        zdict_id = fields.store_dictionary(fields.train_dictionary([self.deck, self.deck]))
+        with self.settings(ZLIDE_JSON_COMPRESSION_DICTIONARY=zdict_id):
+            stored = fields.compress_json(self.deck)
+        self.assertEqual(stored[:1], fields.ZLIB_DICT)
+        fields._dictionaries.clear()
+        self.assertEqual(fields.decompress_json(stored), self.deck)
+
+    def test_unusable_dictionary_setting_falls_back_to_zlib(self):
+        for setting in ('0badc0de', 'not-hex'):
+            with self.subTest(setting=setting), self.settings(ZLIDE_JSON_COMPRESSION_DICTIONARY=setting):
+                self.assertEqual(fields.compress_json(self.deck)[:1], fields.ZLIB)
+
+    def test_unknown_header_raises(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown compressed JSON header'):
+            fields.decompress_json(b'\x07{"a": 1}')
+
+    def test_recompress_includes_deleted_rows(self):
+        deck = PresentationData.objects.create(title='deck', json_data=self.deck)
+        PresentationData.objects.filter(pk=deck.pk).soft_delete()
+        zdict_id = fields.store_dictionary(fields.train_dictionary([self.deck, self.deck]))
+        with self.settings(ZLIDE_JSON_COMPRESSION_DICTIONARY=zdict_id):
+            call_command('compression_report', '--recompress', stdout=io.StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT json_data FROM {PresentationData._meta.db_table} WHERE id = %s', [deck.pk])
+            self.assertEqual(bytes(cursor.fetchone()[0])[:1], fields.ZLIB_DICT)
+
+
+class DeckCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        PresentationData.objects.create(title='deck', json_data={'slides': [1]})
+
+    def get(self):
+        return self.client.get('/zlide/openzlide/deck/')
+
+    def test_cached_until_edited(self):
+        self.assertEqual(self.get()['ETag'], '"1"')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get().data['json_data'], {'slides': [1]})
+        self.assertEqual(len(queries), 0)
+
+        self.client.patch('/zlide/editzlide/deck/', {'json_data': {'slides': [2]}}, format='json')
+        response = self.get()
+        self.assertEqual((response['ETag'], response.data['json_data']), ('"2"', {'slides': [2]}))
+
+    def test_delete_invalidates(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.client.post('/zlide/deletezlide/', {'title': 'deck'}, format='json')
+        self.assertEqual(self.get().status_code, 404)
+
+    def test_single_flight(self):
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.2)
+            return 1, 1, {'slides': []}
+
+        def fetch():
+            barrier.wait()
+            deck_cache.get_deck('stampede', loader)
+
+        threads = [threading.Thread(target=fetch) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+
+
+class BulkSaveZlideTest(TestCase):
+    def post(self, body, content_type):
+        return APIClient().post('/zlide/bulksavezlide/', body, content_type=content_type)
+
+    def test_array_is_read_in_chunks(self):
+        items = [{'title': f'deck {idx}', 'values': list(range(idx))} for idx in range(50)]
+        stream = io.BytesIO(json.dumps(items).encode('utf-8'))
+        self.assertEqual(list(iter_json_array(stream, chunk_size=7)), items)
+
+    def test_array_separators(self):
+        for body in ('[,,1]', '[1,,2]', '[1 2]', '[1,]', '[1', '{"a": 1}'):
+            with self.subTest(body=body), self.assertRaises(ValueError):
+                list(iter_json_array(io.BytesIO(body.encode('utf-8')), chunk_size=2))
+
+    def test_malformed_item_fails_before_the_end(self):
+        stream = io.BytesIO(('[{"a": tru}, ' + '1, ' * 100000 + '1]').encode('utf-8'))
+        with self.assertRaises(ValueError):
+            list(iter_json_array(stream, chunk_size=64))
+        self.assertLess(stream.tell(), 1024)
+
+    def test_records_are_numbered_alike(self):
+        records = [{'title': 'a', 'presentation_data': []}, 'bad', {'title': 'b', 'presentation_data': []}, 'bad']
+        array = self.post(json.dumps(records), 'application/json')
+        ndjson = self.post('\n\n'.join(json.dumps(record) for record in records), 'application/x-ndjson')
+        for response in (array, ndjson):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.data['created'], response.data['failed']), (2, 2))
+            self.assertEqual([error['record'] for error in response.data['errors']], [2, 4])
+        self.assertEqual([error['line'] for error in ndjson.data['errors']], [3, 7])
+
+    @override_settings(ZLIDE_BULK_MAX_ERRORS=3)
+    def test_reported_errors_are_capped(self):
+        response = self.post(json.dumps(['bad'] * 10), 'application/json')
+        self.assertEqual(response.data['failed'], 10)
+        self.assertEqual(len(response.data['errors']), 3)
+        self.assertEqual(response.data['errors_truncated'], 7)
+
+
+class BulkDeleteZlideTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.decks = {title: PresentationData.objects.create(title=title, json_data=[]) for title in ('a', 'b', 'abc', 'other')}
+        PresentationData.objects.filter(title='other').update(created_at=timezone.now() - timedelta(days=10))
+
+    def delete(self, body):
+        return self.client.post('/zlide/bulkdeletezlide/', body, format='json')
+
+    def remaining(self):
+        return set(PresentationData.objects.values_list('title', flat=True))
+
+    def test_filters_are_combined(self):
+        response = self.delete({'titles': ['a', 'abc', 'other'], 'created_after': (timezone.now() - timedelta(days=1)).isoformat()})
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(self.remaining(), {'b', 'other'})
+        # Soft deleted, the rows stay until they are purged
+        self.assertEqual(PresentationData.all_objects.count(), 4)
+
+    def test_only_matching_decks_are_touched(self):
+        self.delete({'ids': [self.decks['b'].pk]})
+        self.assertEqual(self.remaining(), {'a', 'abc', 'other'})
+        self.assertEqual(self.client.get('/zlide/openzlide/a/').status_code, 200)
+        self.assertEqual(self.client.get('/zlide/openzlide/b/').status_code, 404)
+
+    def test_invalid_filters(self):
+        for body in ({}, {'titles': 'abc'}, {'ids': '1'}, {'ids': ['x']}, {'created_before': 'yesterday'}):
+            with self.subTest(body=body):
+                self.assertEqual(self.delete(body).status_code, 400)
+        self.assertEqual(len(self.remaining()), 4)
+
+
+class PurgeDeletedZlidesTest(TestCase):
+    def test_purges_soft_deleted_presentations(self):
+        kept = PresentationData.objects.create(title='kept', json_data={'slides': []})
+        PresentationData.objects.create(title='gone', json_data={'slides': ['x' * 100]})
+        PresentationData.objects.filter(title='gone').soft_delete()
+        output = io.StringIO()
+        call_command('purge_deleted_zlides', grace_seconds=0, pause=0, stdout=output)
+        self.assertRegex(output.getvalue(), r'^Purged 1 presentations, reclaimed \d+\sbytes of slide data')
+        self.assertEqual(list(PresentationData.all_objects.values_list('pk', flat=True)), [kept.pk])
+
+
+class CollectSlideBlobsTest(TestCase):
+    def age_blobs(self):
+        SlideBlob.objects.update(last_referenced=timezone.now() - timedelta(days=1))
+
+    def test_only_unreferenced_blobs_are_deleted(self):
+        deck = PresentationData.objects.create(title='deck', json_data=[{'content': 'kept'}])
+        history.record_versions([(deck.pk, 2, 'deck', [{'content': 'kept'}, {'content': 'dropped'}])])
+        PresentationVersion.objects.filter(presentation=deck, version=2).delete()
+        self.assertEqual(SlideBlob.objects.count(), 2)
+        # Recently referenced blobs are kept whatever min_age says
+        self.assertEqual(collect_slide_blobs(min_age=timedelta(0)), (0, 0))
+
+        self.age_blobs()
+        self.assertEqual(collect_slide_blobs(min_age=timedelta(0))[0], 1)
+        self.assertEqual(list(SlideBlob.objects.values_list('data', flat=True)), [{'content': 'kept'}])
+
+    def test_delete_checks_references_again(self):
+        history.record_versions([(PresentationData.objects.create(title='deck', json_data=[]).pk, 2, 'deck', [{'content': 'a'}])])
+        PresentationVersion.objects.filter(version=2).delete()
+        self.age_blobs()
+        with CaptureQueriesContext(connection) as queries:
+            collect_slide_blobs(min_age=timedelta(0))
+        delete = next(query['sql'] for query in queries if query['sql'].startswith('DELETE'))
+        self.assertIn(PresentationVersion._meta.db_table, delete)
+        self.assertIn('last_referenced', delete)
+
+    def test_reused_blob_is_touched(self):
+        deck = PresentationData.objects.create(title='deck', json_data=[{'content': 'a'}])
+        self.age_blobs()
+        history.record_versions([(deck.pk, 2, 'deck', [{'content': 'a'}])])
+        self.assertEqual(collect_slide_blobs(min_age=timedelta(hours=1)), (0, 0))
+        blob = SlideBlob.objects.get()
+        self.assertGreaterEqual(blob.last_referenced, deck.created_at)
+        self.assertLess(blob.created_at, deck.created_at + timedelta(seconds=1))
+
+    def test_recent_reuse_is_not_written(self):
+        deck = PresentationData.objects.create(title='deck', json_data=[{'content': 'a'}])
+        referenced = timezone.now() - timedelta(minutes=1)
+        SlideBlob.objects.update(last_referenced=referenced)
+        history.record_versions([(deck.pk, 2, 'deck', [{'content': 'a'}])])
+        self.assertEqual(SlideBlob.objects.get().last_referenced, referenced)
+
+    def test_version_clash_is_not_hidden(self):
+        deck = PresentationData.objects.create(title='deck', json_data=[{'content': 'a'}])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            history.record_versions([(deck.pk, 1, 'deck', [{'content': 'b'}])])
+
+
+class ZlideHistoryTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.deck = PresentationData.objects.create(title='deck', json_data={'theme': 'dark', 'slides': [{'title': 'a'}, {'title': 'b'}]})
+        self.edit('deck', {'theme': 'dark', 'slides': [{'title': 'a'}, {'title': 'c'}]})
+        self.other = PresentationData.objects.create(title='other', json_data=[{'title': 'x'}])
+        for idx in range(3):
+            self.edit('other', [{'title': f'x{idx}'}])
+
+    def edit(self, title, json_data):
+        response = self.client.patch(f'/zlide/editzlide/{title}/', {'json_data': json_data}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_lists_versions(self):
+        response = self.client.get('/zlide/zlideversions/deck/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['current_version'], 2)
+        self.assertEqual([v['version'] for v in response.data['versions']], [2, 1])
+        self.assertEqual(response.data['versions'][0]['slide_count'], 2)
+        self.assertEqual(self.client.get('/zlide/zlideversions/missing/').status_code, 404)
+
+    def test_diff(self):
+        response = self.client.get('/zlide/zlideversions/deck/diff/?from=1')
+        self.assertEqual(response.status_code, 200)
+        changed = [change for change in response.data['changes'] if change['op'] != 'equal']
+        self.assertEqual(changed, [{'op': 'replace', 'from_slides': [1, 2], 'to_slides': [1, 2], 'removed': [{'title': 'b'}], 'added': [{'title': 'c'}]}])
+        for query in ('', '?from=x', '?from=1&to=y'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/zlide/zlideversions/deck/diff/{query}').status_code, 400)
+
+    def test_restore(self):
+        response = self.client.post('/zlide/restorezlide/deck/', {'version': 1}, format='json')
+        self.assertEqual((response.status_code, response.data['version']), (200, 3))
+        self.deck.refresh_from_db()
+        self.assertEqual(self.deck.json_data, {'theme': 'dark', 'slides': [{'title': 'a'}, {'title': 'b'}]})
+        for body in ({}, {'version': 'x'}):
+            with self.subTest(body=body):
+                self.assertEqual(self.client.post('/zlide/restorezlide/deck/', body, format='json').status_code, 400)
+
+    def test_versions_are_scoped_to_their_deck(self):
+        # other has a version 4, deck does not
+        self.assertEqual(self.client.get('/zlide/zlideversions/deck/diff/?from=1&to=4').status_code, 404)
+        self.assertEqual(self.client.post('/zlide/restorezlide/deck/', {'version': 4}, format='json').status_code, 404)
+        self.deck.refresh_from_db()
+        self.assertEqual(self.deck.version, 2)
+        self.assertEqual([v['version'] for v in self.client.get('/zlide/zlideversions/other/').data['versions']], [4, 3, 2, 1])
+
+    def test_deleted_deck_is_hidden(self):
+        PresentationData.objects.filter(pk=self.deck.pk).soft_delete()
+        self.assertEqual(self.client.get('/zlide/zlideversions/deck/').status_code, 404)
+        self.assertEqual(self.client.get('/zlide/zlideversions/deck/diff/?from=1').status_code, 404)
+        self.assertEqual(self.client.post('/zlide/restorezlide/deck/', {'version': 1}, format='json').status_code, 404)
+
+    def test_slides_of_a_dict_deck_are_stored_once(self):
+        # One blob per distinct slide, the theme lives in the version's wrapper
+        digests = {digest for slides in self.deck.versions.values_list('slides', flat=True) for digest in slides}
+        self.assertEqual(sorted(SlideBlob.objects.filter(digest__in=digests).values_list('data', flat=True), key=str), [{'title': 'a'}, {'title': 'b'}, {'title': 'c'}])
+        version = self.deck.versions.get(version=2)
+        self.assertEqual(version.wrapper, {'theme': 'dark', 'slides': None})
+        self.assertEqual(len(version.slides), 2)
+        self.assertEqual(version.slides[0], self.deck.versions.get(version=1).slides[0])
+        self.assertEqual(history.materialize(version), {'theme': 'dark', 'slides': [{'title': 'a'}, {'title': 'c'}]})
+
+
+class RegenerateSlideTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.deck = PresentationData.objects.create(title='deck', json_data={'theme': 'dark', 'slides': [
+            {'header': 'Intro', 'content': 'a'}, {'header': 'Middle', 'content': 'b'}, {'header': 'End', 'content': 'c'},
+        ]})
+        complete = mock.patch.object(generation, 'complete', return_value='{"title": "Better middle", "content": "fresh"}')
+        self.complete = complete.start()
+        self.addCleanup(complete.stop)
+
+    def regenerate(self, body, title='deck'):
+        return self.client.post(f'/zlide/regenerateslide/{title}/', body, format='json')
+
+    def test_only_that_slide_is_rewritten(self):
+        response = self.regenerate({'slide': 2, 'instructions': 'Shorter.'})
+        self.assertEqual((response.status_code, response.data['version'], response['ETag']), (200, 2, '"2"'))
+        prompt = self.complete.call_args[0][0]
+        for text in ('"Intro"', '"End"', 'Middle', 'Shorter.'):
+            self.assertIn(text, prompt)
+        self.deck.refresh_from_db()
+        self.assertEqual(self.deck.json_data, {'theme': 'dark', 'slides': [
+            {'header': 'Intro', 'content': 'a'}, {'header': 'Better middle', 'content': 'fresh'}, {'header': 'End', 'content': 'c'},
+        ]})
+        self.assertEqual(history.materialize(self.deck.versions.get(version=2)), self.deck.json_data)
+
+    def test_out_of_range_slides(self):
+        for body in ({}, {'slide': 'x'}, {'slide': 0}, {'slide': -1}, {'slide': 4}):
+            with self.subTest(body=body):
+                self.assertEqual(self.regenerate(body).status_code, 400)
+        self.complete.assert_not_called()
+        self.deck.refresh_from_db()
+        self.assertEqual(self.deck.version, 1)
+
+    def test_rejected_requests(self):
+        self.assertEqual(self.regenerate({'slide': 1}, title='missing').status_code, 404)
+        self.assertEqual(self.regenerate({'slide': 1, 'version': 5}).status_code, 412)
+        PresentationData.objects.create(title='empty', json_data={'slides': []})
+        self.assertEqual(self.regenerate({'slide': 1}, title='empty').status_code, 422)
+        self.complete.assert_not_called()
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        exports = tempfile.TemporaryDirectory()
+        self.addCleanup(exports.cleanup)
+        self.enterContext(override_settings(ZLIDE_EXPORT_DIR=exports.name))
+        self.exports = exports.name
+
+    def test_download_leaves_no_file(self):
+        PresentationData.objects.create(title='deck', json_data={'slides': [{'header': 'Intro', 'content': 'Hello'}]})
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(email='user@example.com', username='user', password='password'))
+        response = client.get('/zlide/downloadzlide/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filename="output.pptx"', response['Content-Disposition'])
+        self.assertTrue(zipfile.is_zipfile(io.BytesIO(b''.join(response.streaming_content))))
+        response.close()
+        self.assertEqual(os.listdir(self.exports), [])
+
+    def test_sweep_only_touches_old_exports(self):
+        old = time.time() - 7200
+        for name in ('old.pptx', 'notes.txt'):
+            with open(os.path.join(self.exports, name), 'wb') as f:
+                f.write(b'x')
+            os.utime(os.path.join(self.exports, name), (old, old))
+        open(os.path.join(self.exports, 'new.pptx'), 'wb').close()
+        self.assertEqual(maintenance.sweep_temp_files(timedelta(hours=1), self.exports), (1, 1))
+        self.assertEqual(sorted(os.listdir(self.exports)), ['new.pptx', 'notes.txt'])
+
+
+class MetricsTest(TestCase):
+    def test_metrics_need_a_token(self):
+        with self.settings(DEBUG=False, ZLIDE_METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with self.settings(DEBUG=False, ZLIDE_METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'zlide_request_duration_seconds', response.content)
+        # DEBUG is on in settings.py, it must not open the endpoint
+        with self.settings(DEBUG=True, ZLIDE_METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_server_timing_only_when_enabled(self):
+        with self.settings(DEBUG=False, ZLIDE_SERVER_TIMING=False):
+            self.assertNotIn('Server-Timing', self.client.get('/zlide/listzlide/'))
+        with self.settings(DEBUG=False, ZLIDE_SERVER_TIMING=True):
+            self.assertIn('db;dur=', self.client.get('/zlide/listzlide/')['Server-Timing'])
+        with self.settings(DEBUG=True, ZLIDE_SERVER_TIMING=False):
+            self.assertNotIn('Server-Timing', self.client.get('/zlide/listzlide/'))
+
+
+class SchemaTest(TestCase):
+    def setUp(self):
+        CachedSpectacularAPIView.clear()
+        self.addCleanup(CachedSpectacularAPIView.clear)
+
+    def test_schema_is_generated_once(self):
+        with mock.patch('zlideT2.schema.generate_schema', wraps=schema.generate_schema) as generate:
+            first = self.client.get('/api/schema/')
+            second = self.client.get('/api/schema/')
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn(b'/zlide/zlideversions/{title}/', first.content)
+
+    def test_if_none_match(self):
+        etag = self.client.get('/api/schema/')['ETag']
+        response = self.client.get('/api/schema/', headers={'If-None-Match': etag})
+        self.assertEqual((response.status_code, response.content, response['ETag']), (304, b'', etag))
+        self.assertEqual(self.client.get('/api/schema/', headers={'If-None-Match': '"stale"'}).status_code, 200)
+        # Every rendering has its own ETag
+        response = self.client.get('/api/schema/?format=json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['openapi'][:1], '3')
+
+    def test_schema_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.yml', delete=False) as f:
+            f.write('openapi: 3.0.3\ninfo:\n  title: From the file\n  version: 1.0.0\npaths: {}\n')
+        self.addCleanup(os.remove, f.name)
+        with self.settings(ZLIDE_OPENAPI_SCHEMA_FILE=f.name), mock.patch('zlideT2.schema.generate_schema') as generate:
+            response = self.client.get('/api/schema/')
+        generate.assert_not_called()
+        self.assertIn(b'From the file', response.content)
+
+
+@override_settings(ZLIDE_COMPRESSION_MIN_SIZE=0)
+class CompressionTest(TestCase):
+    def encoding(self, path):
+        return self.client.get(path, headers={'Accept-Encoding': 'br, gzip'}).get('Content-Encoding')
+
+    def test_brotli_only_on_token_free_paths(self):
+        for idx in range(20):
+            PresentationData.objects.create(title=f'deck {idx}', json_data=[])
+        expected = 'br' if compression.brotli is not None else 'gzip'
+        self.assertEqual(self.encoding('/zlide/listzlide/'), expected)
+        self.assertEqual(self.encoding('/api/schema/'), expected)
+        # The login form carries a CSRF token
+        self.assertEqual(self.encoding('/admin/login/'), 'gzip')
+
+    def test_only_ok_responses(self):
+        self.assertEqual(self.client.get('/zlide/openzlide/missing/').status_code, 404)
+        self.assertIsNone(self.encoding('/zlide/openzlide/missing/'))
+        etag = self.client.get('/api/schema/')['ETag']
+        response = self.client.get('/api/schema/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_file_responses_are_not_compressed(self):
+        with tempfile.NamedTemporaryFile(suffix='.txt') as f:
+            f.write(b'x' * 10000)
+            f.flush()
+            with mock.patch('zlidegenerator.views.ListZlideView.get', lambda *args, **kwargs: FileResponse(open(f.name, 'rb'))):
+                response = self.client.get('/zlide/listzlide/', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('Content-Encoding', response)
+            self.assertEqual(b''.join(response.streaming_content), b'x' * 10000)
+            response.close()
+
+    def test_choose_encoding(self):
+        self.assertEqual(compression.choose_encoding('gzip;q=0.5, br;q=0', allow_brotli=True), 'gzip')
+        self.assertEqual(compression.choose_encoding('br', allow_brotli=False), None)
+        self.assertEqual(compression.choose_encoding('identity'), None)
+
+
+def make_pptx(*slides):
+    """
+    A minimal .pptx holding `slides`, a (title, [paragraphs]) pair each.
+    """
+    ns = ('xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+          'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+          'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        ids = ''.join(f'<p:sldId id="{256 + idx}" r:id="rId{idx}"/>' for idx in range(1, len(slides) + 1))
+        archive.writestr('ppt/presentation.xml', f'<p:presentation {ns}><p:sldIdLst>{ids}</p:sldIdLst></p:presentation>')
+        rels = ''.join(f'<Relationship Id="rId{idx}" Target="slides/slide{idx}.xml"/>' for idx in range(1, len(slides) + 1))
+        archive.writestr('ppt/_rels/presentation.xml.rels', f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{rels}</Relationships>')
+        for idx, (title, paragraphs) in enumerate(slides, start=1):
+            body = ''.join(f'<a:p><a:r><a:t>{text}</a:t></a:r></a:p>' for text in paragraphs)
+            archive.writestr(f'ppt/slides/slide{idx}.xml', f"""<p:sld {ns}><p:cSld><p:spTree>
+                <p:sp><p:nvSpPr><p:nvPr><p:ph type="title"/></p:nvPr></p:nvSpPr><p:txBody><a:p><a:r><a:t>{title}</a:t></a:r></a:p></p:txBody></p:sp>
+                <p:sp><p:txBody>{body}</p:txBody></p:sp>
+            </p:spTree></p:cSld></p:sld>""")
+    return buffer.getvalue()
+
+
+class ImportTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def test_extract_slides(self):
+        data = make_pptx(('Intro', ['First point', 'Second point']), ('', ['Only text']))
+        self.assertEqual(imports.extract_slides(io.BytesIO(data), len(data)), [
+            {'slide': 1, 'title': 'Intro', 'content': 'First point\nSecond point'},
+            {'slide': 2, 'title': 'Slide 2', 'content': 'Only text'},
+        ])
+
+    def test_caps(self):
+        data = make_pptx(('One', ['x' * 1000]), ('Two', []))
+        with self.settings(ZLIDE_IMPORT_MAX_SLIDES=1), self.assertRaisesRegex(imports.ImportFailed, 'at most 1'):
+            imports.extract_slides(io.BytesIO(data), len(data))
+        # A part is refused on its declared size, before it is decompressed
+        with self.settings(ZLIDE_IMPORT_MAX_PART_SIZE=500), self.assertRaisesRegex(imports.ImportFailed, 'slide1.xml is too large'):
+            imports.extract_slides(io.BytesIO(data), len(data))
+        with self.assertRaisesRegex(imports.ImportFailed, 'not a .pptx'):
+            imports.extract_slides(io.BytesIO(b'not a zip'), 9)
+
+    def test_import_deletes_upload(self):
+        upload = SimpleUploadedFile('deck.pptx', make_pptx(('Intro', ['Hello'])))
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(imports, 'process_import') as process:
+            response = self.client.post('/zlide/importzlide/', {'file': upload})
+        self.assertEqual(response.status_code, 202)
+        # Nothing is parsed on the web thread, the importer process picks it up
+        process.assert_not_called()
+        pk = response.json()['import_id']
+
+        path = PowerPointPresentation.objects.get(pk=pk).file.path
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(imports.run_imports(), (1, 0))
+        job = PowerPointPresentation.objects.get(pk=pk)
+        self.assertEqual((job.status, job.file.name, job.presentation.json_data[0]['title']), (PowerPointPresentation.DONE, '', 'Intro'))
+        self.assertFalse(os.path.exists(path))
+
+    def test_expire_skips_unfinished(self):
+        old = timezone.now() - timedelta(days=2)
+        done = PowerPointPresentation.objects.create(text='', status=PowerPointPresentation.DONE)
+        running = PowerPointPresentation.objects.create(text='', status=PowerPointPresentation.PROCESSING, claimed_at=timezone.now())
+        abandoned = PowerPointPresentation.objects.create(text='', status=PowerPointPresentation.PENDING)
+        PowerPointPresentation.objects.update(created_at=old)
+
+        self.assertEqual(expire_uploads(timedelta(days=1))[0], 1)
+        self.assertFalse(PowerPointPresentation.objects.filter(pk=done.pk).exists())
+        self.assertEqual(PowerPointPresentation.objects.get(pk=running.pk).status, PowerPointPresentation.PROCESSING)
+        # Marked failed first so a client polling it sees why, deleted on the next run
+        self.assertEqual(PowerPointPresentation.objects.get(pk=abandoned.pk).status, PowerPointPresentation.FAILED)
+        self.assertEqual(expire_uploads(timedelta(days=1))[0], 1)
+        self.assertTrue(PowerPointPresentation.objects.filter(pk=running.pk).exists())
+
+
+class AdmissionTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_weighted_slots(self):
+        gate = admission.Gate('test', limit=4, queue_size=0, max_wait=0, per_user=10)
+        heavy = gate.acquire('a', weight=3)
+        light = gate.acquire('b')
+        with self.assertRaises(admission.Overloaded):
+            gate.acquire('c')
+        heavy.release()
+        light.release()
+        # Clipped to the whole gate rather than never admitted
+        self.assertEqual(gate.acquire('c', weight=10).weight, 4)
+
+    def test_global_slots_all_or_nothing(self):
+        gate = admission.Gate('test', limit=10, queue_size=0, max_wait=0.1, per_user=10, global_limit=3)
+        first = gate.acquire('a', weight=2)
+        with self.assertRaises(admission.Overloaded):
+            gate.acquire('b', weight=2)
+        keys = [f'zlide:admission:test:slot:{index}' for index in range(3)]
+        self.assertEqual(len(cache.get_many(keys)), 2)
+        first.release()
+        self.assertEqual(cache.get_many(keys), {})
+
+
+    def test_global_lease_is_renewed_while_running(self):
+        gate = admission.Gate('test', limit=10, queue_size=0, max_wait=0, per_user=10, global_limit=1, lease=0.3)
+        slot = gate.acquire('a')
+        time.sleep(0.7)
+        self.assertEqual(cache.get('zlide:admission:test:slot:0'), slot.global_keys[0][1])
+        slot.release()
+        self.assertIsNone(cache.get('zlide:admission:test:slot:0'))
+        self.assertEqual(gate._held, set())
+
+    def test_cache_failure_releases_the_local_slot(self):
+        gate = admission.Gate('test', limit=1, queue_size=0, max_wait=0, per_user=10, global_limit=1)
+        with mock.patch.object(admission.cache, 'get_many', side_effect=ConnectionError), self.assertRaises(ConnectionError):
+            gate.acquire('a')
+        self.assertEqual((gate._running, dict(gate._running_by_identity)), (0, {}))
+        gate.acquire('a').release()
+
+    def test_anonymous_clients_by_address(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7, 10.0.0.1')
+        request.user = AnonymousUser()
+        gate = admission.Gate('test', limit=10, queue_size=0, max_wait=0, per_user=10)
+        with self.settings(CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR'):
+            self.assertEqual(admission.admit(request, gate).identity, 'ip:203.0.113.7')
+        with self.settings(CLIENT_IP_HEADER=None):
+            self.assertEqual(admission.admit(request, gate).identity, 'ip:10.0.0.1')
+
+
+@override_settings(ZLIDE_DOCUMENT_CHUNK_TOKENS=200, ZLIDE_DOCUMENT_REDUCE_TOKENS=300)
+class DocumentTest(SimpleTestCase):
+    document = '\n\n'.join(' '.join(f'Paragraph {idx} sentence {n} has a few words.' for n in range(8)) for idx in range(40))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_routing(self):
+        def is_document(text, **data):
+            return views.GenerateZlideView()._is_document(SimpleNamespace(data=dict(data, text=text)), text)
+
+        prose = ' '.join(f'Sentence {idx} of a long report.' for idx in range(100))
+        self.assertTrue(is_document(prose))
+        # Markers the "Slide" split understands keep the local parse, numbered or not
+        for marked in (f'Slide 1: {prose}', f'Slide One: {prose}', f'{prose} Slide: the end'):
+            with self.subTest(text=marked[:12]):
+                self.assertFalse(is_document(marked))
+        # So does text too short to be worth summarizing
+        self.assertFalse(is_document(prose[:200]))
+        self.assertTrue(is_document(prose[:200], mode='document'))
+        self.assertFalse(is_document(prose, mode='single'))
+
+    def test_pieces(self):
+        paragraph = 'Short one. ' + ' '.join(f'word{idx}' for idx in range(300)) + '. Last one.'
+        pieces = list(generation._pieces(paragraph, 50))
+        self.assertTrue(all(generation.estimate_tokens(piece) <= 50 for piece in pieces))
+        self.assertEqual(' '.join(pieces).split(), paragraph.split())
+        self.assertEqual(list(generation._pieces('Fits.', 50)), ['Fits.'])
+
+    def test_split_document(self):
+        chunks = generation.split_document(self.document)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(generation.estimate_tokens(chunk) <= 200 for chunk in chunks))
+        self.assertEqual('\n\n'.join(chunks), self.document)
+        # An edit only moves the boundaries around it
+        edited = self.document.replace('Paragraph 20 sentence 3', 'Paragraph 20 sentence three')
+        self.assertGreaterEqual(len(set(chunks) & set(generation.split_document(edited))), len(chunks) - 2)
+
+    def test_call_cap(self):
+        chunks = len(generation.split_document(self.document))
+        with mock.patch.object(generation, 'complete', return_value='Summary.') as complete, \
+                mock.patch.object(generation, 'complete_json', return_value=[]):
+            with self.assertRaises(generation.DocumentTooLong):
+                generation.generate_document_deck(self.document, 3, max_calls=chunks + 1)
+            self.assertEqual(complete.call_count, 0)
+            generation.generate_document_deck(self.document, 3, max_calls=chunks + 2)
+            self.assertEqual(complete.call_count, chunks)
+            # Cached summaries cost nothing
+            generation.generate_document_deck(self.document, 3, max_calls=2)
+            self.assertEqual(complete.call_count, chunks)
+
+
+def completion(content):
+    return mock.Mock(choices=[mock.Mock(message=mock.Mock(content=content))])
+
+
+class RepairTest(SimpleTestCase):
+    def test_parse_json(self):
+        self.assertEqual(repair.parse_json('[1, 2]'), ([1, 2], False))
+        self.assertEqual(repair.parse_json('Sure:\n```json\n{"a": [1, 2,],}\n```'), ({'a': [1, 2]}, True))
+        # Cut off: closed after the last complete element
+        self.assertEqual(repair.parse_json('[{"content": "a"}, {"content": "b'), ([{'content': 'a'}], True))
+        for text in ('', 'no json here', 'x [1, 2}'):
+            with self.assertRaises(repair.RepairFailed):
+                repair.parse_json(text)
+
+    def test_cut_off_inside_a_wrapper(self):
+        text = '{"theme": "dark", "slides": [{"title": "A", "content": ["x", "y"]}, {"title": "B", "content": ["p", "q'
+        self.assertEqual(repair.parse_json(text), ({'theme': 'dark', 'slides': [{'title': 'A', 'content': ['x', 'y']}]}, True))
+        slides, _ = repair.parse_json(text, repair.validate_slides)
+        self.assertEqual([slide['title'] for slide in slides], ['A'])
+        self.assertEqual(repair.parse_json('{"slides": [1, 2, 3'), ({'slides': [1, 2]}, True))
+
+    def test_long_reply_is_linear(self):
+        # The comma lookahead used to copy the rest of the reply at every comma
+        text = '[' + ', '.join(['{"content": "a"}'] * 200000)
+        start = time.perf_counter()
+        value, repaired = repair.parse_json(text)
+        self.assertEqual((len(value), repaired), (200000, True))
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_brackets_in_prose(self):
+        text = 'Here are [5] slides: [{"title": "A", "content": "a"}, {"title": "B", "content": "b"}]'
+        self.assertEqual(repair.parse_json(text), ([5], True))
+        slides, repaired = repair.parse_json(text, repair.validate_slides)
+        self.assertEqual(([slide['title'] for slide in slides], repaired), (['A', 'B'], True))
+        with self.assertRaisesRegex(repair.RepairFailed, 'Expected 3 slides, got 2'):
+            repair.parse_json(text, lambda value: repair.validate_slides(value, 3))
+
+    def test_validate_slides(self):
+        self.assertEqual(repair.validate_slides({'slides': [{'content': 'a'}, {'slide': 7, 'title': 'T', 'content': ['b']}]}), [
+            {'slide': 1, 'title': 'Slide 1', 'content': 'a'},
+            {'slide': 7, 'title': 'T', 'content': ['b']},
+        ])
+        for value in ([], {}, [{'title': 'x'}], [{'content': 1}], 'text'):
+            with self.assertRaises(repair.RepairFailed):
+                repair.validate_slides(value)
+        with self.assertRaises(repair.RepairFailed):
+            repair.validate_slides([{'content': 'a'}], expected=2)
+
+    def test_continuation_skips_prose(self):
+        replies = [completion('Here are [2] slides: [{"title": "A", "content": "a"}, {"title": "B", "con'), completion('tent": "b"}]')]
+        with mock.patch.object(generation, '_create', side_effect=replies):
+            slides = generation.generate_deck('topic', 2)
+        self.assertEqual([slide['title'] for slide in slides], ['A', 'B'])
@@ -0,0 +1,187 @@
+import contextvars
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current = contextvars.ContextVar('zlide_request_timing', default=None)
+
+
+class Histogram:
+    """
+    A Prometheus style histogram with fixed buckets, one series per label set.
+    Observations take a lock and a bisect, so they are cheap enough for every
+    request. Values are kept per process.
+    """
+    def __init__(self, name, documentation, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # One counter per bucket plus +Inf, then the sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, labels))
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            suffix = f'{{{label_text}}}' if label_text else ''
+            lines.append(f'{self.name}_sum{suffix} {values[-1]}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    """
+    A Prometheus style counter, one series per label set, kept per process.
+    """
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._series.get(labels, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            series = dict(self._series)
+        for labels, count in sorted(series.items()):
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, labels))
+            suffix = f'{{{label_text}}}' if label_text else ''
+            lines.append(f'{self.name}{suffix} {count}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram('zlide_request_duration_seconds', 'Time spent handling requests.', ('view', 'method', 'status'))
+SPAN_DURATION = Histogram('zlide_span_duration_seconds', 'Time spent in each phase of a request.', ('view', 'span'))
+DB_DURATION = Histogram('zlide_db_duration_seconds', 'Time spent in SQL queries per request.', ('view',))
+DB_QUERIES = Histogram('zlide_db_queries', 'SQL queries per request.', ('view',), buckets=QUERY_BUCKETS)
+
+METRICS = [REQUEST_DURATION, SPAN_DURATION, DB_DURATION, DB_QUERIES]
+
+
+class RequestTiming:
+    def __init__(self):
+        self.spans = {}
+        self.queries = 0
+        self.db_time = 0.0
+
+    def add(self, name, duration):
+        self.spans[name] = self.spans.get(name, 0.0) + duration
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+@contextmanager
+def span(name):
+    """
+    Time a phase of the current request, e.g. `with span('llm'): ...`. Spans
+    with the same name add up. Outside a request this does nothing.
+    """
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+def _server_timing(timing, total):
+    entries = [f'{name};dur={duration * 1000:.1f}' for name, duration in timing.spans.items()]
+    entries.append(f'db;dur={timing.db_time * 1000:.1f};desc="{timing.queries} queries"')
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+class ServerTimingMiddleware:
+    """
+    Times every request, its spans and its SQL queries. The result goes into
+    the histograms served at /metrics and, with ZLIDE_SERVER_TIMING on, into
+    a Server-Timing response header that browser dev tools display.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+        REQUEST_DURATION.observe(total, view, request.method, str(response.status_code))
+        DB_DURATION.observe(timing.db_time, view)
+        DB_QUERIES.observe(timing.queries, view)
+        for name, duration in timing.spans.items():
+            SPAN_DURATION.observe(duration, view, name)
+
+        if settings.ZLIDE_SERVER_TIMING:
+            response['Server-Timing'] = _server_timing(timing, total)
+        return response
+
+
+def metrics(request):
+    """
+    Prometheus text exposition of the request histograms of this process.
+    Only served with ZLIDE_METRICS_TOKEN set and sent as a bearer token.
+    """
+    token = settings.ZLIDE_METRICS_TOKEN
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    body = '\n'.join(metric.render() for metric in METRICS) + '\n'
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
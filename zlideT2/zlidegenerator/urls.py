@@ -5,10 +5,21 @@ from . import views
 urlpatterns = [
     path('generatezlide/', views.GenerateZlideView.as_view(), name='generatezlide'),
     path('savezlide/', views.SaveZlideView.as_view(), name='savezlide'),
+    path('bulksavezlide/', views.BulkSaveZlideView.as_view(), name='bulksavezlide'),
+    path('importzlide/', views.ImportZlideView.as_view(), name='importzlide'),
+    path('importzlide/<int:pk>/', views.ImportZlideStatusView.as_view(), name='importzlidestatus'),
     path('downloadzlide/', views.DownloadZlideView.as_view(), name='downloadzlide'),
+    path('listzlide/', views.ListZlideView.as_view(), name='listzlide'),
+    path('searchzlide/', views.SearchZlideView.as_view(), name='searchzlide'),
     path('openzlide/<str:title>/', views.GetZlideView.as_view(), name='openzlide'),
     path('editzlide/<str:title>/', views.EditZlideView.as_view(), name='editzlide'),
+    path('patchzlide/<str:title>/', views.PatchZlideView.as_view(), name='patchzlide'),
+    path('regenerateslide/<str:title>/', views.RegenerateSlideView.as_view(), name='regenerateslide'),
+    path('zlideversions/<str:title>/', views.ZlideVersionsView.as_view(), name='zlideversions'),
+    path('zlideversions/<str:title>/diff/', views.ZlideVersionDiffView.as_view(), name='zlideversiondiff'),
+    path('restorezlide/<str:title>/', views.RestoreZlideView.as_view(), name='restorezlide'),
     path('deletezlide/', views.DeleteZlideView.as_view(), name='deletezlide'),
+    path('bulkdeletezlide/', views.BulkDeleteZlideView.as_view(), name='bulkdeletezlide'),
     # path('templateone/', views.TemplateOneView.as_view(), name='templateone'),
     # path('templatetwo/', views.TemplateTwoView.as_view(), name='templatetwo'),
     # path('templateone/render/<str:title>/', RenderTemplateView.as_view(), name='rendertemplateone'),
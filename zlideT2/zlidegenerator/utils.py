@@ -0,0 +1,280 @@
+import codecs
+import copy
+import json
+
+
+class JSONPatchError(ValueError):
+    pass
+
+
+class JSONPatchTestFailed(JSONPatchError):
+    pass
+
+
+def _unescape(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def _split_pointer(pointer):
+    """
+    Split a RFC 6901 JSON pointer into its reference tokens.
+    """
+    if not isinstance(pointer, str):
+        raise JSONPatchError(f"Invalid JSON pointer: {pointer!r}")
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JSONPatchError(f"JSON pointer must start with '/': {pointer}")
+    return [_unescape(token) for token in pointer[1:].split('/')]
+
+
+def _list_index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    # isdigit() alone also accepts digits such as '²' that int() rejects
+    if not (token.isascii() and token.isdigit()) or (len(token) > 1 and token.startswith('0')):
+        raise JSONPatchError(f"Invalid array index: {token}")
+    index = int(token)
+    limit = len(container) if allow_end else len(container) - 1
+    if index > limit:
+        raise JSONPatchError(f"Array index out of range: {token}")
+    return index
+
+
+def _equal(a, b):
+    # RFC 6902 equality: true is not 1, numbers compare by value, lists and
+    # objects member by member with the same rules
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_equal(a[key], b[key]) for key in a)
+    return a == b
+
+
+def _resolve(document, tokens):
+    target = document
+    for token in tokens:
+        if isinstance(target, list):
+            target = target[_list_index(target, token)]
+        elif isinstance(target, dict):
+            if token not in target:
+                raise JSONPatchError(f"Path not found: {token}")
+            target = target[token]
+        else:
+            raise JSONPatchError(f"Cannot traverse into a scalar at: {token}")
+    return target
+
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+    parent = _resolve(document, tokens[:-1])
+    key = tokens[-1]
+    if isinstance(parent, list):
+        parent.insert(_list_index(parent, key, allow_end=True), value)
+    elif isinstance(parent, dict):
+        parent[key] = value
+    else:
+        raise JSONPatchError(f"Cannot add a member to a scalar at: {key}")
+    return document
+
+
+def _remove(document, tokens):
+    if not tokens:
+        raise JSONPatchError("Cannot remove the whole document")
+    parent = _resolve(document, tokens[:-1])
+    key = tokens[-1]
+    if isinstance(parent, list):
+        return document, parent.pop(_list_index(parent, key))
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise JSONPatchError(f"Path not found: {key}")
+        return document, parent.pop(key)
+    raise JSONPatchError(f"Cannot remove a member from a scalar at: {key}")
+
+
+def _replace(document, tokens, value):
+    if not tokens:
+        return value
+    parent = _resolve(document, tokens[:-1])
+    key = tokens[-1]
+    if isinstance(parent, list):
+        parent[_list_index(parent, key)] = value
+    elif isinstance(parent, dict):
+        if key not in parent:
+            raise JSONPatchError(f"Path not found: {key}")
+        parent[key] = value
+    else:
+        raise JSONPatchError(f"Cannot replace a member of a scalar at: {key}")
+    return document
+
+
+def apply_json_patch(document, operations):
+    """
+    Apply a list of RFC 6902 JSON Patch operations to a copy of the document
+    and return the patched copy. The original document is never modified, so a
+    failing operation leaves nothing half applied.
+    """
+    if not isinstance(operations, list):
+        raise JSONPatchError("A JSON Patch must be a list of operations")
+
+    document = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise JSONPatchError("Each operation needs an 'op' and a 'path'")
+        op = operation['op']
+        tokens = _split_pointer(operation['path'])
+
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JSONPatchError(f"'{op}' operation requires a 'value'")
+        if op in ('move', 'copy') and 'from' not in operation:
+            raise JSONPatchError(f"'{op}' operation requires a 'from'")
+
+        if op == 'add':
+            document = _add(document, tokens, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            document, _ = _remove(document, tokens)
+        elif op == 'replace':
+            document = _replace(document, tokens, copy.deepcopy(operation['value']))
+        elif op == 'move':
+            from_tokens = _split_pointer(operation['from'])
+            if tokens[:len(from_tokens)] == from_tokens and tokens != from_tokens:
+                raise JSONPatchError("Cannot move a value into one of its children")
+            document, value = _remove(document, from_tokens)
+            document = _add(document, tokens, value)
+        elif op == 'copy':
+            value = copy.deepcopy(_resolve(document, _split_pointer(operation['from'])))
+            document = _add(document, tokens, value)
+        elif op == 'test':
+            if not _equal(_resolve(document, tokens), operation['value']):
+                raise JSONPatchTestFailed(f"Test failed at: {operation['path']}")
+        else:
+            raise JSONPatchError(f"Unknown operation: {op}")
+    return document
+
+
+def parse_version(value):
+    """
+    Parse a version from an If-Match header (quoted or weak ETag) or a plain
+    version field. Returns None when no usable version was provided.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    value = value.strip('"')
+    if not (value.isascii() and value.isdigit()):
+        return None
+    return int(value)
+
+
+def iter_ndjson(stream):
+    """
+    Yield (line_number, record_or_error) for every non-blank line of a
+    newline delimited JSON stream, without reading the whole body.
+    """
+    for number, line in enumerate(iter(stream.readline, b''), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, e
+
+
+def _value_complete(text, start):
+    """
+    Whether the JSON value starting at `start` ends inside `text`, judged by
+    its brackets and strings alone, so a value that fails to decode can be
+    told apart from one that continues in the next chunk.
+    """
+    depth = 0
+    in_string = escape = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+                if depth == 0:
+                    return True
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '[{':
+            depth += 1
+        elif char in ']}':
+            if depth <= 1:
+                return True
+            depth -= 1
+        elif depth == 0 and (char == ',' or char in ' \t\r\n'):
+            return True
+    return False
+
+
+def iter_json_array(stream, chunk_size=64 * 1024):
+    """
+    Yield the items of a top-level JSON array read from a stream in chunks, so
+    the request body is never held in memory as a whole. A malformed item
+    raises as soon as its chunk is read rather than at the end of the body.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    # What may come next: the opening bracket, the first item or the closing
+    # bracket, an item after a comma, or a comma or the closing bracket
+    expect = 'array'
+    while True:
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += text_decoder.decode(chunk or b'', final=eof)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position >= len(buffer):
+                break
+            char = buffer[position]
+            if expect == 'array':
+                if char != '[':
+                    raise ValueError('Expected a JSON array')
+                expect = 'first'
+                position += 1
+                continue
+            if expect == 'separator':
+                if char == ']':
+                    return
+                if char != ',':
+                    raise ValueError(f"Expected ',' or ']' between items, got {char!r}")
+                expect = 'item'
+                position += 1
+                continue
+            if char == ']' and expect == 'first':
+                return
+            if char in ',]':
+                raise ValueError(f'Expected an item, got {char!r}')
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof or _value_complete(buffer, position):
+                    raise
+                break # The item continues in the next chunk
+            if end == len(buffer) and not eof:
+                break # A number may continue in the next chunk
+            yield item
+            position = end
+            expect = 'separator'
+        buffer = buffer[position:]
+        if eof:
+            raise ValueError('Unterminated JSON array')
@@ -1,39 +1,73 @@
 import os
 import json
+import re
+import tempfile
+import zipfile
 from random import randint
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import F
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.template.defaultfilters import filesizeformat
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from rest_framework.exceptions import NotFound
-from rest_framework.generics import GenericAPIView
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.generics import GenericAPIView, ListAPIView
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework import status
 from drf_spectacular.types import OpenApiTypes
-from drf_spectacular.utils import extend_schema
-from pptx import Presentation
-import nltk
-from nltk import word_tokenize
-from nltk import pos_tag
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from .models import PresentationData
-from .serializers import PresentationDataSerializer
-from openai import OpenAI
+from .serializers import BulkDeleteSerializer, PresentationDataSerializer, PresentationDataListSerializer
+from .pagination import PresentationCursorPagination
+from .parsers import JSONPatchParser
+from . import search
+from . import cache as deck_cache
+from . import history
+from .models import PresentationVersion, PowerPointPresentation
+from .utils import apply_json_patch, parse_version, JSONPatchError, JSONPatchTestFailed, iter_ndjson, iter_json_array
+from . import generation
+from .timing import span
+from . import admission
+from . import imports
 
 
-nltk.download('punkt')
-nltk.download('averaged_perceptron_tagger')
+# python-pptx, NLTK and the OpenAI client are slow to import and only a few
+# requests need them, so they are loaded on first use instead of at startup
+_nltk_ready = False
 
-# Setting the NLTK data path
-nltk.data.path.append(os.path.join(os.path.dirname(__file__), 'nltk_data'))
 
-OpenAI.api_key = os.environ.get("OPENAI_API_KEY")
-client = OpenAI()
+def _nltk():
+    global _nltk_ready
+    import nltk
+    if not _nltk_ready:
+        # Setting the NLTK data path
+        nltk.data.path.append(os.path.join(os.path.dirname(__file__), 'nltk_data'))
+        for resource, package in (('tokenizers/punkt', 'punkt'), ('taggers/averaged_perceptron_tagger', 'averaged_perceptron_tagger')):
+            try:
+                nltk.data.find(resource)
+            except LookupError:
+                nltk.download(package)
+        _nltk_ready = True
+    return nltk
+
+
+def overloaded(exc):
+    response = Response({'error': str(exc)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(exc.retry_after)
+    return response
+
 
 class GenerateZlideView(APIView):
     permission_classes = [AllowAny]
 
     def _extract_first_noun_determiner(self, text):
-        tokens = word_tokenize(text)
-        tagged = pos_tag(tokens)
+        with span('nltk'):
+            nltk = _nltk()
+            tokens = nltk.word_tokenize(text)
+            tagged = nltk.pos_tag(tokens)
 
         noun = determiner = None
         for word, tag in tagged:
@@ -48,6 +82,16 @@ class GenerateZlideView(APIView):
     def _generate_presentation(self, user_input, request):
         user_input = request.data.get('text')
 
+        if len(user_input) >= 50 and self._is_document(request, user_input):
+            if len(user_input) > settings.ZLIDE_DOCUMENT_MAX_CHARS:
+                raise ValidationError({'error': f'text must be at most {settings.ZLIDE_DOCUMENT_MAX_CHARS} characters'})
+            slide_count = self._slide_count(request)
+            try:
+                with span('llm'):
+                    return generation.generate_document_deck(user_input, slide_count)
+            except generation.DocumentTooLong as e:
+                raise ValidationError({'error': str(e)})
+
         if len(user_input) >= 50:
             # Splitting the user input into slides based on "Slide" keyword
             slides = user_input.split("Slide")
@@ -76,29 +120,104 @@ class GenerateZlideView(APIView):
                         zlide.append(zlide_json)
                     except ValueError:
                         continue # Handle any case where the split fails
-            zlide_json_output = json.dumps(zlide, indent=4)
-            return json.loads(zlide_json_output)
+            with span('json'):
+                zlide_json_output = json.dumps(zlide, indent=4)
+                return json.loads(zlide_json_output)
             # Return the list of JSON objects
         else:                    
-            prompt = f"Generate a 5 slide content for a Powerpoint presentation with slides, titles and content and convert them into a JSON array with each item having a slide, title, content about: {user_input}"
-            completion = client.chat.completions.create(model="gpt-3.5-turbo", messages=[{"role": "user", "content": prompt}])
-            response = completion.choices[0].message.content
-            return json.loads(response)
+            slide_count = self._slide_count(request)
+            if self._outlined(request, slide_count):
+                with span('llm'):
+                    return generation.generate_outlined_deck(user_input, slide_count)
+            with span('llm'):
+                return generation.generate_deck(user_input, slide_count)
+
+    def _slide_count(self, request):
+        try:
+            slide_count = int(request.data.get('slides') or 5)
+        except (TypeError, ValueError):
+            raise ValidationError({'error': 'slides must be a number'})
+        if not 1 <= slide_count <= settings.ZLIDE_GENERATE_MAX_SLIDES:
+            raise ValidationError({'error': f'slides must be between 1 and {settings.ZLIDE_GENERATE_MAX_SLIDES}'})
+        return slide_count
 
+    def _is_document(self, request, text):
+        # Text with anything the "Slide" split below turns into a slide (a "Slide"
+        # then a colon on the same line) keeps that parse, only long text without
+        # any is a document to summarize
+        mode = request.data.get('mode')
+        if mode == 'document':
+            return True
+        return not mode and len(text) >= settings.ZLIDE_DOCUMENT_MIN_CHARS and not re.search(r'Slide[^:\n]*:', text)
+
+    def _concurrency(self, request):
+        # Completions the request runs at once, its admission slot weighs as much
+        text = request.data.get('text')
+        if not isinstance(text, str):
+            return 1
+        try:
+            if len(text) >= 50:
+                if self._is_document(request, text) and len(text) <= settings.ZLIDE_DOCUMENT_MAX_CHARS:
+                    return generation.document_concurrency(text)
+                return 1
+            slide_count = self._slide_count(request)
+        except ValidationError:
+            return 1
+        return generation.outline_concurrency(slide_count) if self._outlined(request, slide_count) else 1
+
+    def _outlined(self, request, slide_count):
+        # Long decks are outlined first and their slides written in parallel
+        mode = request.data.get('mode')
+        if mode in ('outline', 'single'):
+            return mode == 'outline'
+        return slide_count > settings.ZLIDE_GENERATE_SINGLE_CALL_MAX_SLIDES
+
+    def _stream_presentation(self, topic, slide_count):
+        """
+        Newline delimited JSON events: the outline, then each slide as soon as
+        it is written, then the whole deck in order.
+        """
+        def event(data):
+            return json.dumps(data) + '\n'
 
+        try:
+            titles = generation.generate_outline(topic, slide_count)
+            yield event({'event': 'outline', 'titles': titles})
+            slides = []
+            for slide in generation.expand_outline(topic, titles):
+                slides.append(slide)
+                yield event({'event': 'slide', 'slide': slide})
+            slides.sort(key=lambda slide: slide['slide'])
+            yield event({'event': 'done', 'message': 'Presentation created successfully.', 'slide_data': slides})
+        except Exception as e:
+            yield event({'event': 'error', 'error': str(e)})
 
     @extend_schema(
         operation_id="Generate Zlide Endpoint",
-        description="This endpoint does the actual slide generation",
+        description="This endpoint does the actual slide generation. Optional fields: slides (number of slides, 5 by default), mode (single for one completion, outline to outline the deck first and write its slides in parallel, the default above 5 slides, document to summarize long text into a deck, the default for text of 2000 characters or more without 'Slide ...:' markers) and stream (with outline, respond with newline delimited JSON events as each slide is written)",
         summary="This endpoint will generate a slide based on user input by making a call to the OpenAI API and then return the data in JSON format",
         request=OpenApiTypes.OBJECT,
         responses={200: PresentationDataSerializer},
     )
     def post(self, request):
+        try:
+            slot = admission.admit(request, weight=self._concurrency(request))
+        except admission.Overloaded as exc:
+            return overloaded(exc)
+        streaming = False
         try:
             user_input = request.data.get("user_input")
             input_text = request.data.get("input_text")
             request.data['user_input'] = user_input
+
+            text = request.data.get('text')
+            if str(request.data.get('stream', '')).lower() in ('1', 'true', 'yes') and text is not None and len(text) < 50:
+                slide_count = self._slide_count(request)
+                if self._outlined(request, slide_count):
+                    # The admission slot is held until the stream ends
+                    streaming = True
+                    return StreamingHttpResponse(slot.wrap(self._stream_presentation(text, slide_count)), content_type='application/x-ndjson')
+
             presentation_data = self._generate_presentation(input_text, request)
 
             # If not isinstance(presentation_data, dict):
@@ -111,8 +230,13 @@ class GenerateZlideView(APIView):
             # serializer = PresentationDataSerializer(presentation_data)
             # return Response({'message': 'Presentation data saved successfully.', 'presentation_id': presentation_data.id, 'slide_data':json.loads(serializer.data["json_data"])}, status=status.HTTP_201_CREATED)
             return Response({'message': 'Presentation created successfully.', 'slide_data':presentation_data}, status=status.HTTP_200_OK)
+        except ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            if not streaming:
+                slot.release()
 
 
 class SaveZlideView(APIView):
@@ -147,12 +271,166 @@ class SaveZlideView(APIView):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 
+class BulkSaveZlideView(APIView):
+    permission_classes = [AllowAny]
+
+    def _records(self, request):
+        """
+        Yield (line, record) for every record of the body, line being None for
+        a JSON array.
+        """
+        stream = request.stream
+        if stream is None:
+            return
+        if request.content_type.startswith(('application/x-ndjson', 'application/jsonl')):
+            yield from iter_ndjson(stream)
+        else:
+            for record in iter_json_array(stream):
+                yield None, record
+
+    def _validate(self, validator, record):
+        if isinstance(record, Exception):
+            raise ValidationError({'error': f'Invalid JSON: {record}'})
+        if not isinstance(record, dict):
+            raise ValidationError({'error': 'Each record must be an object with title and presentation_data'})
+        presentation_data = record.get('presentation_data', record.get('json_data'))
+        if isinstance(presentation_data, str):
+            try:
+                presentation_data = json.loads(presentation_data)
+            except ValueError as e:
+                raise ValidationError({'presentation_data': [f'Invalid JSON: {e}']})
+        return validator.run_validation({'title': record.get('title'), 'json_data': presentation_data})
+
+    def _write(self, batch):
+        with transaction.atomic():
+            created = PresentationData.objects.bulk_create(batch, batch_size=len(batch))
+            # bulk_create() skips post_save, so do what the signal receivers would have done
+            search.index_presentations(created)
+            history.record_versions((p.pk, p.version, p.title, p.json_data) for p in created)
+        for presentation in created:
+            deck_cache.invalidate_deck(presentation.title, presentation.pk, presentation.version)
+        return len(created)
+
+    @extend_schema(
+        operation_id='Bulk Save Zlides Endpoint',
+        description='This endpoint imports many slides at once. The body is either a JSON array or newline delimited JSON (Content-Type: application/x-ndjson) of objects with title and presentation_data. Invalid records are reported back by their position (starting at 1) without stopping the import, at most ZLIDE_BULK_MAX_ERRORS of them',
+        summary='This endpoint is used to save many slides to the database',
+        request=OpenApiTypes.OBJECT,
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def post(self, request):
+        batch_size = settings.ZLIDE_BULK_BATCH_SIZE
+        validator = PresentationDataSerializer()
+        batch, errors = [], []
+        created = failed = 0
+        try:
+            # Records are numbered from 1 in both formats, NDJSON errors also give their line
+            for number, (line, record) in enumerate(self._records(request), start=1):
+                try:
+                    batch.append(PresentationData(**self._validate(validator, record)))
+                except ValidationError as e:
+                    failed += 1
+                    if len(errors) < settings.ZLIDE_BULK_MAX_ERRORS:
+                        error = {'record': number, 'errors': e.detail}
+                        if line is not None:
+                            error['line'] = line
+                        errors.append(error)
+                    continue
+                if len(batch) >= batch_size:
+                    created += self._write(batch)
+                    batch = []
+            if batch:
+                created += self._write(batch)
+        except ValueError as e:
+            # The body itself is malformed, keep the records read before that point
+            if batch:
+                created += self._write(batch)
+            return Response({'error': f'Invalid request body: {e}', 'created': created, 'failed': failed, 'errors': errors, 'errors_truncated': failed - len(errors)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': str(e), 'created': created}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({'message': 'Presentations imported.', 'created': created, 'failed': failed, 'errors': errors, 'errors_truncated': failed - len(errors)}, status=status.HTTP_200_OK)
+
+
+class ImportZlideView(APIView):
+    permission_classes = [AllowAny]
+    parser_classes = [MultiPartParser]
+
+    @extend_schema(
+        operation_id='Import Zlide Endpoint',
+        description='This endpoint uploads a PowerPoint (.pptx) file as multipart form data with a file and an optional title. The file is imported into an editable slide in the background, poll the status endpoint for progress',
+        summary='This endpoint is used to import a PowerPoint file',
+        request=OpenApiTypes.OBJECT,
+        responses={202: OpenApiTypes.OBJECT},
+    )
+    def post(self, request):
+        max_size = settings.ZLIDE_IMPORT_MAX_SIZE
+        # Refuse oversized uploads before reading the body
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > max_size:
+            return Response({'error': f'The file is larger than {filesizeformat(max_size)}'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Missing required field: file'}, status=status.HTTP_400_BAD_REQUEST)
+        if upload.size > max_size:
+            return Response({'error': f'The file is larger than {filesizeformat(max_size)}'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if not zipfile.is_zipfile(upload):
+            return Response({'error': 'The file is not a .pptx presentation'}, status=status.HTTP_400_BAD_REQUEST)
+        upload.seek(0)
+
+        title = request.data.get('title') or os.path.splitext(os.path.basename(upload.name))[0] or 'title'
+        try:
+            job = imports.queue_import(upload, title)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({'message': 'Presentation import queued.', 'import_id': job.pk, 'status': job.status}, status=status.HTTP_202_ACCEPTED)
+
+
+class ImportZlideStatusView(APIView):
+    permission_classes = [AllowAny]
+
+    @extend_schema(
+        operation_id='Import Zlide Status Endpoint',
+        description='This endpoint reports the progress of a PowerPoint import and, once done, the id and title of the imported slide',
+        summary='This endpoint is used to check on a PowerPoint import',
+        request=OpenApiTypes.OBJECT,
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def get(self, request, pk):
+        job = PowerPointPresentation.objects.select_related('presentation').filter(pk=pk).first()
+        if job is None:
+            return Response({'error': 'No import found with the given id'}, status=status.HTTP_404_NOT_FOUND)
+        data = {
+            'import_id': job.pk,
+            'title': job.title,
+            'status': job.status,
+            'slides_done': job.slides_done,
+            'slide_count': job.slide_count,
+            'progress': round(job.slides_done / job.slide_count, 3) if job.slide_count else (1.0 if job.status == PowerPointPresentation.DONE else 0.0),
+            'error': job.error,
+        }
+        if job.presentation is not None:
+            data['presentation_id'] = job.presentation.pk
+            data['presentation_title'] = job.presentation.title
+        return Response(data, status=status.HTTP_200_OK)
+
+
 class GetZlideView(GenericAPIView):
     permission_classes = [AllowAny]
     queryset = PresentationData.objects.all()
     serializer_class = PresentationDataSerializer
     lookup_field = 'title' # Specifying the field to use for the lookup
 
+    def _load(self, title):
+        self.kwargs[self.lookup_field] = title
+        presentation_data = self.get_object()
+        serializer = self.get_serializer(presentation_data)
+        return presentation_data.pk, presentation_data.version, serializer.data
+
     @extend_schema(
         operation_id='Get Zlide Endpoint',
         description='This endpoint retrieves a slide based on the title specified by the user',
@@ -162,16 +440,18 @@ class GetZlideView(GenericAPIView):
     )
     def get(self, request, title):
         try:
-            self.kwargs[self.lookup_field] = title 
-            presentation_data = self.get_object()
-            serializer = self.get_serializer(presentation_data)
-            return Response(serializer.data)
+            entry = deck_cache.get_deck(title, lambda: self._load(title))
+            response = Response(entry['data'])
+            response['ETag'] = f'"{entry["version"]}"'
+            return response
         except NotFound:
             return Response({'error': 'No slide found with the given title'}, status=status.HTTP_404_NOT_FOUND)
 
 class DownloadZlideView(APIView):
     def _deserialize_json_data(self, serializer):
-        json_data = json.loads(serializer.data["json_data"])
+        json_data = serializer.data["json_data"]
+        if isinstance(json_data, str):
+            json_data = json.loads(json_data)
         if not isinstance(json_data, dict) or 'slides' not in json_data:
             raise ValueError("Invalid JSON data format: Expected dictionary with 'slides' key")
         return json_data
@@ -181,6 +461,10 @@ class DownloadZlideView(APIView):
         """
         Create a PPTX presentation from the slide data.
         """
+        from pptx import Presentation
+        from pptx.enum.text import MSO_AUTO_SIZE
+        from pptx.util import Pt
+
         prs = Presentation()
         for slide in slide_data:
             if not isinstance(slide, dict) or 'header' not in slide or 'content' not in slide:
@@ -198,11 +482,22 @@ class DownloadZlideView(APIView):
                 body_shape = shapes.placeholders[1]
                 tf = body_shape.text_frame
                 tf.text = slide["content"]
-                tf.fit_text(font_family="Calibri", max_size=18, bold=True)
-            # Output_filename = "output.pptx"
-            output_filename = title
-            prs.save(output_filename)
-            
+                try:
+                    tf.fit_text(font_family="Calibri", max_size=18, bold=True)
+                except OSError:
+                    # python-pptx can only find font files on macOS and Windows,
+                    # elsewhere let PowerPoint shrink the text when it opens the file
+                    tf.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE
+                    for paragraph in tf.paragraphs:
+                        paragraph.font.size = Pt(18)
+                        paragraph.font.bold = True
+        # Rendered into ZLIDE_EXPORT_DIR rather than the working directory, a file left
+        # behind by a failed download is removed by enforce_retention
+        os.makedirs(settings.ZLIDE_EXPORT_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=settings.ZLIDE_EXPORT_DIR, suffix='.pptx', delete=False) as output:
+            prs.save(output)
+        return output.name
+
 
     @extend_schema( 
         operation_id="Download Zlide Endpoint",
@@ -219,11 +514,15 @@ class DownloadZlideView(APIView):
             slide_data = json_data.get("slides", [])
             if not isinstance(slide_data, list) or not all(isinstance(slide, dict) for slide in slide_data):
                 raise ValueError("Invalid slide data format: Expected list of dictionaries")
-            output_filename = self._create_pptx_presentation(slide_data)
-            with open(output_filename, 'rb') as f:
-                response = HttpResponse(f.read(), content_type='application/vnd.openxmlformats-officedocument.presentationml.presentation')
-                response['Content-Disposition'] = 'attachment; filename="output.pptx"'
-                return response
+            with span('pptx'):
+                output_filename = self._create_pptx_presentation(slide_data)
+            output = open(output_filename, 'rb')
+            try:
+                # The open handle keeps the data readable, the name is gone as soon as it is sent
+                os.remove(output_filename)
+            except OSError:
+                pass
+            return FileResponse(output, as_attachment=True, filename='output.pptx', content_type='application/vnd.openxmlformats-officedocument.presentationml.presentation')
         except PresentationData.DoesNotExist:
             return Response({"error": "No presentation data found, are you sure you\'ve created it?"}, status=status.HTTP_404_NOT_FOUND)
         except ValueError as e:
@@ -232,6 +531,72 @@ class DownloadZlideView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 
+class ListZlideView(ListAPIView):
+    permission_classes = [AllowAny]
+    queryset = PresentationData.objects.all()
+    serializer_class = PresentationDataListSerializer
+    pagination_class = PresentationCursorPagination
+
+    def _get_fields(self):
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return PresentationDataListSerializer.default_fields
+        allowed = {field.name for field in PresentationData._meta.concrete_fields}
+        return tuple(field for field in fields.split(',') if field in allowed) or PresentationDataListSerializer.default_fields
+
+    def get_queryset(self):
+        # Only load the requested columns (plus the ones the cursor needs) so
+        # json_data is never read unless explicitly asked for
+        fields = self._get_fields()
+        return super().get_queryset().only(*set(fields) | {'id', 'created_at'})
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs['fields'] = self._get_fields()
+        return super().get_serializer(*args, **kwargs)
+
+    @extend_schema(
+        operation_id='List Zlides Endpoint',
+        description='This endpoint lists saved slides newest first using cursor pagination. Use ?limit= for the page size and ?fields=id,title,json_data to pick the returned fields (json_data is left out by default)',
+        summary='This endpoint will list the saved slides',
+        responses={200: PresentationDataListSerializer(many=True)},
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class SearchZlideView(APIView):
+    permission_classes = [AllowAny]
+
+    @extend_schema(
+        operation_id='Search Zlides Endpoint',
+        description='This endpoint searches the words in the title, slide titles and content of saved slides. Use ?q= for the search terms and ?limit= and ?offset= to paginate the ranked results',
+        summary='This endpoint will search the saved slides',
+        parameters=[
+            OpenApiParameter('q', OpenApiTypes.STR, description='Search terms'),
+            OpenApiParameter('limit', OpenApiTypes.INT, description='Number of results per page (max 100)'),
+            OpenApiParameter('offset', OpenApiTypes.INT, description='Number of results to skip'),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'The q parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({'error': 'limit and offset must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            results, has_more = search.search(query, limit=limit, offset=offset)
+            return Response({
+                'results': results,
+                'next_offset': offset + limit if has_more else None,
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class EditZlideView(GenericAPIView):
     permission_classes = [AllowAny]
     queryset = PresentationData.objects.all()
@@ -240,12 +605,14 @@ class EditZlideView(GenericAPIView):
 
     @extend_schema(
         operation_id='Edit Zlide Endpoint',
-        description='This endpoint updates the slide data items such as the title, content as specified by the user',
+        description='This endpoint updates the slide data items such as the title, content as specified by the user. Send the expected version in the If-Match header or in the version field to get a 412 instead of overwriting a newer edit',
         summary='This endpoint will edit a slide specified by the user',
         request=OpenApiTypes.OBJECT,
         responses={200: PresentationDataSerializer},
     )
     def patch(self, request, title):
+        version = request.data.get('version') if isinstance(request.data, dict) else None
+        expected_version = parse_version(request.headers.get('If-Match', version))
         try:
             # self.kwargs[self.lookup_field] = title # Setting the lookup field to the title specified by the user
             # presentation_data = self.get_object() # Using the inherited get_object method
@@ -287,8 +654,29 @@ class EditZlideView(GenericAPIView):
             serializer = self.get_serializer(presentation_data, data=request.data, partial=True)
 
             if serializer.is_valid():
-                serializer.save()
-                return Response({'message': 'Slide data updated successfully.', 'updated_slide': serializer.data}, status=status.HTTP_200_OK)
+                with transaction.atomic():
+                    # The row stays locked until the UPDATE, so the version written is the one this edit made
+                    current = PresentationData.objects.select_for_update().filter(pk=presentation_data.pk).values_list('version', flat=True).first()
+                    if current is None:
+                        raise NotFound()
+                    # Without a precondition the last edit wins, as before versions existed
+                    if expected_version is not None and current != expected_version:
+                        return Response({'error': 'Version mismatch, the slide has been modified', 'version': current}, status=status.HTTP_412_PRECONDITION_FAILED)
+                    PresentationData.objects.filter(pk=presentation_data.pk).update(**serializer.validated_data, version=current + 1)
+                for field, value in serializer.validated_data.items():
+                    setattr(presentation_data, field, value)
+                presentation_data.version = current + 1
+
+                # QuerySet.update() skips post_save, so do what its receivers would
+                search.index_presentations([presentation_data])
+                deck_cache.invalidate_deck(presentation_data.title, presentation_data.pk, presentation_data.version)
+                if presentation_data.title != title:
+                    deck_cache.forget_deck(title)
+                history.record_version(presentation_data)
+                serializer = self.get_serializer(presentation_data)
+                response = Response({'message': 'Slide data updated successfully.', 'updated_slide': serializer.data, 'version': presentation_data.version}, status=status.HTTP_200_OK)
+                response['ETag'] = f'"{presentation_data.version}"'
+                return response
             else:
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -332,6 +720,154 @@ class EditZlideView(GenericAPIView):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class PatchZlideView(GenericAPIView):
+    permission_classes = [AllowAny]
+    queryset = PresentationData.objects.all()
+    serializer_class = PresentationDataSerializer
+    parser_classes = [JSONPatchParser, JSONParser]
+    lookup_field = 'title' # Specifying the field to use for the lookup
+
+    @extend_schema(
+        operation_id='Patch Zlide Endpoint',
+        description='This endpoint applies RFC 6902 JSON Patch operations to the slide data. Send the expected version in the If-Match header or in the version field to get a 412 instead of patching a newer edit',
+        summary='This endpoint will apply a delta edit to a slide specified by the user',
+        request=OpenApiTypes.OBJECT,
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def patch(self, request, title):
+        if isinstance(request.data, list):
+            operations = request.data
+            expected_version = parse_version(request.headers.get('If-Match'))
+        else:
+            operations = request.data.get('patch')
+            expected_version = parse_version(request.headers.get('If-Match', request.data.get('version')))
+
+        try:
+            self.kwargs[self.lookup_field] = title
+            presentation_data = self.get_object()
+            with transaction.atomic():
+                # Patched and written under the row lock, so no edit lands in between
+                presentation_data = PresentationData.objects.select_for_update().filter(pk=presentation_data.pk).first()
+                if presentation_data is None:
+                    raise NotFound()
+                # Without a precondition the patch applies to the current version
+                if expected_version is not None and presentation_data.version != expected_version:
+                    return Response({'error': 'Version mismatch, the slide has been modified', 'version': presentation_data.version}, status=status.HTTP_412_PRECONDITION_FAILED)
+
+                json_data = presentation_data.json_data
+                if isinstance(json_data, str):
+                    json_data = json.loads(json_data)
+                patched_data = apply_json_patch(json_data, operations)
+                new_version = presentation_data.version + 1
+                PresentationData.objects.filter(pk=presentation_data.pk).update(json_data=patched_data, version=new_version)
+
+            # QuerySet.update() skips post_save, so keep the search index in sync here
+            search.index_rows([(presentation_data.pk, presentation_data.title, patched_data)])
+            deck_cache.invalidate_deck(presentation_data.title, presentation_data.pk, new_version)
+            history.record_version(presentation_data, json_data=patched_data, version=new_version)
+            response = Response({'message': 'Slide data patched successfully.', 'version': new_version}, status=status.HTTP_200_OK)
+            response['ETag'] = f'"{new_version}"'
+            return response
+        except NotFound:
+            return Response({'error': f'{title} not found'}, status=status.HTTP_404_NOT_FOUND)
+        except JSONPatchTestFailed as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except JSONPatchError as e:
+            return Response({'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class RegenerateSlideView(GenericAPIView):
+    permission_classes = [AllowAny]
+    queryset = PresentationData.objects.all()
+    serializer_class = PresentationDataSerializer
+    lookup_field = 'title' # Specifying the field to use for the lookup
+
+    def _slides(self, json_data):
+        if isinstance(json_data, str):
+            json_data = json.loads(json_data)
+        if isinstance(json_data, dict):
+            json_data = json_data.get('slides')
+        return json_data if isinstance(json_data, list) and json_data else None
+
+    def _replace_slide(self, json_data, index, slide):
+        if isinstance(json_data, str):
+            json_data = json.loads(json_data)
+        if isinstance(json_data, dict):
+            slides = list(json_data['slides'])
+            slides[index] = slide
+            return dict(json_data, slides=slides)
+        slides = list(json_data)
+        slides[index] = slide
+        return slides
+
+    @extend_schema(
+        operation_id='Regenerate Slide Endpoint',
+        description='This endpoint rewrites one slide of a saved presentation with the LLM, using the titles of its neighbours as context, and saves only that slide. Send the position of the slide (starting at 1) in the slide field and optionally instructions. The expected version can be sent in the If-Match header or in the version field',
+        summary='This endpoint will regenerate a single slide specified by the user',
+        request=OpenApiTypes.OBJECT,
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def post(self, request, title):
+        try:
+            position = int(request.data.get('slide'))
+        except (TypeError, ValueError):
+            return Response({'error': 'slide must be the position of the slide, starting at 1'}, status=status.HTTP_400_BAD_REQUEST)
+        expected_version = parse_version(request.headers.get('If-Match', request.data.get('version')))
+        instructions = request.data.get('instructions')
+
+        try:
+            self.kwargs[self.lookup_field] = title
+            presentation_data = self.get_object()
+        except (NotFound, Http404):
+            return Response({'error': f'{title} not found'}, status=status.HTTP_404_NOT_FOUND)
+        if expected_version is not None and presentation_data.version != expected_version:
+            return Response({'error': 'Version mismatch, the slide has been modified', 'version': presentation_data.version}, status=status.HTTP_412_PRECONDITION_FAILED)
+        slides = self._slides(presentation_data.json_data)
+        if slides is None:
+            return Response({'error': 'The presentation has no slides to regenerate'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if not 1 <= position <= len(slides):
+            return Response({'error': f'slide must be between 1 and {len(slides)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            slot = admission.admit(request)
+        except admission.Overloaded as exc:
+            return overloaded(exc)
+        try:
+            original = slides[position - 1]
+            with span('llm'):
+                slide = generation.regenerate_slide(presentation_data.title, slides, position - 1, instructions)
+
+            # Edits made to other slides during the completion are kept, only
+            # this slide is written back
+            for _ in range(3):
+                version = presentation_data.version
+                json_data = self._replace_slide(presentation_data.json_data, position - 1, slide)
+                updated = PresentationData.objects.filter(pk=presentation_data.pk, version=version).update(json_data=json_data, version=F('version') + 1)
+                if updated:
+                    break
+                presentation_data = PresentationData.objects.filter(pk=presentation_data.pk).first()
+                current = self._slides(presentation_data.json_data) if presentation_data is not None else None
+                if current is None or len(current) != len(slides) or current[position - 1] != original:
+                    return Response({'error': 'The slide was modified while it was being regenerated'}, status=status.HTTP_409_CONFLICT)
+            else:
+                return Response({'error': 'The slide was modified while it was being regenerated'}, status=status.HTTP_409_CONFLICT)
+
+            # QuerySet.update() skips post_save, so keep the search index in sync here
+            search.index_rows([(presentation_data.pk, presentation_data.title, json_data)])
+            new_version = version + 1
+            deck_cache.invalidate_deck(presentation_data.title, presentation_data.pk, new_version)
+            history.record_version(presentation_data, json_data=json_data, version=new_version)
+            response = Response({'message': 'Slide regenerated successfully.', 'slide': position, 'slide_data': slide, 'version': new_version}, status=status.HTTP_200_OK)
+            response['ETag'] = f'"{new_version}"'
+            return response
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            slot.release()
+
+
 class DeleteZlideView(APIView):
     permission_classes = [AllowAny]
     queryset = PresentationData.objects.all()
@@ -350,10 +886,150 @@ class DeleteZlideView(APIView):
             if not title:
                 return Response({'error': 'Title is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-            presentation_data = PresentationData.objects.get(title=title)
-            presentation_data.delete()
+            # Soft delete, the rows are removed later by `manage.py purge_deleted_zlides`
+            if not PresentationData.objects.filter(title=title).soft_delete():
+                raise PresentationData.DoesNotExist
+            deck_cache.forget_deck(title)
             return Response({'message': f'{title} deleted successfully.'}, status=status.HTTP_200_OK)
         except PresentationData.DoesNotExist:
             return Response({'error': 'No presentation found with the given title'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class BulkDeleteZlideView(APIView):
+    permission_classes = [AllowAny]
+
+    def _filter(self, data):
+        filters = {}
+        if data.get('ids'):
+            filters['pk__in'] = data['ids']
+        if data.get('titles'):
+            filters['title__in'] = data['titles']
+        if data.get('created_before'):
+            filters['created_at__lt'] = data['created_before']
+        if data.get('created_after'):
+            filters['created_at__gt'] = data['created_after']
+        return filters
+
+    @extend_schema(
+        operation_id='Bulk Delete Zlides Endpoint',
+        description='This endpoint deletes every slide matching all of the given filters (ids, titles, created_before, created_after) in one go',
+        summary='This endpoint will delete many slides at once',
+        request=OpenApiTypes.OBJECT,
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def post(self, request):
+        # A plain string would become title__in='abc' and match one character titles
+        serializer = BulkDeleteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        filters = self._filter(serializer.validated_data)
+        if not filters:
+            return Response({'error': 'At least one of ids, titles, created_before or created_after is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            queryset = PresentationData.objects.filter(**filters)
+            titles = set(queryset.values_list('title', flat=True))
+            deleted = queryset.soft_delete()
+            for title in titles:
+                deck_cache.forget_deck(title)
+            return Response({'message': f'{deleted} presentations deleted successfully.', 'deleted': deleted}, status=status.HTTP_200_OK)
+        except (ValueError, DjangoValidationError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ZlideVersionsView(GenericAPIView):
+    permission_classes = [AllowAny]
+    queryset = PresentationData.objects.all()
+    lookup_field = 'title' # Specifying the field to use for the lookup
+
+    @extend_schema(
+        operation_id='List Zlide Versions Endpoint',
+        description='This endpoint lists the saved versions of a slide, newest first',
+        summary='This endpoint will list the version history of a slide',
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def get(self, request, title):
+        try:
+            self.kwargs[self.lookup_field] = title
+            presentation_data = self.get_object()
+            versions = [
+                {'version': v.version, 'title': v.title, 'slide_count': len(v.slides), 'created_at': v.created_at}
+                for v in presentation_data.versions.all()
+            ]
+            return Response({'current_version': presentation_data.version, 'versions': versions}, status=status.HTTP_200_OK)
+        except NotFound:
+            return Response({'error': f'{title} not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class ZlideVersionDiffView(GenericAPIView):
+    permission_classes = [AllowAny]
+    queryset = PresentationData.objects.all()
+    lookup_field = 'title' # Specifying the field to use for the lookup
+
+    @extend_schema(
+        operation_id='Diff Zlide Versions Endpoint',
+        description='This endpoint compares two versions of a slide given as ?from= and ?to= (defaults to the current version) and returns the slides that changed',
+        summary='This endpoint will diff two versions of a slide',
+        parameters=[
+            OpenApiParameter('from', OpenApiTypes.INT, description='Version to compare from'),
+            OpenApiParameter('to', OpenApiTypes.INT, description='Version to compare to, defaults to the current version'),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def get(self, request, title):
+        try:
+            self.kwargs[self.lookup_field] = title
+            presentation_data = self.get_object()
+            from_version = int(request.query_params['from'])
+            to_version = int(request.query_params.get('to', presentation_data.version))
+            old = presentation_data.versions.get(version=from_version)
+            new = presentation_data.versions.get(version=to_version)
+            return Response(history.diff_versions(old, new), status=status.HTTP_200_OK)
+        except (KeyError, ValueError):
+            return Response({'error': 'from (and optionally to) must be version numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        except NotFound:
+            return Response({'error': f'{title} not found'}, status=status.HTTP_404_NOT_FOUND)
+        except PresentationVersion.DoesNotExist:
+            return Response({'error': 'Version not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class RestoreZlideView(GenericAPIView):
+    permission_classes = [AllowAny]
+    queryset = PresentationData.objects.all()
+    lookup_field = 'title' # Specifying the field to use for the lookup
+
+    @extend_schema(
+        operation_id='Restore Zlide Version Endpoint',
+        description='This endpoint restores an earlier version of a slide. The restored content is saved as a new version, so the restore itself can be undone',
+        summary='This endpoint will restore a previous version of a slide',
+        request=OpenApiTypes.OBJECT,
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def post(self, request, title):
+        try:
+            self.kwargs[self.lookup_field] = title
+            presentation_data = self.get_object()
+            old = presentation_data.versions.get(version=int(request.data.get('version')))
+            json_data = history.materialize(old)
+
+            current_version = presentation_data.version
+            updated = PresentationData.objects.filter(pk=presentation_data.pk, version=current_version).update(json_data=json_data, version=F('version') + 1)
+            if not updated:
+                return Response({'error': 'Version mismatch, the slide has been modified'}, status=status.HTTP_412_PRECONDITION_FAILED)
+
+            new_version = current_version + 1
+            search.index_rows([(presentation_data.pk, presentation_data.title, json_data)])
+            deck_cache.invalidate_deck(presentation_data.title, presentation_data.pk, new_version)
+            history.record_version(presentation_data, json_data=json_data, version=new_version)
+            return Response({'message': f'Version {old.version} restored successfully.', 'version': new_version}, status=status.HTTP_200_OK)
+        except (TypeError, ValueError):
+            return Response({'error': 'version must be a version number'}, status=status.HTTP_400_BAD_REQUEST)
+        except (NotFound, Http404):
+            return Response({'error': f'{title} not found'}, status=status.HTTP_404_NOT_FOUND)
+        except PresentationVersion.DoesNotExist:
+            return Response({'error': 'Version not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)